@@ -9,6 +9,7 @@ from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from urllib.parse import parse_qs
+from core.scope import UserScope
 
 User = get_user_model()
 
@@ -22,6 +23,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if not self.user or self.user.is_anonymous:
             await self.close()
             return
+        if not await self.can_access_room(self.user, self.room_id):
+            await self.close()
+            return
 
         # Join room group
         await self.channel_layer.group_add(
@@ -68,6 +72,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'message_id': event['message_id'],
         }))
 
+    @database_sync_to_async
+    def can_access_room(self, user, room_id):
+        # Same visibility as ChatRoomViewSet.get_queryset
+        if not str(room_id).isdigit():
+            return False
+        if user.role in [User.UserRole.SUPER_ADMIN, User.UserRole.SCHOOL_ADMIN, User.UserRole.PRINCIPAL]:
+            return True
+        if user.role == User.UserRole.SECRETARY:
+            return ChatRoom.objects.filter(
+                id=room_id, participants__user__school=user.school
+            ).exclude(participants__user__role=User.UserRole.SUPER_ADMIN).exists()
+        return int(room_id) in UserScope.for_user(user).room_ids
+
     @database_sync_to_async
     def save_message(self, room_id, user, content):
         room = ChatRoom.objects.get(id=room_id)
@@ -80,11 +97,16 @@ class ChatConsumer(AsyncWebsocketConsumer):
         token = params.get('token', [None])[0]
         if not token:
             return AnonymousUser()
+        return await self.get_user_from_token(token)
+
+    @database_sync_to_async
+    def get_user_from_token(self, token):
+        # Token validation loads the user from the database, so it must run off the event loop
         try:
             UntypedToken(token)
-            from rest_framework_simplejwt.authentication import JWTAuthentication
-            validated_token = JWTAuthentication().get_validated_token(token)
-            user = JWTAuthentication().get_user(validated_token)
+            from users.authentication import StatefulJWTAuthentication
+            validated_token = StatefulJWTAuthentication().get_validated_token(token)
+            user = StatefulJWTAuthentication().get_user(validated_token)
             return user
         except (InvalidToken, TokenError, Exception):
             return AnonymousUser() 
\ No newline at end of file
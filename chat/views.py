@@ -15,6 +15,7 @@ from classes.models import Class
 from django.utils import timezone
 from notifications.models import Notification as NotificationModel, Announcement
 from rest_framework.exceptions import PermissionDenied
+from core.scope import UserScope
 from django.http import HttpResponse, Http404
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
@@ -41,27 +42,8 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
                 participants__user__role__in=[user.UserRole.SECRETARY, user.UserRole.SCHOOL_ADMIN, user.UserRole.TEACHER, user.UserRole.STUDENT, user.UserRole.PARENT, user.UserRole.ACCOUNTANT, user.UserRole.LIBRARIAN, user.UserRole.NURSE, user.UserRole.SECURITY],
                 participants__user__school=user.school
             ).exclude(participants__user__role=user.UserRole.SUPER_ADMIN).distinct()
-        elif user.role == user.UserRole.TEACHER:
-            try:
-                teacher = user.teacher_profile
-                return qs.filter(
-                    Q(participants__user=user) |
-                    Q(room_type='class', class_obj__subjects__teacher=teacher) |
-                    Q(room_type='teacher_student', teacher=teacher)
-                ).distinct()
-            except:
-                return qs.filter(participants__user=user)
-        elif user.role == user.UserRole.STUDENT:
-            try:
-                student = user.student_profile
-                return qs.filter(
-                    Q(participants__user=user) |
-                    Q(room_type='class', class_obj=student.current_class) |
-                    Q(room_type='teacher_student', student=student)
-                ).distinct()
-            except:
-                return qs.filter(participants__user=user)
-        return qs.filter(participants__user=user)
+        # Everyone else: rooms they participate in, plus class rooms for teachers and students
+        return qs.filter(id__in=UserScope.for_user(user).room_ids)
     
     def perform_create(self, serializer):
         user = self.request.user
@@ -116,9 +98,8 @@ class MessageViewSet(viewsets.ModelViewSet):
         if user.role in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL]:
             return queryset
         else:
-            # Users can only see messages from rooms they're part of
-            room_ids = user.chat_participations.values_list('room_id', flat=True)
-            return queryset.filter(room_id__in=room_ids)
+            # Users can only see messages from rooms visible to them
+            return queryset.filter(room_id__in=UserScope.for_user(user).room_ids)
     
     def perform_create(self, serializer):
         """Set the sender when creating a message and mark as unread for all recipients except sender"""
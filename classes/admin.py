@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Class, Subject, ClassSubject, ClassSchedule, Attendance, Assignment, AssignmentSubmission
+from .models import Class, Subject, ClassSubject, ClassSchedule, Attendance, AttendanceFlag, Assignment, AssignmentSubmission
 
 @admin.register(Class)
 class ClassAdmin(admin.ModelAdmin):
@@ -33,6 +33,13 @@ class AttendanceAdmin(admin.ModelAdmin):
     search_fields = ['student__user__first_name', 'student__user__last_name', 'class_obj__name']
     date_hierarchy = 'date'
 
+@admin.register(AttendanceFlag)
+class AttendanceFlagAdmin(admin.ModelAdmin):
+    list_display = ['student', 'class_obj', 'flag_type', 'value', 'run_date']
+    list_filter = ['flag_type', 'run_date', 'school']
+    search_fields = ['student__user__first_name', 'student__user__last_name', 'class_obj__name']
+    date_hierarchy = 'run_date'
+
 @admin.register(Assignment)
 class AssignmentAdmin(admin.ModelAdmin):
     list_display = ['title', 'class_obj', 'subject', 'teacher', 'due_date', 'total_marks', 'is_active']
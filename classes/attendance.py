@@ -0,0 +1,305 @@
+"""
+Bulk attendance marking and offline sync.
+
+A roll call is validated and written in a fixed number of queries whatever
+the class size: one read that checks every submitted student belongs to the
+class and fetches any attendance already recorded for the day, then, if
+anything changed, a lock on the class row, a re-read of the rows to write and
+one upsert (``bulk_create(update_conflicts=True)``) on the (student, class,
+date) unique key. The lock serializes concurrent roll calls of a class, so
+each row is counted as created once. Rows that already hold the submitted
+values are not written again, so a retried request reports them as
+``unchanged`` and leaves the data as it was.
+The attendance rollups for the day and the changed students are refreshed in
+the same transaction.
+
+sync_attendance serves clients that mark attendance offline. A client sends
+the mutations it made since its last sync, each stamped with the client time
+it was made, plus the sync token from its previous response. The batch is
+applied in one transaction, resolving conflicts on (student, class, date) by
+last writer wins on ``changed_at``. The response carries the server's changes
+since the token and a new token. Mutations and changes travel as short arrays,
+``[student_id, "YYYY-MM-DD", status code, epoch milliseconds, remarks]``, to keep
+payloads small on poor connections. Writers of a class are serialized on the
+class row, so the changed_at comparison also holds for marks that had no row
+yet. Only marks are synced: deleting an attendance row on the server is not
+sent to clients, and a client cannot delete one.
+"""
+
+import datetime
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from core.dashboard import invalidate_tiles
+from schools.stats import PRESENT_STATUSES, apply_deltas
+from .attendance_stats import refresh_attendance_rollups
+from .models import Attendance
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+ERROR = 'error'
+
+SYNC_STATUS_CODES = {'p': 'present', 'a': 'absent', 'l': 'late', 'e': 'excused'}
+SYNC_CODES = {status: code for code, status in SYNC_STATUS_CODES.items()}
+# Changes committed slightly out of updated_at order are re-sent rather than missed
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+# A client without a token receives this much history
+SYNC_INITIAL_DAYS = 30
+
+
+def parse_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def bulk_mark_attendance(class_id, date, records, marked_by):
+    """
+    Create or update one attendance row per record for a class and date.
+
+    ``records`` is a list of ``{'student_id', 'status', 'remarks'}`` dicts.
+    Returns one result dict per record, in order, with the outcome for that row.
+    """
+    from students.models import Student
+
+    results = []
+    valid = {}
+    for record in records:
+        student_id = record.get('student_id')
+        attendance_status = record.get('status')
+        result = {'student_id': student_id, 'result': ERROR}
+        results.append(result)
+        try:
+            student_id = int(student_id)
+        except (TypeError, ValueError):
+            result['error'] = 'Invalid student id.'
+            continue
+        if attendance_status not in Attendance.Status.values:
+            result['error'] = f'Invalid status "{attendance_status}".'
+        elif student_id in valid:
+            result['error'] = 'Duplicate entry for this student.'
+        else:
+            valid[student_id] = (result, attendance_status, record.get('remarks') or '')
+
+    # One query: class membership plus the attendance already recorded for the day
+    existing = Attendance.objects.filter(student_id=OuterRef('pk'), class_obj_id=class_id, date=date)
+    members = {
+        row['id']: row for row in Student.objects.filter(current_class_id=class_id, id__in=list(valid)).values(
+            'id', 'current_class__school_id',
+            existing_status=Subquery(existing.values('status')[:1]),
+            existing_remarks=Subquery(existing.values('remarks')[:1]),
+        ).order_by()
+    }
+
+    pending = {}
+    for student_id, (result, attendance_status, remarks) in valid.items():
+        member = members.get(student_id)
+        if member is None:
+            result['error'] = 'Student is not enrolled in this class.'
+            continue
+        if member['existing_status'] == attendance_status and member['existing_remarks'] == remarks:
+            result['result'] = UNCHANGED
+            continue
+        pending[student_id] = (result, attendance_status, remarks)
+    if not pending:
+        return results
+
+    rows = []
+    changes = []
+    now = timezone.now()
+    school_id = members[next(iter(pending))]['current_class__school_id']
+    with transaction.atomic():
+        lock_roll_call(class_id)
+        # Re-read under the lock: a concurrent roll call may have written some of these rows since the first read
+        current = {
+            student_id: (old_status, old_remarks)
+            for student_id, old_status, old_remarks in Attendance.objects.filter(
+                class_obj_id=class_id, date=date, student_id__in=list(pending),
+            ).values_list('student_id', 'status', 'remarks')
+        }
+        for student_id, (result, attendance_status, remarks) in pending.items():
+            old_status, old_remarks = current.get(student_id, (None, None))
+            if (old_status, old_remarks) == (attendance_status, remarks):
+                result['result'] = UNCHANGED
+                continue
+            result['result'] = CREATED if old_status is None else UPDATED
+            rows.append(Attendance(
+                student_id=student_id, class_obj_id=class_id, date=date,
+                status=attendance_status, remarks=remarks, marked_by=marked_by, changed_at=now,
+            ))
+            changes.append((old_status, attendance_status))
+        if rows:
+            _upsert(rows)
+            _record_writes(class_id, school_id, rows, changes)
+
+    return results
+
+
+def lock_roll_call(class_id):
+    """
+    Lock the class row for the rest of the transaction, serializing roll-call
+    writers of the class. Locking attendance rows is not enough: rows not
+    written yet cannot be locked, so two writers would both see them missing.
+    """
+    from .models import Class
+    list(Class.objects.select_for_update().filter(pk=class_id).values_list('pk', flat=True))
+
+
+def _upsert(rows):
+    Attendance.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['student', 'class_obj', 'date'],
+        update_fields=['status', 'remarks', 'marked_by', 'changed_at', 'updated_at'],
+    )
+
+
+def _record_writes(class_id, school_id, rows, changes):
+    """Keep rollups, school stats and the dashboard current; bulk_create skips the signals that would"""
+    refresh_attendance_rollups(class_id, {row.date for row in rows}, [row.student_id for row in rows])
+    apply_deltas(school_id, {
+        'attendance_total': sum(1 for old, _ in changes if old is None),
+        'attendance_present': sum((new in PRESENT_STATUSES) - (old in PRESENT_STATUSES) for old, new in changes),
+    })
+    transaction.on_commit(lambda: invalidate_tiles(['student_stats'], school_id))
+
+
+def encode_sync_token(moment):
+    return format(int(moment.timestamp() * 1000000), 'x')
+
+
+def decode_sync_token(token):
+    """Return the time a sync token stands for, or None if it is malformed"""
+    try:
+        return datetime.datetime.fromtimestamp(int(token, 16) / 1000000, tz=datetime.timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def _to_millis(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def _parse_mutation(change, now):
+    """Return (student_id, date, status, remarks, changed_at) or raise ValueError"""
+    if not isinstance(change, (list, tuple)) or len(change) < 4:
+        raise ValueError('Expected [student_id, date, status, timestamp, remarks]')
+    student_id, day, code, millis = change[:4]
+    remarks = change[4] if len(change) > 4 and change[4] else ''
+    day = parse_date(day)
+    if day is None:
+        raise ValueError('Invalid date')
+    attendance_status = SYNC_STATUS_CODES.get(code, code)
+    if attendance_status not in Attendance.Status.values:
+        raise ValueError(f'Invalid status "{code}"')
+    try:
+        changed_at = datetime.datetime.fromtimestamp(int(millis) / 1000, tz=datetime.timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError('Invalid timestamp')
+    # A client clock running ahead must not make its marks win forever
+    return int(student_id), day, attendance_status, str(remarks), min(changed_at, now)
+
+
+def sync_attendance(class_id, mutations, token, marked_by):
+    """
+    Apply offline attendance mutations for a class and return the server's changes.
+
+    Returns a dict with the new ``token``, the number of mutations ``applied``,
+    the indexes of ``superseded`` mutations (a newer mark already won), the
+    ``rejected`` ones as ``[index, reason]`` and the server ``changes`` since
+    ``token``, which include the winning row for every superseded mutation.
+    Raises ValueError for a malformed token.
+    """
+    from students.models import Student
+
+    since = None
+    if token:
+        since = decode_sync_token(token)
+        if since is None:
+            raise ValueError('Invalid sync token')
+
+    now = timezone.now()
+    pending, superseded, rejected = {}, [], []
+    for index, change in enumerate(mutations):
+        try:
+            student_id, day, attendance_status, remarks, changed_at = _parse_mutation(change, now)
+        except (TypeError, ValueError) as error:
+            rejected.append([index, str(error)])
+            continue
+        key = (student_id, day)
+        # Within a batch the latest client timestamp wins as well
+        if key in pending and pending[key][3] >= changed_at:
+            superseded.append(index)
+            continue
+        if key in pending:
+            superseded.append(pending[key][0])
+        pending[key] = (index, attendance_status, remarks, changed_at)
+
+    rows, changes, winners = [], [], {}
+    with transaction.atomic():
+        members = {}
+        if pending:
+            # A (student, date) without a row has nothing to lock, so serialize on the class instead:
+            # a concurrent sync that inserts it commits first and its changed_at is compared below
+            lock_roll_call(class_id)
+            members = dict(Student.objects.filter(
+                current_class_id=class_id, id__in={student_id for student_id, _ in pending},
+            ).values_list('id', 'current_class__school_id').order_by())
+        existing = {
+            (row.student_id, row.date): row
+            for row in Attendance.objects.select_for_update().filter(
+                class_obj_id=class_id, student_id__in=list(members), date__in={day for _, day in pending},
+            )
+        } if members else {}
+
+        for key, (index, attendance_status, remarks, changed_at) in pending.items():
+            if key[0] not in members:
+                rejected.append([index, 'Student is not enrolled in this class'])
+                continue
+            current = existing.get(key)
+            if current is not None and current.changed_at >= changed_at:
+                superseded.append(index)
+                winners[key] = current
+                continue
+            rows.append(Attendance(
+                student_id=key[0], class_obj_id=class_id, date=key[1], status=attendance_status,
+                remarks=remarks, marked_by=marked_by, changed_at=changed_at,
+            ))
+            changes.append((current.status if current else None, attendance_status))
+
+        if rows:
+            _upsert(rows)
+            _record_writes(class_id, members[rows[0].student_id], rows, changes)
+
+        # The client already holds what it just sent, so those rows are not echoed back
+        written = {(row.student_id, row.date) for row in rows}
+        new_token = timezone.now()
+        server = Attendance.objects.filter(class_obj_id=class_id)
+        if since is None:
+            server = server.filter(date__gte=timezone.localdate() - datetime.timedelta(days=SYNC_INITIAL_DAYS))
+        else:
+            server = server.filter(updated_at__gt=since - SYNC_OVERLAP)
+        server_changes = {}
+        for row in server.order_by('updated_at', 'id'):
+            key = (row.student_id, row.date)
+            if key not in written:
+                server_changes[key] = row
+        for key, row in winners.items():
+            server_changes.setdefault(key, row)
+
+    return {
+        'token': encode_sync_token(new_token),
+        'applied': len(rows),
+        'superseded': sorted(superseded),
+        'rejected': sorted(rejected),
+        'changes': [
+            [row.student_id, row.date.isoformat(), SYNC_CODES[row.status], _to_millis(row.changed_at), row.remarks]
+            for row in server_changes.values()
+        ],
+    }
@@ -0,0 +1,169 @@
+"""
+Nightly attendance pattern analysis.
+
+A school's attendance over the lookback period is loaded once into NumPy
+arrays of shape (students, school days), where a school day is any date with at
+least one attendance record. All metrics are then computed for every student
+at once with array operations instead of per-student queries:
+
+* rolling absence rate over the last ROLLING_WINDOW school days,
+* the share of each weekday a student missed, to spot absences concentrated on
+  one day of the week,
+* the current run of consecutive missed school days.
+
+Students crossing a threshold get an AttendanceFlag row for the run date.
+Re-running for the same date replaces that school's flags.
+"""
+
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .attendance_stats import MISSED_STATUSES
+from .models import Attendance, AttendanceFlag
+
+LOOKBACK_DAYS = 120
+ROLLING_WINDOW = 20  # school days
+ROLLING_ABSENCE_THRESHOLD = 0.2
+CONSECUTIVE_ABSENCE_THRESHOLD = 3  # school days
+WEEKDAY_MIN_ABSENCES = 3
+WEEKDAY_RATE_THRESHOLD = 0.5
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def load_attendance_matrix(school_id, start, end):
+    """
+    Return (student_ids, days, missed, recorded) for a school's attendance.
+
+    ``missed`` and ``recorded`` are boolean arrays of shape (students, days);
+    a cell is recorded when the student has an attendance row for that day.
+    """
+    import numpy as np
+
+    rows = Attendance.objects.filter(
+        class_obj__school_id=school_id, date__range=[start, end],
+    ).values_list('student_id', 'date', 'status').order_by().iterator(chunk_size=20000)
+    student_column, day_column, missed_column = [], [], []
+    for student_id, day, status in rows:
+        student_column.append(student_id)
+        day_column.append(day.toordinal())
+        missed_column.append(status in MISSED_STATUSES)
+
+    student_ids, student_index = np.unique(np.array(student_column, dtype=np.int64), return_inverse=True)
+    ordinals, day_index = np.unique(np.array(day_column, dtype=np.int64), return_inverse=True)
+    missed = np.zeros((len(student_ids), len(ordinals)), dtype=bool)
+    recorded = np.zeros_like(missed)
+    recorded[student_index, day_index] = True
+    missed[student_index, day_index] = np.array(missed_column, dtype=bool)
+    days = [datetime.date.fromordinal(int(ordinal)) for ordinal in ordinals]
+    return student_ids, days, missed, recorded
+
+
+def rolling_absence_rate(missed, recorded, window):
+    """Share of recorded days missed over the trailing ``window`` days, for every day"""
+    import numpy as np
+
+    def trailing_sum(values):
+        totals = np.cumsum(values, axis=1, dtype=np.int32)
+        totals[:, window:] = totals[:, window:] - totals[:, :-window]
+        return totals
+
+    missed_days, recorded_days = trailing_sum(missed), trailing_sum(recorded)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(recorded_days > 0, missed_days / recorded_days, 0.0)
+
+
+def weekday_absence_rates(missed, recorded, days):
+    """(missed per weekday, share of recorded days missed per weekday), each of shape (students, 7)"""
+    import numpy as np
+
+    weekdays = np.zeros((len(days), 7), dtype=np.int32)
+    weekdays[np.arange(len(days)), [day.weekday() for day in days]] = 1
+    missed_by_weekday = missed.astype(np.int32) @ weekdays
+    recorded_by_weekday = recorded.astype(np.int32) @ weekdays
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(recorded_by_weekday > 0, missed_by_weekday / recorded_by_weekday, 0.0)
+    return missed_by_weekday, rates
+
+
+def current_missed_streak(missed, recorded):
+    """Consecutive recorded days missed up to each student's latest recorded day"""
+    import numpy as np
+
+    # Days without a record for the student neither extend nor break the run
+    positions = np.arange(missed.shape[1])
+    breaks = np.where(recorded & ~missed, positions, -1)
+    last_break = np.maximum.accumulate(breaks, axis=1)[:, -1]
+    missed_since = np.cumsum(missed, axis=1, dtype=np.int32)
+    rows = np.arange(missed.shape[0])
+    return missed_since[:, -1] - np.where(last_break >= 0, missed_since[rows, np.maximum(last_break, 0)], 0)
+
+
+def analyze_school_attendance(school_id, run_date=None, lookback_days=LOOKBACK_DAYS):
+    """Flag students of a school from their recent attendance; returns the number of flags written"""
+    import numpy as np
+    from students.models import Student
+
+    run_date = run_date or timezone.localdate()
+    student_ids, days, missed, recorded = load_attendance_matrix(
+        school_id, run_date - datetime.timedelta(days=lookback_days), run_date,
+    )
+    flags = []
+    if len(student_ids):
+        window = min(ROLLING_WINDOW, len(days))
+        rolling = rolling_absence_rate(missed, recorded, window)[:, -1]
+        window_recorded = recorded[:, -window:].sum(axis=1)
+        missed_by_weekday, weekday_rates = weekday_absence_rates(missed, recorded, days)
+        overall = missed.sum(axis=1) / np.maximum(recorded.sum(axis=1), 1)
+        worst_weekday = weekday_rates.argmax(axis=1)
+        rows = np.arange(len(student_ids))
+        worst_rate = weekday_rates[rows, worst_weekday]
+        streaks = current_missed_streak(missed, recorded)
+
+        candidates = [
+            (
+                AttendanceFlag.FlagType.ROLLING_ABSENCE,
+                # Need at least half a full window of history before judging a rate
+                (rolling >= ROLLING_ABSENCE_THRESHOLD) & (window_recorded >= ROLLING_WINDOW // 2),
+                rolling,
+                lambda i: {'window_days': int(window), 'recorded_days': int(window_recorded[i])},
+            ),
+            (
+                AttendanceFlag.FlagType.WEEKDAY_PATTERN,
+                (missed_by_weekday[rows, worst_weekday] >= WEEKDAY_MIN_ABSENCES)
+                & (worst_rate >= WEEKDAY_RATE_THRESHOLD)
+                & (worst_rate >= 2 * overall),
+                worst_rate,
+                lambda i: {
+                    'weekday': WEEKDAY_NAMES[worst_weekday[i]],
+                    'missed_days': int(missed_by_weekday[i, worst_weekday[i]]),
+                    'overall_rate': round(float(overall[i]), 3),
+                },
+            ),
+            (
+                AttendanceFlag.FlagType.CONSECUTIVE_ABSENCE,
+                streaks >= CONSECUTIVE_ABSENCE_THRESHOLD,
+                streaks,
+                lambda i: {},
+            ),
+        ]
+        flagged = set()
+        for flag_type, mask, values, details in candidates:
+            for i in np.flatnonzero(mask):
+                flags.append((int(student_ids[i]), flag_type, round(float(values[i]), 3), details(i)))
+                flagged.add(int(student_ids[i]))
+
+        classes = dict(Student.objects.filter(id__in=flagged).values_list('id', 'current_class_id').order_by())
+        flags = [
+            AttendanceFlag(
+                school_id=school_id, student_id=student_id, class_obj_id=classes.get(student_id),
+                run_date=run_date, flag_type=flag_type, value=value, details=details,
+            )
+            for student_id, flag_type, value, details in flags
+        ]
+
+    with transaction.atomic():
+        AttendanceFlag.objects.filter(school_id=school_id, run_date=run_date).delete()
+        AttendanceFlag.objects.bulk_create(flags, batch_size=1000)
+    return len(flags)
@@ -0,0 +1,245 @@
+"""
+Attendance rollups and the reports read from them.
+
+ClassAttendanceDaily holds per-status counts for each (class, date) and
+StudentAttendanceMonthly for each (student, class, month). Rows are recomputed
+from Attendance for exactly the days and students a write touched (bulk_mark
+and the Attendance signals call refresh_attendance_rollups), which keeps them
+correct under retries and out-of-order updates. rebuild_attendance_rollups
+backfills them (``manage.py backfill_attendance_rollups``).
+
+Reports read the rollups, so their cost grows with the number of days or
+months in the range rather than the number of attendance rows:
+
+* class_rates: daily and overall attendance rate for a class.
+* class_streaks / student_streaks: runs of full-attendance days for a class, and
+  of attended days for one student.
+* chronic_absentees: students who missed at least a share of recorded days.
+"""
+
+import datetime
+
+from django.db.models import Count, Q, Sum
+
+from schools.stats import PRESENT_STATUSES
+from .models import Attendance, ClassAttendanceDaily, StudentAttendanceMonthly
+
+COUNT_FIELDS = ['present', 'absent', 'late', 'excused']
+# Days counted as missed, excused or not
+MISSED_STATUSES = ['absent', 'excused']
+# Chronic absence: missing 10% or more of school days
+CHRONIC_ABSENCE_THRESHOLD = 0.1
+
+
+def _count_aggregates():
+    return {field: Count('id', filter=Q(status=field)) for field in COUNT_FIELDS}
+
+
+def _sum_aggregates():
+    return {field: Sum(field) for field in COUNT_FIELDS}
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def rate(attended, total):
+    return round(attended * 100 / total, 1) if total else None
+
+
+def _upsert(model, rows, unique_fields, batch_size=1000):
+    model.objects.bulk_create(
+        rows, batch_size=batch_size, update_conflicts=True,
+        unique_fields=unique_fields, update_fields=COUNT_FIELDS + ['updated_at'],
+    )
+
+
+def refresh_attendance_rollups(class_id, dates, student_ids):
+    """Recompute the daily rows of a class and the monthly rows of some of its students"""
+    dates = sorted(set(dates))
+    counts = {
+        row.pop('date'): row
+        for row in Attendance.objects.filter(class_obj_id=class_id, date__in=dates)
+        .values('date').annotate(**_count_aggregates()).order_by()
+    }
+    _upsert(ClassAttendanceDaily, [
+        ClassAttendanceDaily(class_obj_id=class_id, date=day, **counts.get(day, dict.fromkeys(COUNT_FIELDS, 0)))
+        for day in dates
+    ], ['class_obj', 'date'])
+
+    student_ids = list(set(student_ids))
+    for month in sorted({month_start(day) for day in dates}):
+        counts = {
+            row.pop('student_id'): row
+            for row in Attendance.objects.filter(
+                class_obj_id=class_id, student_id__in=student_ids, date__gte=month, date__lt=next_month(month),
+            ).values('student_id').annotate(**_count_aggregates()).order_by()
+        }
+        _upsert(StudentAttendanceMonthly, [
+            StudentAttendanceMonthly(
+                student_id=student_id, class_obj_id=class_id, month=month,
+                **counts.get(student_id, dict.fromkeys(COUNT_FIELDS, 0)),
+            )
+            for student_id in student_ids
+        ], ['student', 'class_obj', 'month'])
+
+
+def rebuild_attendance_rollups(class_ids=None, start=None, end=None, batch_size=1000):
+    """Backfill both rollups from Attendance; returns (daily rows, monthly rows) written"""
+    from django.db.models.functions import TruncMonth
+
+    attendance = Attendance.objects.all()
+    if class_ids is not None:
+        attendance = attendance.filter(class_obj_id__in=class_ids)
+
+    daily = attendance
+    # Monthly rows always cover whole months, so widen the range to month boundaries
+    monthly = attendance
+    if start:
+        daily = daily.filter(date__gte=start)
+        monthly = monthly.filter(date__gte=month_start(start))
+    if end:
+        daily = daily.filter(date__lte=end)
+        monthly = monthly.filter(date__lt=next_month(end))
+
+    written = []
+    for queryset, model, keys, unique_fields in [
+        (daily.values('class_obj_id', 'date'), ClassAttendanceDaily, ['class_obj_id', 'date'], ['class_obj', 'date']),
+        (
+            monthly.annotate(month=TruncMonth('date')).values('student_id', 'class_obj_id', 'month'),
+            StudentAttendanceMonthly, ['student_id', 'class_obj_id', 'month'], ['student', 'class_obj', 'month'],
+        ),
+    ]:
+        count, batch = 0, []
+        for row in queryset.annotate(**_count_aggregates()).order_by().iterator(chunk_size=batch_size):
+            batch.append(model(**row))
+            if len(batch) >= batch_size:
+                _upsert(model, batch, unique_fields, batch_size)
+                count += len(batch)
+                batch = []
+        if batch:
+            _upsert(model, batch, unique_fields, batch_size)
+            count += len(batch)
+        written.append(count)
+    return tuple(written)
+
+
+def _day_row(day):
+    attended = day.present + day.late
+    return {
+        'date': day.date,
+        **{field: getattr(day, field) for field in COUNT_FIELDS},
+        'rate': rate(attended, day.total),
+    }
+
+
+def class_rates(class_id, start, end):
+    """Attendance rate of a class for each recorded day in the range and overall"""
+    days = [_day_row(day) for day in ClassAttendanceDaily.objects.filter(class_obj_id=class_id, date__range=[start, end])]
+    totals = {field: sum(day[field] for day in days) for field in COUNT_FIELDS}
+    return {
+        'start_date': start,
+        'end_date': end,
+        'days': days,
+        'totals': totals,
+        'rate': rate(totals['present'] + totals['late'], sum(totals.values())),
+    }
+
+
+def _streaks(flags):
+    """Longest and trailing run of True values"""
+    longest = current = 0
+    for flag in flags:
+        current = current + 1 if flag else 0
+        longest = max(longest, current)
+    return {'current': current, 'longest': longest}
+
+
+def class_streaks(class_id, start, end):
+    """Runs of recorded days on which nobody in the class was absent"""
+    days = ClassAttendanceDaily.objects.filter(class_obj_id=class_id, date__range=[start, end])
+    recorded = [day for day in days if day.total]
+    return {
+        'start_date': start,
+        'end_date': end,
+        'recorded_days': len(recorded),
+        'full_attendance_days': sum(1 for day in recorded if not day.absent and not day.excused),
+        'full_attendance_streak': _streaks(not day.absent and not day.excused for day in recorded),
+    }
+
+
+def student_streaks(student_id, class_id, start, end):
+    """Runs of consecutive recorded days a student attended (present or late)"""
+    statuses = Attendance.objects.filter(
+        student_id=student_id, class_obj_id=class_id, date__range=[start, end],
+    ).order_by('date').values_list('status', flat=True)
+    statuses = list(statuses)
+    return {
+        'student_id': student_id,
+        'start_date': start,
+        'end_date': end,
+        'recorded_days': len(statuses),
+        'attended_days': sum(1 for status in statuses if status in PRESENT_STATUSES),
+        'attendance_streak': _streaks(status in PRESENT_STATUSES for status in statuses),
+    }
+
+
+def student_counts(class_id, start, end):
+    """
+    Per-student status counts in a class over a date range.
+
+    Whole months inside the range come from the monthly rollup; only the
+    partial months at either end are read from Attendance.
+    """
+    first_full = start if start.day == 1 else next_month(start)
+    end_full = next_month(end) if next_month(end) - datetime.timedelta(days=1) == end else month_start(end)
+    counts = {}
+
+    def add(rows):
+        for row in rows:
+            totals = counts.setdefault(row.pop('student_id'), dict.fromkeys(COUNT_FIELDS, 0))
+            for field in COUNT_FIELDS:
+                totals[field] += row[field] or 0
+
+    raw = Attendance.objects.filter(class_obj_id=class_id)
+    if first_full < end_full:
+        add(StudentAttendanceMonthly.objects.filter(
+            class_obj_id=class_id, month__gte=first_full, month__lt=end_full,
+        ).values('student_id').annotate(**_sum_aggregates()).order_by())
+        edges = Q(date__gte=start, date__lt=first_full) | Q(date__gte=end_full, date__lte=end)
+    else:
+        edges = Q(date__range=[start, end])
+    add(raw.filter(edges).values('student_id').annotate(**_count_aggregates()).order_by())
+    return counts
+
+
+def chronic_absentees(class_id, start, end, threshold=CHRONIC_ABSENCE_THRESHOLD):
+    """Students of a class who missed at least ``threshold`` of their recorded days"""
+    from students.models import Student
+
+    absentees = []
+    for student_id, totals in student_counts(class_id, start, end).items():
+        recorded = sum(totals.values())
+        missed = sum(totals[status] for status in MISSED_STATUSES)
+        if recorded and missed / recorded >= threshold:
+            absentees.append({
+                'student_id': student_id,
+                **totals,
+                'recorded_days': recorded,
+                'absence_rate': rate(missed, recorded),
+            })
+
+    names = {
+        row['id']: row for row in Student.objects.filter(id__in=[row['student_id'] for row in absentees]).values(
+            'id', 'student_id', 'user__first_name', 'user__last_name',
+        ).order_by()
+    }
+    for row in absentees:
+        student = names.get(row['student_id'], {})
+        row['student_number'] = student.get('student_id')
+        row['name'] = f"{student.get('user__first_name', '')} {student.get('user__last_name', '')}".strip()
+    return sorted(absentees, key=lambda row: (-row['absence_rate'], row['name']))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from classes.attendance import parse_date
+from classes.attendance_stats import rebuild_attendance_rollups
+from classes.models import Class
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily class and monthly student attendance rollups from attendance records.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', type=int, help='Only rebuild classes of this school id')
+        parser.add_argument('--start-date', help='First date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start, end = (
+            parse_date(options[name]) if options[name] else None for name in ('start_date', 'end_date')
+        )
+        if (options['start_date'] and not start) or (options['end_date'] and not end):
+            raise CommandError('Dates must be given as YYYY-MM-DD.')
+
+        class_ids = None
+        if options['school']:
+            class_ids = list(Class.objects.filter(school_id=options['school']).values_list('id', flat=True))
+
+        daily, monthly = rebuild_attendance_rollups(class_ids, start, end, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {daily} daily class rows and {monthly} monthly student rows.'
+        ))
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-19 01:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0002_initial'),
+        ('classes', '0003_classschedule_created_at_classschedule_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentAttendanceMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('absent', models.PositiveIntegerField(default=0)),
+                ('late', models.PositiveIntegerField(default=0)),
+                ('excused', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField()),
+                ('class_obj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_attendance_months', to='classes.class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_months', to='students.student')),
+            ],
+            options={
+                'ordering': ['month'],
+                'indexes': [models.Index(fields=['class_obj', 'month'], name='classes_stu_class_o_e880f8_idx')],
+                'unique_together': {('student', 'class_obj', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ClassAttendanceDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('present', models.PositiveIntegerField(default=0)),
+                ('absent', models.PositiveIntegerField(default=0)),
+                ('late', models.PositiveIntegerField(default=0)),
+                ('excused', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('class_obj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_days', to='classes.class')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('class_obj', 'date')},
+            },
+        ),
+    ]
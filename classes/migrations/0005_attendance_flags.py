@@ -0,0 +1,35 @@
+# Generated by Django 4.2.23 on 2026-10-19 01:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schools', '0002_school_stats'),
+        ('students', '0002_initial'),
+        ('classes', '0004_attendance_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_date', models.DateField()),
+                ('flag_type', models.CharField(choices=[('rolling_absence', 'High Recent Absence Rate'), ('weekday_pattern', 'Absences Concentrated on One Weekday'), ('consecutive_absence', 'Consecutive Absences')], max_length=20)),
+                ('value', models.FloatField()),
+                ('details', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('class_obj', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attendance_flags', to='classes.class')),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_flags', to='schools.school')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_flags', to='students.student')),
+            ],
+            options={
+                'ordering': ['-run_date', '-value'],
+                'indexes': [models.Index(fields=['school', 'run_date'], name='classes_att_school__e8feec_idx')],
+                'unique_together': {('student', 'run_date', 'flag_type')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-19 01:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classes', '0005_attendance_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['class_obj', 'updated_at'], name='classes_att_class_o_778468_idx'),
+        ),
+    ]
@@ -1,8 +1,28 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from schools.models import School
 
 
+def _count_by(queryset, field):
+    """Subquery counting the rows of ``queryset`` whose ``field`` points at the outer row"""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('pk')).values('total'),
+    ), 0)
+
+
+class ClassQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Join the school and annotate students_count and subjects_count, as ClassSerializer reads them"""
+        from students.models import Student
+        return self.select_related('school').annotate(
+            students_count=_count_by(Student.objects.all(), 'current_class'),
+            subjects_count=_count_by(ClassSubject.objects.all(), 'class_obj'),
+        )
+
+
 class Class(models.Model):
     """Class/Grade model"""
     school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='classes')
@@ -14,6 +34,8 @@ class Class(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ClassQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['name', 'section', 'academic_year', 'school']
         verbose_name_plural = 'Classes'
@@ -109,15 +131,87 @@ class Attendance(models.Model):
     remarks = models.TextField(blank=True)
     marked_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # server write time, the sync cursor
+    changed_at = models.DateTimeField(default=timezone.now)  # when the mark was made, for last-writer-wins
     
     class Meta:
         unique_together = ['student', 'class_obj', 'date']
+        indexes = [models.Index(fields=['class_obj', 'updated_at'])]
         ordering = ['-date']
     
     def __str__(self):
         return f"{self.student} - {self.date} - {self.get_status_display()}"
 
 
+class AttendanceCounts(models.Model):
+    """Per-status attendance counts shared by the attendance rollups"""
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    excused = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def total(self):
+        return self.present + self.absent + self.late + self.excused
+
+
+class ClassAttendanceDaily(AttendanceCounts):
+    """Attendance counts for one class on one day (see classes.attendance_stats)"""
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='attendance_days')
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ['class_obj', 'date']
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.class_obj} - {self.date}"
+
+
+class StudentAttendanceMonthly(AttendanceCounts):
+    """Attendance counts for one student in one class over a calendar month"""
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='attendance_months')
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='student_attendance_months')
+    month = models.DateField()  # first day of the month
+
+    class Meta:
+        unique_together = ['student', 'class_obj', 'month']
+        indexes = [models.Index(fields=['class_obj', 'month'])]
+        ordering = ['month']
+
+    def __str__(self):
+        return f"{self.student} - {self.month:%Y-%m}"
+
+
+class AttendanceFlag(models.Model):
+    """Student flagged by the nightly attendance pattern analysis (see classes.attendance_patterns)"""
+    class FlagType(models.TextChoices):
+        ROLLING_ABSENCE = 'rolling_absence', _('High Recent Absence Rate')
+        WEEKDAY_PATTERN = 'weekday_pattern', _('Absences Concentrated on One Weekday')
+        CONSECUTIVE_ABSENCE = 'consecutive_absence', _('Consecutive Absences')
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='attendance_flags')
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='attendance_flags')
+    class_obj = models.ForeignKey(Class, on_delete=models.SET_NULL, null=True, blank=True, related_name='attendance_flags')
+    run_date = models.DateField()
+    flag_type = models.CharField(max_length=20, choices=FlagType.choices)
+    value = models.FloatField()  # the metric that triggered the flag (rate or day count)
+    details = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['student', 'run_date', 'flag_type']
+        indexes = [models.Index(fields=['school', 'run_date'])]
+        ordering = ['-run_date', '-value']
+
+    def __str__(self):
+        return f"{self.student} - {self.get_flag_type_display()} ({self.run_date})"
+
+
 class Assignment(models.Model):
     """Class assignments/homework"""
     title = models.CharField(max_length=200)
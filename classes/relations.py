@@ -0,0 +1,49 @@
+"""
+Set-based teacher/class/student relations.
+
+A teacher's classes are the classes they teach a subject in (ClassSubject)
+and the classes they head (Teacher.head_teacher_classes). These helpers are
+the one definition of that relation: core.scope.UserScope resolves a
+teacher's class ids with them, and views that list a teacher's students or
+a student's teachers use them directly.
+
+Each helper returns a values() queryset meant to be used as a subquery
+(``field__in=...``), so callers resolve a relation in the same single query
+as the rows they list instead of looping over subjects.
+"""
+
+from django.db.models import Q
+
+from .models import Class, ClassSubject
+
+
+def subjects_taught_by(teacher_user_id):
+    """(class id, subject id) pairs the teacher (given by user id) teaches"""
+    return ClassSubject.objects.filter(teacher__user_id=teacher_user_id).values_list('class_obj_id', 'subject_id')
+
+
+def classes_taught_by(teacher_user_id):
+    """Ids of classes in which the teacher teaches a subject"""
+    return ClassSubject.objects.filter(teacher__user_id=teacher_user_id).values('class_obj_id')
+
+
+def classes_headed_by(teacher_user_id):
+    """Ids of classes the teacher heads"""
+    return Class.objects.filter(head_teachers__user_id=teacher_user_id).values('id')
+
+
+def classes_of_teacher(teacher_user_id):
+    """Ids of classes the teacher teaches a subject in or heads"""
+    return Class.objects.filter(
+        Q(id__in=classes_taught_by(teacher_user_id)) | Q(id__in=classes_headed_by(teacher_user_id)),
+    ).values('id')
+
+
+def teachers_of_student(student_user_id):
+    """User ids of the teachers of the student's current class: its subject teachers and head teachers"""
+    from users.models import User
+
+    return User.objects.filter(
+        Q(teacher_profile__classsubject__class_obj__enrolled_students__user_id=student_user_id) |
+        Q(teacher_profile__head_teacher_classes__enrolled_students__user_id=student_user_id),
+    ).values('id')
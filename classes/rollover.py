@@ -0,0 +1,246 @@
+"""
+Academic year rollover.
+
+rollover_academic_year moves a school from one academic year to the next in
+one transaction:
+
+* every class of the source year is cloned into the target year, with its
+  ClassSubject teacher assignments, head teachers, active ClassSchedule slots
+  and the FeeStructure rows of the source year;
+* enrolled students move to the clone of the class they are promoted to, or
+  are marked graduated;
+* the source timetables are deactivated, and by default the source classes.
+
+Each table is written with one bulk_create or bulk_update, so the cost grows
+with the number of batches rather than with the number of rows. Promotion
+follows the class names by default: "Grade 3 - B" goes to "Grade 4 - B" (or
+any "Grade 4" section when there is no B), the highest grade graduates, and a
+class without a number in its name keeps its students. Explicit rules and
+per-student repeats override that. A dry run returns the same summary
+without writing anything.
+"""
+
+import re
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .models import Class, ClassSchedule, ClassSubject
+
+GRADUATE = 'graduate'
+STAY = 'stay'
+GRADE_PATTERN = re.compile(r'^(.*?)(\d+)\s*$')
+
+
+def _grade(name):
+    """(prefix, number) of a class name ending in a number, else None"""
+    match = GRADE_PATTERN.match(name)
+    return (match.group(1).strip().lower(), int(match.group(2))) if match else None
+
+
+def _label(class_obj):
+    return f'{class_obj.name} - {class_obj.section}' if class_obj.section else class_obj.name
+
+
+def default_promotions(classes):
+    """Map each class id to the id of the class its students move up to, GRADUATE or STAY"""
+    by_grade = defaultdict(list)
+    for class_obj in classes:
+        grade = _grade(class_obj.name)
+        if grade:
+            by_grade[grade].append(class_obj)
+    highest = Counter()
+    for prefix, number in by_grade:
+        highest[prefix] = max(highest[prefix], number)
+
+    promotions = {}
+    for class_obj in classes:
+        grade = _grade(class_obj.name)
+        if grade is None:
+            promotions[class_obj.id] = STAY
+            continue
+        candidates = by_grade.get((grade[0], grade[1] + 1))
+        if candidates:
+            same_section = [c for c in candidates if c.section == class_obj.section]
+            promotions[class_obj.id] = (same_section or sorted(candidates, key=lambda c: c.section))[0].id
+        elif grade[1] >= highest[grade[0]]:
+            promotions[class_obj.id] = GRADUATE
+        else:
+            # A gap in the grades: nothing to move up to
+            promotions[class_obj.id] = STAY
+    return promotions
+
+
+def _next_year(value):
+    return str(int(value) + 1) if str(value).isdigit() else value
+
+
+def rollover_academic_year(school_id, source_year, target_year, promotions=None, repeat=(),
+                           deactivate_source=True, dry_run=False):
+    """
+    Roll a school's classes and students from ``source_year`` into ``target_year``.
+
+    ``promotions`` maps source class ids to the source class id their students
+    move to, or to ``'graduate'`` or ``'stay'``; classes left out follow
+    default_promotions. Students in ``repeat`` stay in their class's clone.
+    Returns a summary of the classes, related rows and student moves; with
+    ``dry_run`` nothing is written. Raises ValueError when the rollover cannot
+    run (no source classes, target year already present, unknown classes in
+    ``promotions``).
+    """
+    from fees.models import FeeStructure
+    from students.models import Student
+    from users.models import Teacher
+
+    if str(source_year) == str(target_year):
+        raise ValueError('The target academic year must differ from the source year')
+    sources = list(Class.objects.filter(school_id=school_id, academic_year=source_year).order_by('name', 'section'))
+    if not sources:
+        raise ValueError(f'No classes found for academic year {source_year}')
+    if Class.objects.filter(school_id=school_id, academic_year=target_year).exists():
+        raise ValueError(f'Classes for academic year {target_year} already exist')
+
+    source_by_id = {class_obj.id: class_obj for class_obj in sources}
+    rules = default_promotions(sources)
+    for class_id, rule in (promotions or {}).items():
+        try:
+            class_id, rule = int(class_id), rule if rule in (GRADUATE, STAY) else int(rule)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid promotion rule {class_id} -> {rule}')
+        if class_id not in source_by_id or (rule not in (GRADUATE, STAY) and rule not in source_by_id):
+            raise ValueError(f'Promotion rule {class_id} -> {rule} names a class outside {source_year}')
+        rules[class_id] = rule
+    repeat = {int(student_id) for student_id in repeat}
+
+    source_ids = list(source_by_id)
+    class_subjects = list(ClassSubject.objects.filter(class_obj_id__in=source_ids).values(
+        'class_obj_id', 'subject_id', 'teacher_id', 'is_compulsory',
+    ).order_by())
+    schedules = list(ClassSchedule.objects.filter(class_obj_id__in=source_ids, is_active=True).values(
+        'class_obj_id', 'subject_id', 'teacher_id', 'day', 'start_time', 'end_time', 'room',
+    ).order_by())
+    fee_structures = list(FeeStructure.objects.filter(class_obj_id__in=source_ids, academic_year=source_year).values(
+        'class_obj_id', 'category_id', 'amount', 'frequency', 'is_active',
+    ).order_by())
+    head_teacher_model = Teacher.head_teacher_classes.through
+    head_teachers = list(head_teacher_model.objects.filter(class_id__in=source_ids).values_list('teacher_id', 'class_id'))
+    students = list(Student.objects.filter(
+        current_class_id__in=source_ids, academic_status='enrolled',
+    ).values_list('id', 'current_class_id', 'year').order_by())
+
+    moves = []  # (student id, source class id, destination source class id or GRADUATE, year)
+    for student_id, class_id, year in students:
+        rule = STAY if student_id in repeat else rules[class_id]
+        moves.append((student_id, class_id, class_id if rule == STAY else rule, year))
+
+    def counts(rows):
+        return Counter(row['class_obj_id'] for row in rows)
+
+    subject_counts, schedule_counts, fee_counts = counts(class_subjects), counts(schedules), counts(fee_structures)
+    flows = Counter((source, destination) for _, source, destination, _ in moves)
+    summary = {
+        'source_year': source_year,
+        'target_year': target_year,
+        'dry_run': dry_run,
+        'classes': [
+            {
+                'source_class_id': class_obj.id,
+                'name': _label(class_obj),
+                'subjects': subject_counts[class_obj.id],
+                'schedules': schedule_counts[class_obj.id],
+                'fee_structures': fee_counts[class_obj.id],
+                'promotes_to': rules[class_obj.id] if rules[class_obj.id] in (GRADUATE, STAY)
+                else _label(source_by_id[rules[class_obj.id]]),
+            }
+            for class_obj in sources
+        ],
+        'student_moves': [
+            {
+                'from': _label(source_by_id[source]),
+                'to': GRADUATE if destination == GRADUATE else f'{_label(source_by_id[destination])} ({target_year})',
+                'students': count,
+            }
+            for (source, destination), count in sorted(flows.items(), key=lambda item: _label(source_by_id[item[0][0]]))
+        ],
+        'totals': {
+            'classes': len(sources),
+            'subjects': len(class_subjects),
+            'schedules': len(schedules),
+            'fee_structures': len(fee_structures),
+            'head_teachers': len(head_teachers),
+            'students_promoted': sum(1 for move in moves if move[2] not in (GRADUATE, move[1])),
+            'students_repeating': sum(1 for move in moves if move[2] == move[1]),
+            'students_graduated': sum(1 for move in moves if move[2] == GRADUATE),
+        },
+    }
+    if dry_run:
+        return summary
+
+    with transaction.atomic():
+        Class.objects.bulk_create([
+            Class(
+                school_id=school_id, name=class_obj.name, section=class_obj.section, academic_year=target_year,
+                capacity=class_obj.capacity, is_active=True,
+            )
+            for class_obj in sources
+        ], batch_size=1000)
+        # Not every backend returns ids from bulk_create, so match the clones by their unique key
+        clone_ids = {
+            (name, section): class_id for class_id, name, section in Class.objects.filter(
+                school_id=school_id, academic_year=target_year,
+            ).values_list('id', 'name', 'section')
+        }
+        clone_of = {class_obj.id: clone_ids[class_obj.name, class_obj.section] for class_obj in sources}
+
+        ClassSubject.objects.bulk_create([
+            ClassSubject(**{**row, 'class_obj_id': clone_of[row['class_obj_id']]}) for row in class_subjects
+        ], batch_size=1000)
+        ClassSchedule.objects.bulk_create([
+            ClassSchedule(**{**row, 'class_obj_id': clone_of[row['class_obj_id']]}) for row in schedules
+        ], batch_size=1000)
+        FeeStructure.objects.bulk_create([
+            FeeStructure(**{**row, 'class_obj_id': clone_of[row['class_obj_id']], 'academic_year': target_year})
+            for row in fee_structures
+        ], batch_size=1000)
+        head_teacher_model.objects.bulk_create([
+            head_teacher_model(teacher_id=teacher_id, class_id=clone_of[class_id]) for teacher_id, class_id in head_teachers
+        ], batch_size=1000)
+
+        updates = []
+        for student_id, source, destination, year in moves:
+            if destination == GRADUATE:
+                # Graduates keep their last class as a record of where they finished
+                updates.append(Student(
+                    id=student_id, current_class_id=source, academic_status='graduated', year=year,
+                ))
+            else:
+                updates.append(Student(
+                    id=student_id, current_class_id=clone_of[destination], academic_status='enrolled',
+                    year=year if destination == source else _next_year(year),
+                ))
+        Student.objects.bulk_update(updates, ['current_class', 'academic_status', 'year'], batch_size=500)
+
+        # The cloned slots take over the source timetable, which would otherwise clash with them
+        ClassSchedule.objects.filter(class_obj_id__in=source_ids).update(is_active=False)
+        if deactivate_source:
+            Class.objects.filter(id__in=source_ids).update(is_active=False)
+        _record_rollover(school_id, len(sources))
+    return summary
+
+
+def _record_rollover(school_id, class_count):
+    """Bulk writes skip the signals that keep caches and rollups current, so do their work here"""
+    from core.dashboard import invalidate_tiles
+    from core.scope import bump_school_scope
+    from fees.reports import invalidate_fee_reports
+    from schools.stats import apply_deltas
+    from .timetable import schedule_changed
+
+    apply_deltas(school_id, {'total_classes': class_count})
+    transaction.on_commit(lambda: (
+        bump_school_scope(school_id),
+        invalidate_tiles(['system_totals']),
+        invalidate_tiles(['teacher_stats', 'student_stats'], school_id),
+        invalidate_fee_reports(school_id),
+        schedule_changed(school_id),
+    ))
@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Class, Subject, ClassSubject, ClassSchedule, Attendance, Assignment, AssignmentSubmission
 from core.models import SystemSettings
@@ -18,16 +20,24 @@ class ClassSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'school', 'school_name', 'created_at', 'updated_at']
     
+    # Querysets from Class.objects.with_counts() carry both counts; anything else is counted per row
     def get_students_count(self, obj):
-        return obj.enrolled_students.count()
+        count = getattr(obj, 'students_count', None)
+        return obj.enrolled_students.count() if count is None else count
     
     def get_subjects_count(self, obj):
-        return obj.subjects.count()
+        count = getattr(obj, 'subjects_count', None)
+        return obj.subjects.count() if count is None else count
     
     def get_school_name(self, obj):
         return obj.school.name if obj.school else ''
 
 
+def with_class_counts(lookup):
+    """Prefetch for a nested ClassSerializer, so its counts cost one query for the whole page"""
+    return Prefetch(lookup, queryset=Class.objects.with_counts())
+
+
 class SubjectSerializer(serializers.ModelSerializer):
     """Subject serializer"""
     class Meta:
@@ -119,7 +129,53 @@ class ClassScheduleSerializer(serializers.ModelSerializer):
             }
         return None
 
+    def timetable_slot(self, attrs):
+        """(school id, Slot) of the slot ``attrs`` would save, or None when it takes no time in the timetable"""
+        from .timetable import Slot
+
+        def value(field, default=None):
+            return attrs.get(field, getattr(self.instance, field, default))
+
+        if not value('is_active', True):
+            return None
+        class_id = value('class_obj_id')
+        school_id = Class.objects.filter(id=class_id).values_list('school_id', flat=True).first()
+        if school_id is None:
+            raise serializers.ValidationError({'class_obj_id': 'Class not found.'})
+        return school_id, Slot(
+            class_id, value('teacher_id'), value('room') or '', value('day'), value('start_time'), value('end_time'),
+        )
+
+    def validate(self, attrs):
+        """Reject slots that overlap another slot of the same class, teacher or room"""
+        from .timetable import describe_conflict, find_conflicts
+
+        start_time = attrs.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = attrs.get('end_time', getattr(self.instance, 'end_time', None))
+        if start_time and end_time and start_time >= end_time:
+            raise serializers.ValidationError({'end_time': 'End time must be after start time.'})
+        timetable_slot = self.timetable_slot(attrs)
+        if timetable_slot is None:
+            return attrs
+        conflicts = find_conflicts(*timetable_slot, exclude=self.instance.pk if self.instance else None)
+        if conflicts:
+            raise serializers.ValidationError([describe_conflict(*conflict) for conflict in conflicts])
+        return attrs
+
+    def check_timetable(self, validated_data):
+        """Check the slot again against the database under the timetable lock; call in the write transaction"""
+        from .timetable import check_slot, describe_conflict
+
+        timetable_slot = self.timetable_slot(validated_data)
+        if timetable_slot is None:
+            return
+        conflicts = check_slot(*timetable_slot, exclude=self.instance.pk if self.instance else None)
+        if conflicts:
+            raise serializers.ValidationError([describe_conflict(*conflict) for conflict in conflicts])
+
+    @transaction.atomic
     def create(self, validated_data):
+        self.check_timetable(validated_data)
         class_obj_id = validated_data.pop('class_obj_id')
         subject_id = validated_data.pop('subject_id')
         teacher_id = validated_data.pop('teacher_id')
@@ -135,6 +191,11 @@ class ClassScheduleSerializer(serializers.ModelSerializer):
             **validated_data
         )
 
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        self.check_timetable(validated_data)
+        return super().update(instance, validated_data)
+
 
 class AttendanceSerializer(serializers.ModelSerializer):
     """Attendance serializer"""
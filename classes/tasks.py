@@ -0,0 +1,30 @@
+from celery import shared_task
+
+from schools.models import School
+from .attendance_patterns import analyze_school_attendance
+from .timetable_solver import generate_timetable
+
+
+@shared_task
+def analyze_attendance_patterns():
+    """Queue the attendance pattern analysis for every active school"""
+    school_ids = list(School.objects.filter(is_active=True).values_list('id', flat=True))
+    for school_id in school_ids:
+        analyze_school_attendance_patterns.delay(school_id)
+    return f'Queued attendance analysis for {len(school_ids)} schools.'
+
+
+@shared_task
+def analyze_school_attendance_patterns(school_id):
+    """Flag students of one school from their attendance patterns"""
+    count = analyze_school_attendance(school_id)
+    return f'Wrote {count} attendance flags for school {school_id}.'
+
+
+@shared_task(bind=True)
+def generate_school_timetable(self, school_id, options=None):
+    """Solve and commit a school's timetable, reporting placed lessons in the task state as it runs"""
+    def progress(placed, total):
+        self.update_state(state='PROGRESS', meta={'school_id': school_id, 'placed': placed, 'total': total})
+
+    return generate_timetable(school_id, progress=progress, **(options or {}))
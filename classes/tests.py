@@ -1,3 +1,593 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from schools.models import School, SchoolStats, Subscription, SubscriptionPlan
+from schools.stats import rebuild_school_stats
+from students.models import Student
+from users.models import Teacher, User
+from .attendance import CREATED, ERROR, UNCHANGED, UPDATED, bulk_mark_attendance, sync_attendance
+from .attendance_stats import chronic_absentees, class_rates, class_streaks, rebuild_attendance_rollups, student_streaks
+from .attendance_patterns import analyze_school_attendance
+from .models import (
+    Attendance, AttendanceFlag, Class, ClassAttendanceDaily, ClassSchedule, ClassSubject, StudentAttendanceMonthly,
+    Subject,
+)
+from .serializers import ClassScheduleSerializer, ClassSerializer, ClassSubjectSerializer, with_class_counts
+from .rollover import rollover_academic_year
+from .timetable import IntervalList, Slot, find_conflicts, import_timetable
+from .timetable_solver import generate_timetable
+
+
+class BulkMarkAttendanceTests(TestCase):
+    """A roll call is validated and written in a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Roll School', code='ROL', address='1 Main St', phone='555-0100', email='office@roll.test',
+            principal_name='Pat Principal', principal_email='principal@roll.test', principal_phone='555-0101',
+        )
+        cls.class_obj = Class.objects.create(school=cls.school, name='Grade 1', academic_year='2024-2025')
+        other_class = Class.objects.create(school=cls.school, name='Grade 2', academic_year='2024-2025')
+        cls.students = [cls.make_student(f'roll-s{number}', cls.class_obj) for number in range(40)]
+        cls.outsider = cls.make_student('roll-outsider', other_class)
+        cls.marker = User.objects.create_user('roll-admin', role=User.UserRole.SCHOOL_ADMIN, school=cls.school)
+
+    @classmethod
+    def make_student(cls, username, class_obj):
+        return Student.objects.create(
+            user=User.objects.create_user(username, role=User.UserRole.STUDENT, school=cls.school),
+            school=cls.school, current_class=class_obj, date_of_birth=date(2010, 1, 1),
+            gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+        )
+
+    def statements(self, records):
+        """Mark attendance and return the SQL statements run, savepoints aside"""
+        with CaptureQueriesContext(connection) as queries:
+            results = self.mark(records)
+        return results, [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+
+    def mark(self, records):
+        return bulk_mark_attendance(self.class_obj.id, date(2024, 9, 2), records, self.marker)
+
+    def test_roll_call_is_one_read_and_one_upsert_and_idempotent(self):
+        records = [{'student_id': student.id, 'status': 'present'} for student in self.students]
+        # Membership read, class lock, re-read and attendance upsert, then one read and upsert per rollup
+        results, statements = self.statements(records)
+        self.assertEqual(statements, ['SELECT', 'SELECT', 'SELECT', 'INSERT'] + ['SELECT', 'INSERT'] * 2)
+        self.assertEqual({result['result'] for result in results}, {CREATED})
+        self.assertEqual(Attendance.objects.filter(class_obj=self.class_obj).count(), 40)
+
+        results, statements = self.statements(records)
+        self.assertEqual(statements, ['SELECT'])
+        self.assertEqual({result['result'] for result in results}, {UNCHANGED})
+
+        records[0]['status'] = 'absent'
+        results = self.mark(records)
+        self.assertEqual(results[0]['result'], UPDATED)
+        self.assertEqual(Attendance.objects.get(student=self.students[0]).status, 'absent')
+
+    def test_a_concurrent_roll_call_is_not_counted_twice(self):
+        records = [{'student_id': student.id, 'status': 'present'} for student in self.students[:3]]
+        rebuild_school_stats([self.school.id])
+
+        def concurrent_roll_call(class_id):
+            # Another submission of the same roll call commits while this one waits for the lock
+            Attendance.objects.bulk_create([
+                Attendance(student=student, class_obj=self.class_obj, date=date(2024, 9, 2), status=status)
+                for student, status in [(self.students[0], 'present'), (self.students[1], 'absent')]
+            ])
+            rebuild_school_stats([self.school.id])
+
+        with mock.patch('classes.attendance.lock_roll_call', concurrent_roll_call), \
+                self.captureOnCommitCallbacks(execute=True):
+            results = self.mark(records)
+        self.assertEqual([result['result'] for result in results], [UNCHANGED, UPDATED, CREATED])
+        stats = SchoolStats.objects.get(school=self.school)
+        self.assertEqual((stats.attendance_total, stats.attendance_present), (3, 3))
+
+    def test_rows_are_validated_individually(self):
+        results = self.mark([
+            {'student_id': self.students[0].id, 'status': 'late'},
+            {'student_id': self.outsider.id, 'status': 'present'},
+            {'student_id': self.students[1].id, 'status': 'asleep'},
+            {'student_id': self.students[0].id, 'status': 'absent'},
+        ])
+        self.assertEqual([result['result'] for result in results], [CREATED, ERROR, ERROR, ERROR])
+        self.assertEqual(list(Attendance.objects.values_list('student_id', 'status')), [(self.students[0].id, 'late')])
+
+
+class AttendanceRollupTests(TestCase):
+    """Attendance reports read rollups that bulk_mark and single writes keep current"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Rollup School', code='RUP', address='1 Main St', phone='555-0100', email='office@rollup.test',
+            principal_name='Pat Principal', principal_email='principal@rollup.test', principal_phone='555-0101',
+        )
+        cls.class_obj = Class.objects.create(school=cls.school, name='Grade 1', academic_year='2024-2025')
+        cls.marker = User.objects.create_user('rollup-admin', role=User.UserRole.SCHOOL_ADMIN, school=cls.school)
+        cls.alice, cls.bob = [
+            Student.objects.create(
+                user=User.objects.create_user(username, role=User.UserRole.STUDENT, school=cls.school),
+                school=cls.school, current_class=cls.class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            for username in ('rollup-alice', 'rollup-bob')
+        ]
+
+    def setUp(self):
+        # Alice attends every day; Bob misses 2 of 5 days, spread over two months
+        statuses = {
+            date(2024, 9, 27): 'present', date(2024, 9, 30): 'absent', date(2024, 10, 1): 'late',
+            date(2024, 10, 2): 'absent', date(2024, 10, 3): 'present',
+        }
+        for day, bob_status in statuses.items():
+            bulk_mark_attendance(self.class_obj.id, day, [
+                {'student_id': self.alice.id, 'status': 'present'},
+                {'student_id': self.bob.id, 'status': bob_status},
+            ], self.marker)
+
+    def test_reports(self):
+        rates = class_rates(self.class_obj.id, date(2024, 9, 1), date(2024, 10, 31))
+        self.assertEqual([day['rate'] for day in rates['days']], [100.0, 50.0, 100.0, 50.0, 100.0])
+        self.assertEqual(rates['rate'], 80.0)
+
+        streaks = class_streaks(self.class_obj.id, date(2024, 9, 1), date(2024, 10, 31))
+        self.assertEqual(streaks['full_attendance_streak'], {'current': 1, 'longest': 1})
+        bob = student_streaks(self.bob.id, self.class_obj.id, date(2024, 9, 1), date(2024, 10, 31))
+        self.assertEqual((bob['attended_days'], bob['attendance_streak']), (3, {'current': 1, 'longest': 1}))
+
+        absentees = chronic_absentees(self.class_obj.id, date(2024, 9, 28), date(2024, 10, 31))
+        self.assertEqual([(row['student_id'], row['absence_rate']) for row in absentees], [(self.bob.id, 50.0)])
+
+    def test_single_writes_and_backfill_agree_with_bulk_mark(self):
+        Attendance.objects.filter(student=self.bob, date=date(2024, 10, 2)).get().delete()
+        attendance = Attendance.objects.get(student=self.bob, date=date(2024, 9, 30))
+        attendance.status = 'present'
+        attendance.save()
+
+        def snapshot():
+            return (
+                list(ClassAttendanceDaily.objects.values_list('date', 'present', 'absent', 'late').order_by('date')),
+                list(StudentAttendanceMonthly.objects.values_list('student_id', 'month', 'present', 'absent', 'late')
+                     .order_by('student_id', 'month')),
+            )
+
+        maintained = snapshot()
+        self.assertEqual(maintained[0][3], (date(2024, 10, 2), 1, 0, 0))
+        ClassAttendanceDaily.objects.all().delete()
+        StudentAttendanceMonthly.objects.all().delete()
+        rebuild_attendance_rollups()
+        self.assertEqual(maintained, snapshot())
+
+
+class AttendancePatternTests(TestCase):
+    """The vectorized nightly analysis flags each kind of pattern"""
+
+    def test_flags(self):
+        school = School.objects.create(
+            name='Pattern School', code='PAT', address='1 Main St', phone='555-0100', email='office@pattern.test',
+            principal_name='Pat Principal', principal_email='principal@pattern.test', principal_phone='555-0101',
+        )
+        class_obj = Class.objects.create(school=school, name='Grade 1', academic_year='2024-2025')
+        students = {
+            name: Student.objects.create(
+                user=User.objects.create_user(f'pattern-{name}', role=User.UserRole.STUDENT, school=school),
+                school=school, current_class=class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            for name in ('steady', 'mondays', 'recent')
+        }
+        # Four weeks of school days ending on Friday 2024-09-27
+        days = [date(2024, 9, 2 + offset) for offset in range(26) if date(2024, 9, 2 + offset).weekday() < 5]
+        rows = []
+        for day in days:
+            statuses = {
+                'steady': 'present',
+                'mondays': 'absent' if day.weekday() == 0 else 'present',
+                'recent': 'absent' if day >= date(2024, 9, 23) else 'present',
+            }
+            rows += [
+                Attendance(student=students[name], class_obj=class_obj, date=day, status=status)
+                for name, status in statuses.items()
+            ]
+        Attendance.objects.bulk_create(rows)
+
+        self.assertEqual(analyze_school_attendance(school.id, run_date=date(2024, 9, 27)), 4)
+        flags = {
+            (flag.student_id, flag.flag_type): flag for flag in AttendanceFlag.objects.filter(school=school)
+        }
+        self.assertEqual(set(flags), {
+            (students['mondays'].id, AttendanceFlag.FlagType.WEEKDAY_PATTERN),
+            (students['mondays'].id, AttendanceFlag.FlagType.ROLLING_ABSENCE),
+            (students['recent'].id, AttendanceFlag.FlagType.ROLLING_ABSENCE),
+            (students['recent'].id, AttendanceFlag.FlagType.CONSECUTIVE_ABSENCE),
+        })
+        self.assertEqual(flags[(students['mondays'].id, 'weekday_pattern')].details['weekday'], 'Monday')
+        self.assertEqual(flags[(students['recent'].id, 'consecutive_absence')].value, 5)
+        self.assertEqual(flags[(students['recent'].id, 'rolling_absence')].value, 0.25)
+        self.assertEqual(flags[(students['mondays'].id, 'rolling_absence')].value, 0.2)
+        # Re-running the same night replaces the flags
+        self.assertEqual(analyze_school_attendance(school.id, run_date=date(2024, 9, 27)), 4)
+        self.assertEqual(AttendanceFlag.objects.filter(school=school).count(), 4)
+
+
+class AttendanceSyncTests(TestCase):
+    """Offline sync applies a batch last-writer-wins and returns server changes since a token"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Sync School', code='SYN', address='1 Main St', phone='555-0100', email='office@sync.test',
+            principal_name='Pat Principal', principal_email='principal@sync.test', principal_phone='555-0101',
+        )
+        cls.class_obj = Class.objects.create(school=cls.school, name='Grade 1', academic_year='2024-2025')
+        cls.marker = User.objects.create_user('sync-admin', role=User.UserRole.SCHOOL_ADMIN, school=cls.school)
+        cls.alice, cls.bob = [
+            Student.objects.create(
+                user=User.objects.create_user(username, role=User.UserRole.STUDENT, school=cls.school),
+                school=cls.school, current_class=cls.class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            for username in ('sync-alice', 'sync-bob')
+        ]
+
+    def sync(self, changes, token=None):
+        return sync_attendance(self.class_obj.id, changes, token, self.marker)
+
+    def test_last_writer_wins_and_changes_since_token(self):
+        day = timezone.localdate().isoformat()
+        first = self.sync([
+            [self.alice.id, day, 'a', 1000],
+            [self.alice.id, day, 'p', 2000],  # later in the same batch, wins
+            [self.bob.id, day, 'l', 1000],
+            [self.bob.id, 'not-a-date', 'p', 1000],
+            [999999, day, 'p', 1000],
+        ])
+        self.assertEqual((first['applied'], first['superseded']), (2, [0]))
+        self.assertEqual([index for index, _ in first['rejected']], [3, 4])
+        self.assertEqual(first['changes'], [])
+
+        # Another device marked Bob absent at 3000; a stale offline mark from 1500 loses
+        Attendance.objects.filter(student=self.bob).update(
+            status='absent', changed_at=datetime.fromtimestamp(3, tz=dt_timezone.utc),
+        )
+        second = self.sync([[self.bob.id, day, 'p', 1500]], token=first['token'])
+        self.assertEqual((second['applied'], second['superseded']), (0, [0]))
+        # Rows inside the token's overlap window may be re-sent, so only check Bob's winning mark
+        self.assertIn([self.bob.id, day, 'a', 3000, ''], second['changes'])
+        self.assertEqual(
+            dict(Attendance.objects.values_list('student_id', 'status')),
+            {self.alice.id: 'present', self.bob.id: 'absent'},
+        )
+
+    def test_a_concurrent_first_mark_is_compared(self):
+        day = timezone.localdate()
+
+        def concurrent_sync(class_id):
+            # Another device's newer mark of a new row commits while this sync waits for the lock
+            Attendance.objects.create(
+                student=self.alice, class_obj=self.class_obj, date=day, status='absent',
+                changed_at=datetime.fromtimestamp(3, tz=dt_timezone.utc),
+            )
+
+        with mock.patch('classes.attendance.lock_roll_call', concurrent_sync):
+            result = self.sync([[self.alice.id, day.isoformat(), 'p', 2000]])
+        self.assertEqual((result['applied'], result['superseded']), (0, [0]))
+        self.assertEqual(Attendance.objects.get(student=self.alice).status, 'absent')
+
+    def test_malformed_token(self):
+        with self.assertRaises(ValueError):
+            self.sync([], token='not-hex')
+
+
+class TimetableTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Timetable School', code='TTS', address='1 Main St', phone='555-0100', email='office@tt.test',
+            principal_name='Pat Principal', principal_email='principal@tt.test', principal_phone='555-0101',
+        )
+        cls.grade1, cls.grade2 = [
+            Class.objects.create(school=cls.school, name=name, academic_year='2024-2025') for name in ('Grade 1', 'Grade 2')
+        ]
+        cls.subject = Subject.objects.create(name='Maths', code='TT-MATH')
+        cls.ada, cls.bo = [
+            Teacher.objects.create(
+                user=User.objects.create_user(username, role=User.UserRole.TEACHER, school=cls.school),
+                employee_id=username, department='Maths', qualification='BSc',
+            )
+            for username in ('tt-ada', 'tt-bo')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def slot(self, class_obj, teacher, start, end, room='', day='monday'):
+        return {
+            'class_id': class_obj.id, 'subject_id': self.subject.id, 'teacher_id': teacher.id,
+            'day': day, 'start_time': start, 'end_time': end, 'room': room,
+        }
+
+
+class TimetableConflictTests(TimetableTestCase):
+    """Slots may not overlap for the same class, teacher or room"""
+
+    def test_serializer_rejects_overlaps(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = ClassScheduleSerializer(data={**self.slot(self.grade1, self.ada, '09:00', '10:00', 'R1'),
+                                                  'class_obj_id': self.grade1.id})
+            self.assertTrue(first.is_valid(), first.errors)
+            schedule = first.save()
+
+        for clash in [
+            self.slot(self.grade2, self.ada, '09:30', '10:30'),  # teacher double-booked
+            self.slot(self.grade2, self.bo, '08:30', '09:15', 'r1 '),  # room, matched case-insensitively
+            self.slot(self.grade1, self.bo, '09:59', '11:00'),  # class
+        ]:
+            serializer = ClassScheduleSerializer(data={**clash, 'class_obj_id': clash['class_id']})
+            self.assertFalse(serializer.is_valid(), clash)
+
+        for fine in [
+            self.slot(self.grade2, self.ada, '10:00', '11:00', 'R1'),  # back to back
+            self.slot(self.grade2, self.ada, '09:00', '10:00', 'R1', day='tuesday'),
+        ]:
+            serializer = ClassScheduleSerializer(data={**fine, 'class_obj_id': fine['class_id']})
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        # A slot never conflicts with itself when updated
+        moved = ClassScheduleSerializer(schedule, data={'start_time': '09:30', 'end_time': '10:30'}, partial=True)
+        self.assertTrue(moved.is_valid(), moved.errors)
+
+    def test_import_is_all_or_nothing(self):
+        ClassSchedule.objects.create(
+            class_obj=self.grade1, subject=self.subject, teacher=self.ada, day='monday',
+            start_time='09:00', end_time='10:00',
+        )
+        created, errors = import_timetable(self.school.id, [
+            self.slot(self.grade2, self.bo, '09:00', '10:00', 'R2'),
+            self.slot(self.grade2, self.ada, '09:30', '10:00'),  # clashes with the stored slot
+            self.slot(self.grade1, self.bo, '09:30', '10:30'),  # clashes with stored slot and with row 0
+            self.slot(self.grade1, self.bo, '11:00', '10:00'),
+        ])
+        self.assertEqual(created, [])
+        self.assertEqual([error['index'] for error in errors], [1, 2, 3])
+        self.assertEqual(len(errors[1]['errors']), 2)
+        self.assertEqual(ClassSchedule.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created, errors = import_timetable(self.school.id, [
+                self.slot(self.grade1, self.ada, '09:00', '10:00'),
+                self.slot(self.grade2, self.bo, '09:00', '10:00'),
+            ], replace=True)
+        self.assertEqual((len(created), errors), (2, []))
+        self.assertEqual(ClassSchedule.objects.count(), 2)
+
+
+    def test_overlapping_legacy_rows(self):
+        # Saved before conflicts were checked: the long slot covers the short one
+        long_slot, short_slot = [
+            ClassSchedule.objects.create(
+                class_obj=self.grade1, subject=self.subject, teacher=teacher, day='monday',
+                start_time=start, end_time=end,
+            )
+            for teacher, start, end in [(self.ada, '08:00', '12:00'), (self.bo, '09:00', '09:30')]
+        ]
+        candidate = Slot(self.grade1.id, self.bo.id, '', 'monday', time(10), time(11))
+        self.assertEqual(find_conflicts(self.school.id, candidate), [('class', long_slot.id)])
+        self.assertEqual(
+            sorted(find_conflicts(self.school.id, candidate._replace(start=time(9), end=time(9, 15)))),
+            [('class', long_slot.id), ('class', short_slot.id), ('teacher', short_slot.id)],
+        )
+        serializer = ClassScheduleSerializer(data={**self.slot(self.grade1, self.bo, '10:00', '11:00'),
+                                                   'class_obj_id': self.grade1.id})
+        self.assertFalse(serializer.is_valid())
+
+        intervals = IntervalList()
+        for start, end, slot_id in [(8, 12, 'a'), (9, 10, 'b'), (13, 14, 'c')]:
+            intervals.add(time(start), time(end), slot_id)
+        self.assertEqual(intervals.overlapping(time(11), time(13, 30)), ['a', 'c'])
+        intervals.remove(time(8), 'a')
+        self.assertEqual(intervals.overlapping(time(11), time(12)), [])
+        self.assertEqual(intervals.overlapping(time(9, 30), time(12)), ['b'])
+
+    def test_write_is_checked_against_the_database(self):
+        serializer = ClassScheduleSerializer(data={**self.slot(self.grade1, self.ada, '09:00', '10:00'),
+                                                   'class_obj_id': self.grade1.id})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        # Written meanwhile by another process, whose version bump this process's index has not seen
+        ClassSchedule.objects.create(
+            class_obj=self.grade2, subject=self.subject, teacher=self.ada, day='monday',
+            start_time='09:30', end_time='10:30',
+        )
+        self.assertEqual(find_conflicts(self.school.id, Slot(
+            self.grade1.id, self.ada.id, '', 'monday', time(9), time(10),
+        )), [])
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.assertEqual(ClassSchedule.objects.filter(class_obj=self.grade1).count(), 0)
+
+        # An index older than TIMETABLE_INDEX_MAX_AGE is rebuilt
+        with override_settings(TIMETABLE_INDEX_MAX_AGE=-1):
+            self.assertEqual(len(find_conflicts(self.school.id, Slot(
+                self.grade1.id, self.ada.id, '', 'monday', time(9), time(10),
+            ))), 1)
+
+
+class TimetableSolverTests(TimetableTestCase):
+    """The generator fills a tight week without clashes and commits it in one go"""
+
+    def test_generates_a_conflict_free_week(self):
+        science = Subject.objects.create(name='Science', code='TT-SCI')
+        for class_obj in (self.grade1, self.grade2):
+            ClassSubject.objects.create(class_obj=class_obj, subject=self.subject, teacher=self.ada)
+            ClassSubject.objects.create(class_obj=class_obj, subject=science, teacher=self.bo)
+        # Kept as is: blocks Ada on Monday morning
+        other = Class.objects.create(school=self.school, name='Grade 3', academic_year='2024-2025')
+        ClassSchedule.objects.create(
+            class_obj=other, subject=self.subject, teacher=self.ada, day='monday', start_time='08:00', end_time='09:00',
+        )
+        options = {
+            'days': ['monday', 'tuesday'], 'periods': [('08:00', '09:00'), ('09:00', '10:00'), ('10:00', '11:00')],
+            'weekly_periods': {science.id: 2}, 'default_weekly_periods': 2,
+            'subject_rooms': {science.id: ['Lab']}, 'class_ids': [self.grade1.id, self.grade2.id], 'seed': 7,
+        }
+        progress = []
+        with self.captureOnCommitCallbacks(execute=True):
+            result = generate_timetable(self.school.id, progress=lambda placed, total: progress.append(placed), **options)
+        self.assertTrue(result['complete'], result)
+        self.assertEqual((result['placed'], result['created'], result['errors']), (8, 8, []))
+        self.assertEqual(progress[-1], 8)
+
+        slots = list(ClassSchedule.objects.exclude(class_obj=other).values_list(
+            'class_obj_id', 'teacher_id', 'room', 'day', 'start_time',
+        ))
+        self.assertEqual(len(slots), 8)
+        for position in [(0, 3, 4), (1, 3, 4)]:
+            keys = [tuple(slot[i] for i in position) for slot in slots]
+            self.assertEqual(len(keys), len(set(keys)))
+        self.assertNotIn((self.ada.id, 'monday'), {(t, d) for _, t, _, d, start in slots if start.hour == 8})
+        self.assertEqual({room for _, teacher, room, _, _ in slots if teacher == self.bo.id}, {'Lab'})
+
+        # Eight Maths lessons for Ada cannot fit in the five periods she has free
+        result = generate_timetable(self.school.id, **{**options, 'weekly_periods': {science.id: 2, self.subject.id: 4}})
+        self.assertFalse(result['complete'])
+        self.assertEqual(result['created'], 0)
+        self.assertIn(f'Teacher {self.ada.id} needs 8 lessons but only 5 periods are free.', result['errors'])
+
+
+
+class TimetableGenerateViewTests(TimetableTestCase):
+    """Queued solves are only reported to the school that queued them, whatever their state"""
+
+    def setUp(self):
+        super().setUp()
+        other = School.objects.create(
+            name='Other School', code='OTS', address='-', phone='-', email='office@ots.test',
+            principal_name='-', principal_email='principal@ots.test', principal_phone='-',
+        )
+        plan = SubscriptionPlan.objects.create(name='basic')
+        for school in (self.school, other):
+            Subscription.objects.create(
+                school=school, plan=plan, status=Subscription.Status.ACTIVE,
+                start_date=date(2024, 1, 1), end_date=date(2099, 1, 1), amount=0,
+            )
+        self.admin = User.objects.create_user('tt-admin', role=User.UserRole.SCHOOL_ADMIN, school=self.school)
+        self.outsider = User.objects.create_user('tt-outsider', role=User.UserRole.SCHOOL_ADMIN, school=other)
+        self.client = APIClient()
+
+    def request(self, user, method, action, data):
+        self.client.force_authenticate(user)
+        return getattr(self.client, method)(f'/api/v1/classes/schedules/{action}/', data, format='json')
+
+    def test_status_is_checked_for_every_state(self):
+        with mock.patch('classes.views.generate_school_timetable.delay', return_value=SimpleNamespace(id='solve-1')):
+            response = self.request(self.admin, 'post', 'generate', {})
+        self.assertEqual(response.data, {'task_id': 'solve-1'})
+
+        failed = mock.Mock(state='FAILURE', info=RuntimeError('solver crashed'))
+        failed.failed.return_value = True
+        with mock.patch('celery.result.AsyncResult', return_value=failed):
+            schoolless = User.objects.create_user('tt-schoolless', role=User.UserRole.SCHOOL_ADMIN)
+            self.assertEqual(self.request(schoolless, 'get', 'generate_status', {'task_id': 'solve-1'}).status_code, 403)
+            self.assertEqual(self.request(self.outsider, 'get', 'generate_status', {'task_id': 'solve-1'}).status_code, 404)
+            self.assertEqual(self.request(self.admin, 'get', 'generate_status', {'task_id': 'unknown'}).status_code, 404)
+            response = self.request(self.admin, 'get', 'generate_status', {'task_id': 'solve-1'})
+        self.assertEqual((response.data['state'], response.data['error']), ('FAILURE', 'solver crashed'))
+
+    def test_invalid_school_id_is_a_bad_request(self):
+        admin = User.objects.create_user('tt-super', role=User.UserRole.SUPER_ADMIN)
+        self.assertEqual(self.request(admin, 'post', 'generate', {'school_id': 'abc'}).status_code, 400)
+        self.assertEqual(self.request(admin, 'get', 'generate_status', {'school_id': 'abc', 'task_id': 'x'}).status_code, 400)
+
+class ClassSerializerQueryTests(TimetableTestCase):
+    """Class counts come from annotations, so a page costs the same whatever its size"""
+
+    def test_counts_are_annotated(self):
+        for class_obj, teacher in [(self.grade1, self.ada), (self.grade2, self.bo)]:
+            ClassSubject.objects.create(class_obj=class_obj, subject=self.subject, teacher=teacher)
+        Student.objects.create(
+            user=User.objects.create_user('tt-student', role=User.UserRole.STUDENT, school=self.school),
+            school=self.school, current_class=self.grade1, date_of_birth=date(2010, 1, 1),
+            gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+        )
+
+        with self.assertNumQueries(1):
+            data = ClassSerializer(Class.objects.with_counts().order_by('name'), many=True).data
+        self.assertEqual(
+            [(row['name'], row['students_count'], row['subjects_count'], row['school_name']) for row in data],
+            [('Grade 1', 1, 1, 'Timetable School'), ('Grade 2', 0, 1, 'Timetable School')],
+        )
+
+        class_subjects = ClassSubject.objects.select_related('subject', 'teacher__user').prefetch_related(
+            with_class_counts('class_obj'),
+        )
+        with self.assertNumQueries(2):
+            data = ClassSubjectSerializer(class_subjects, many=True).data
+        self.assertEqual(sorted(row['class_obj']['students_count'] for row in data), [0, 1])
+
+
+class AcademicYearRolloverTests(TimetableTestCase):
+    """A rollover clones the year's classes with their assignments and moves students up"""
+
+    def test_dry_run_then_rollover(self):
+        from fees.models import FeeCategory, FeeStructure
+
+        ClassSubject.objects.create(class_obj=self.grade1, subject=self.subject, teacher=self.ada)
+        ClassSchedule.objects.create(
+            class_obj=self.grade1, subject=self.subject, teacher=self.ada, day='monday',
+            start_time='09:00', end_time='10:00',
+        )
+        FeeStructure.objects.create(
+            class_obj=self.grade1, category=FeeCategory.objects.create(name='Tuition'), amount=100,
+            academic_year='2024-2025',
+        )
+        self.ada.head_teacher_classes.add(self.grade2)
+        first, repeater, last = [
+            Student.objects.create(
+                user=User.objects.create_user(username, role=User.UserRole.STUDENT, school=self.school),
+                school=self.school, current_class=class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year=year,
+            )
+            for username, class_obj, year in [
+                ('ro-first', self.grade1, '1'), ('ro-repeater', self.grade1, '1'), ('ro-last', self.grade2, '2'),
+            ]
+        ]
+
+        summary = rollover_academic_year(self.school.id, '2024-2025', '2025-2026', repeat=[repeater.id], dry_run=True)
+        self.assertEqual(summary['totals'], {
+            'classes': 2, 'subjects': 1, 'schedules': 1, 'fee_structures': 1, 'head_teachers': 1,
+            'students_promoted': 1, 'students_repeating': 1, 'students_graduated': 1,
+        })
+        self.assertEqual([c['promotes_to'] for c in summary['classes']], ['Grade 2', 'graduate'])
+        self.assertFalse(Class.objects.filter(academic_year='2025-2026').exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rollover_academic_year(self.school.id, '2024-2025', '2025-2026', repeat=[repeater.id])
+        new1, new2 = Class.objects.filter(academic_year='2025-2026').order_by('name')
+        self.assertEqual(new1.subjects.get().teacher, self.ada)
+        self.assertEqual(new1.fee_structures.get().academic_year, '2025-2026')
+        self.assertEqual(list(self.ada.head_teacher_classes.order_by('id')), [self.grade2, new2])
+        self.assertEqual(list(ClassSchedule.objects.filter(is_active=True).values_list('class_obj', flat=True)), [new1.id])
+        self.assertFalse(Class.objects.filter(academic_year='2024-2025', is_active=True).exists())
+
+        students = {s.id: s for s in Student.objects.all()}
+        self.assertEqual((students[first.id].current_class_id, students[first.id].year), (new2.id, '2'))
+        self.assertEqual((students[repeater.id].current_class_id, students[repeater.id].year), (new1.id, '1'))
+        self.assertEqual(
+            (students[last.id].current_class_id, students[last.id].academic_status), (self.grade2.id, 'graduated'),
+        )
+
+        with self.assertRaises(ValueError):
+            rollover_academic_year(self.school.id, '2024-2025', '2025-2026')
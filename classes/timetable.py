@@ -0,0 +1,330 @@
+"""
+Timetable conflict detection and bulk import.
+
+ClassSchedule's unique key only stops a class from having two slots with the
+same start time. TimetableIndex holds a school's active slots as start-sorted
+interval lists, one per (class, day), (teacher, day) and (room, day). Slots
+saved before conflicts were checked may overlap each other, so every list
+also keeps the running maximum end time of its prefix: the slots overlapping
+a candidate are the ones starting before it ends, scanning back from its
+bisect position only while that maximum still reaches past its start.
+
+Each process keeps one index per school, built from the database in a single
+query. A per-school version in the cache is bumped when a ClassSchedule write
+commits (core.signals); the writing process applies the change to its own
+index in place, and any other process finds its version stale and rebuilds on
+its next check. With a per-process cache the other processes never see the
+bump, so an index is also rebuilt once it is TIMETABLE_INDEX_MAX_AGE seconds
+old.
+
+The index only gives validation a fast answer. The decision is made when the
+slot is written: check_slot locks the school row and checks the candidate
+against the database in the write transaction, so two concurrent writes of
+clashing slots cannot both pass. import_timetable validates a whole batch
+against an index built under the same lock and inserts it with bulk_create.
+"""
+
+import bisect
+import datetime
+import random
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Class, ClassSchedule
+
+Slot = namedtuple('Slot', ['class_id', 'teacher_id', 'room', 'day', 'start', 'end'])
+
+SLOT_FIELDS = ['class_id', 'subject_id', 'teacher_id', 'day', 'start_time', 'end_time']
+
+
+class IntervalList:
+    """[start, end) intervals of one resource on one day, sorted by start"""
+
+    def __init__(self):
+        self.starts = []
+        self.entries = []  # (start, end, slot id), parallel to starts
+        self.max_ends = []  # max_ends[i] is the latest end among entries[:i + 1]
+
+    def overlapping(self, start, end, exclude=None):
+        """Ids of the intervals overlapping [start, end), ignoring ``exclude``"""
+        position = bisect.bisect_left(self.starts, start)
+        found = []
+        # Earlier intervals can only reach past start while the prefix maximum does
+        before = position - 1
+        while before >= 0 and self.max_ends[before] > start:
+            if self.entries[before][1] > start and self.entries[before][2] != exclude:
+                found.append(self.entries[before][2])
+            before -= 1
+        found.reverse()
+        while position < len(self.entries) and self.entries[position][0] < end:
+            if self.entries[position][2] != exclude:
+                found.append(self.entries[position][2])
+            position += 1
+        return found
+
+    def add(self, start, end, slot_id):
+        position = bisect.bisect_right(self.starts, start)
+        self.starts.insert(position, start)
+        self.entries.insert(position, (start, end, slot_id))
+        self.max_ends.insert(position, end)
+        self._update_max_ends(position)
+
+    def remove(self, start, slot_id):
+        position = bisect.bisect_left(self.starts, start)
+        while position < len(self.entries) and self.entries[position][0] == start:
+            if self.entries[position][2] == slot_id:
+                del self.starts[position]
+                del self.entries[position]
+                del self.max_ends[position]
+                self._update_max_ends(position)
+                return
+            position += 1
+
+    def _update_max_ends(self, position):
+        latest = self.max_ends[position - 1] if position else None
+        for index in range(position, len(self.entries)):
+            end = self.entries[index][1]
+            latest = end if latest is None or end > latest else latest
+            self.max_ends[index] = latest
+
+
+def _resource_keys(slot):
+    keys = [('class', slot.class_id, slot.day), ('teacher', slot.teacher_id, slot.day)]
+    room = (slot.room or '').strip().lower()
+    if room:
+        keys.append(('room', room, slot.day))
+    return keys
+
+
+class TimetableIndex:
+    """Interval lists for every class, teacher and room of one school"""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.lists = defaultdict(IntervalList)
+        self.slots = {}
+
+    @classmethod
+    def build(cls, school_id, version=None, exclude_class_ids=()):
+        index = cls(version)
+        rows = ClassSchedule.objects.filter(class_obj__school_id=school_id, is_active=True)
+        if exclude_class_ids:
+            rows = rows.exclude(class_obj_id__in=exclude_class_ids)
+        for slot_id, *values in rows.values_list(
+            'id', 'class_obj_id', 'teacher_id', 'room', 'day', 'start_time', 'end_time',
+        ).order_by():
+            index.add(slot_id, Slot(*values))
+        return index
+
+    def conflicts(self, slot, exclude=None):
+        """(resource kind, slot id) for every indexed slot that clashes with ``slot``"""
+        found = []
+        for key in _resource_keys(slot):
+            found.extend((key[0], slot_id) for slot_id in self.lists[key].overlapping(slot.start, slot.end, exclude))
+        return found
+
+    def add(self, slot_id, slot):
+        self.slots[slot_id] = slot
+        for key in _resource_keys(slot):
+            self.lists[key].add(slot.start, slot.end, slot_id)
+
+    def remove(self, slot_id):
+        slot = self.slots.pop(slot_id, None)
+        if slot is not None:
+            for key in _resource_keys(slot):
+                self.lists[key].remove(slot.start, slot_id)
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _version_key(school_id):
+    return f'timetable_version:{school_id}'
+
+
+def _current_version(school_id):
+    key = _version_key(school_id)
+    version = cache.get(key)
+    if version is None:
+        # A random base, so an index built before the cache was cleared never matches by accident
+        cache.add(key, random.randrange(1 << 40), None)
+        version = cache.get(key)
+    return version
+
+
+def find_conflicts(school_id, slot, exclude=None):
+    """Conflicts of a slot with the school's current timetable"""
+    with _lock:
+        version = _current_version(school_id)
+        index = _indexes.get(school_id)
+        if (index is None or index.version != version
+                or time.monotonic() - index.built_at > settings.TIMETABLE_INDEX_MAX_AGE):
+            index = _indexes[school_id] = TimetableIndex.build(school_id, version)
+        return index.conflicts(slot, exclude)
+
+
+def lock_timetable(school_id):
+    """
+    Lock the school row for the rest of the transaction, serializing timetable
+    writers of the school. A class row is not enough: teachers and rooms are
+    shared between the school's classes.
+    """
+    from schools.models import School
+    list(School.objects.select_for_update().filter(pk=school_id).values_list('pk', flat=True))
+
+
+def check_slot(school_id, slot, exclude=None):
+    """
+    Lock the school's timetable and return the conflicts of a slot with the
+    database; call inside the transaction that writes the slot.
+    """
+    lock_timetable(school_id)
+    index = TimetableIndex()
+    for slot_id, *values in ClassSchedule.objects.filter(
+        class_obj__school_id=school_id, is_active=True, day=slot.day,
+        start_time__lt=slot.end, end_time__gt=slot.start,
+    ).exclude(pk=exclude).values_list(
+        'id', 'class_obj_id', 'teacher_id', 'room', 'day', 'start_time', 'end_time',
+    ).order_by():
+        index.add(slot_id, Slot(*values))
+    return index.conflicts(slot)
+
+
+def schedule_changed(school_id, slot_id=None, slot=None):
+    """
+    Record a committed write to one slot; ``slot`` is None once it is deleted or inactive.
+
+    Bumps the school's version; this process's index is updated in place when
+    it was current before the write, and dropped otherwise. Without a
+    ``slot_id`` (bulk writes) the index is always dropped.
+    """
+    if school_id is None:
+        return
+    key = _version_key(school_id)
+    with _lock:
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            _indexes.pop(school_id, None)
+            return
+        index = _indexes.get(school_id)
+        if slot_id is None or index is None or index.version != version - 1:
+            _indexes.pop(school_id, None)
+            return
+        index.remove(slot_id)
+        if slot is not None:
+            index.add(slot_id, slot)
+        index.version = version
+
+
+def schedule_slot(schedule):
+    """The indexed view of a ClassSchedule, or None when it takes no time in the timetable"""
+    if not schedule.is_active:
+        return None
+    return Slot(
+        schedule.class_obj_id, schedule.teacher_id, schedule.room, schedule.day,
+        schedule.start_time, schedule.end_time,
+    )
+
+
+def describe_conflict(kind, slot_id):
+    if isinstance(slot_id, str):
+        return f'Overlaps {slot_id} of this import for the same {kind}.'
+    return f'Overlaps schedule {slot_id} for the same {kind}.'
+
+
+def parse_time(value):
+    if isinstance(value, datetime.time):
+        return value
+    try:
+        return datetime.time.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def import_timetable(school_id, rows, replace=False):
+    """
+    Validate a batch of slots for a school and insert them together.
+
+    ``rows`` are dicts with class_id, subject_id, teacher_id, day, start_time,
+    end_time and optionally room. Every row is checked against the school's
+    timetable and against the other rows. Returns ``(created, errors)`` where
+    ``errors`` is a list of ``{'index', 'errors'}``; nothing is written unless
+    every row is valid. With ``replace`` the existing slots of the classes in
+    the batch are deleted first and not checked against.
+    """
+    from users.models import Teacher
+    from .models import Subject
+
+    def ids(field):
+        values = set()
+        for row in rows:
+            try:
+                values.add(int(row.get(field)))
+            except (TypeError, ValueError):
+                pass
+        return values
+
+    class_ids = set(Class.objects.filter(school_id=school_id, id__in=ids('class_id')).values_list('id', flat=True))
+    subject_ids = set(Subject.objects.filter(id__in=ids('subject_id')).values_list('id', flat=True))
+    teacher_ids = set(
+        Teacher.objects.filter(user__school_id=school_id, id__in=ids('teacher_id')).values_list('id', flat=True),
+    )
+    with transaction.atomic():
+        lock_timetable(school_id)
+        index = TimetableIndex.build(school_id, exclude_class_ids=class_ids if replace else ())
+        schedules, errors = _import_rows(rows, index, class_ids, subject_ids, teacher_ids)
+        if errors:
+            return [], errors
+        if replace:
+            ClassSchedule.objects.filter(class_obj_id__in=class_ids).delete()
+        created = ClassSchedule.objects.bulk_create(schedules, batch_size=1000)
+        # bulk_create sends no signals; other processes rebuild on their next check
+        transaction.on_commit(lambda: schedule_changed(school_id))
+    return created, []
+
+
+def _import_rows(rows, index, class_ids, subject_ids, teacher_ids):
+    """Check import rows against the index and each other; returns (unsaved schedules, errors)"""
+    schedules, errors = [], []
+    for position, row in enumerate(rows):
+        row_errors = [f'{field} is required.' for field in SLOT_FIELDS if row.get(field) in (None, '')]
+        if not row_errors:
+            start, end = parse_time(row['start_time']), parse_time(row['end_time'])
+            day = str(row['day']).lower()
+            for field, known in [('class_id', class_ids), ('subject_id', subject_ids), ('teacher_id', teacher_ids)]:
+                try:
+                    if int(row[field]) not in known:
+                        row_errors.append(f'Unknown {field} {row[field]}.')
+                except (TypeError, ValueError):
+                    row_errors.append(f'Invalid {field}.')
+            if day not in ClassSchedule.DayOfWeek.values:
+                row_errors.append(f'Invalid day "{row["day"]}".')
+            if start is None or end is None:
+                row_errors.append('Times must be HH:MM.')
+            elif start >= end:
+                row_errors.append('End time must be after start time.')
+        if row_errors:
+            errors.append({'index': position, 'errors': row_errors})
+            continue
+
+        slot = Slot(int(row['class_id']), int(row['teacher_id']), row.get('room') or '', day, start, end)
+        conflicts = index.conflicts(slot)
+        if conflicts:
+            errors.append({'index': position, 'errors': [describe_conflict(*conflict) for conflict in conflicts]})
+            continue
+        # Later rows are checked against this one as well
+        index.add(f'row {position}', slot)
+        schedules.append(ClassSchedule(
+            class_obj_id=slot.class_id, subject_id=int(row['subject_id']), teacher_id=slot.teacher_id,
+            day=day, start_time=start, end_time=end, room=slot.room,
+        ))
+
+    return schedules, errors
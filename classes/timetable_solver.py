@@ -0,0 +1,272 @@
+"""
+Automatic timetable generation.
+
+solve_timetable builds a week of slots for a school's classes from their
+ClassSubject assignments. The week is a grid of days x periods; each
+ClassSubject needs a number of lessons a week, and a lesson takes one cell of
+the grid. No two lessons may share a cell with the same class, teacher or
+room, and cells where a teacher or room is already booked by a class outside
+the run are blocked.
+
+The search is a greedy construction followed by min-conflicts repair:
+
+* lessons are queued hardest first (busiest teacher, fewest allowed rooms);
+* a lesson goes into the free cell that best spreads its subject over the
+  week and the class's load over the days;
+* a lesson with no free cell takes the cell with the fewest clashes, and the
+  lessons it displaces go back to the front of the queue; a displaced lesson
+  may not return to the cell it lost for TABU_TENURE steps, which stops two
+  lessons from swapping the same cell forever.
+
+The search stops when every lesson is placed or the time budget runs out, and
+the best placement seen is returned. generate_timetable commits a complete
+result through import_timetable, which checks it against the interval index
+once more and writes it with bulk_create.
+"""
+
+import random
+import time
+from collections import defaultdict, deque
+
+from .models import Class, ClassSchedule, ClassSubject
+from .timetable import import_timetable, parse_time
+
+DEFAULT_DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+DEFAULT_PERIODS = [
+    ('08:00', '08:45'), ('08:50', '09:35'), ('09:40', '10:25'), ('10:45', '11:30'),
+    ('11:35', '12:20'), ('13:00', '13:45'), ('13:50', '14:35'), ('14:40', '15:25'),
+]
+DEFAULT_WEEKLY_PERIODS = 4
+DEFAULT_TIME_BUDGET = 50  # seconds
+MAX_TIME_BUDGET = 300
+TABU_TENURE = 10
+PROGRESS_EVERY = 250  # search steps
+
+
+def _room_key(room):
+    return (room or '').strip().lower()
+
+
+def parse_options(data):
+    """Validate generator options from a request body; raises ValueError"""
+    options = {}
+    days = data.get('days') or DEFAULT_DAYS
+    if not isinstance(days, list) or any(str(day).lower() not in ClassSchedule.DayOfWeek.values for day in days):
+        raise ValueError('days must be a list of weekday names')
+    options['days'] = [str(day).lower() for day in days]
+
+    periods = data.get('periods') or DEFAULT_PERIODS
+    parsed = []
+    for period in periods if isinstance(periods, list) else [None]:
+        start, end = (period if isinstance(period, (list, tuple)) and len(period) == 2 else (None, None))
+        start, end = parse_time(start), parse_time(end)
+        if start is None or end is None or start >= end:
+            raise ValueError('periods must be a list of [start, end] times')
+        parsed.append((start.strftime('%H:%M'), end.strftime('%H:%M')))
+    options['periods'] = sorted(parsed)
+
+    def id_map(name, convert):
+        value = data.get(name) or {}
+        if not isinstance(value, dict):
+            raise ValueError(f'{name} must be an object')
+        try:
+            return {int(key): convert(item) for key, item in value.items()}
+        except (TypeError, ValueError):
+            raise ValueError(f'{name} has an invalid entry')
+
+    options['weekly_periods'] = id_map('weekly_periods', int)
+    options['subject_rooms'] = id_map('subject_rooms', lambda rooms: [str(room) for room in rooms if str(room).strip()])
+    options['class_rooms'] = id_map('class_rooms', str)
+    try:
+        options['default_weekly_periods'] = int(data.get('default_weekly_periods', DEFAULT_WEEKLY_PERIODS))
+        options['time_budget'] = min(float(data.get('time_budget', DEFAULT_TIME_BUDGET)), MAX_TIME_BUDGET)
+        class_ids = data.get('class_ids')
+        options['class_ids'] = [int(class_id) for class_id in class_ids] if class_ids else None
+    except (TypeError, ValueError):
+        raise ValueError('default_weekly_periods, time_budget and class_ids must be numbers')
+    return options
+
+
+def solve_timetable(school_id, days=DEFAULT_DAYS, periods=DEFAULT_PERIODS, weekly_periods=None,
+                    default_weekly_periods=DEFAULT_WEEKLY_PERIODS, subject_rooms=None, class_rooms=None,
+                    class_ids=None, time_budget=DEFAULT_TIME_BUDGET, progress=None, seed=None):
+    """
+    Place every lesson of a school's classes in a conflict-free weekly grid.
+
+    ``weekly_periods`` maps subject ids to lessons a week (default
+    ``default_weekly_periods``), ``subject_rooms`` maps subject ids to the
+    rooms they must be taught in and ``class_rooms`` gives classes a home room
+    for every other subject. ``progress(placed, total)`` is called as the
+    search advances. Returns a dict with ``complete``, the ``slots`` as
+    import_timetable rows, the ``unplaced`` lessons and any ``errors`` that
+    make the problem infeasible up front.
+    """
+    started = time.monotonic()
+    weekly_periods, subject_rooms, class_rooms = weekly_periods or {}, subject_rooms or {}, class_rooms or {}
+    rng = random.Random(seed)
+    periods = [(parse_time(start), parse_time(end)) for start, end in periods]
+    cells = [(day, period) for day in range(len(days)) for period in range(len(periods))]
+
+    classes = Class.objects.filter(school_id=school_id, is_active=True)
+    if class_ids is not None:
+        classes = classes.filter(id__in=class_ids)
+    assignments = list(ClassSubject.objects.filter(
+        class_obj__in=classes, teacher__isnull=False,
+    ).values_list('class_obj_id', 'subject_id', 'teacher_id').order_by('class_obj_id', 'subject_id'))
+
+    # One entry per lesson: (class, subject, teacher, allowed rooms)
+    lessons = []
+    for class_id, subject_id, teacher_id in assignments:
+        rooms = subject_rooms.get(subject_id) or ([class_rooms[class_id]] if class_rooms.get(class_id) else [])
+        lessons.extend(
+            (class_id, subject_id, teacher_id, rooms)
+            for _ in range(weekly_periods.get(subject_id, default_weekly_periods))
+        )
+    run_class_ids = {class_id for class_id, _, _ in assignments}
+
+    # Cells already taken by teachers and rooms in timetables this run keeps
+    blocked = set()
+    for teacher_id, room, day, start, end in ClassSchedule.objects.filter(
+        class_obj__school_id=school_id, is_active=True, day__in=days,
+    ).exclude(class_obj_id__in=run_class_ids).values_list('teacher_id', 'room', 'day', 'start_time', 'end_time'):
+        for period, (period_start, period_end) in enumerate(periods):
+            if period_start < end and start < period_end:
+                cell = (days.index(day), period)
+                blocked.add(('teacher', teacher_id, cell))
+                if _room_key(room):
+                    blocked.add(('room', _room_key(room), cell))
+
+    errors = []
+    for kind, position in [('class', 0), ('teacher', 2)]:
+        load = defaultdict(int)
+        for lesson in lessons:
+            load[lesson[position]] += 1
+        for resource_id, count in load.items():
+            free = sum(1 for cell in cells if ('teacher', resource_id, cell) not in blocked) if kind == 'teacher' else len(cells)
+            if count > free:
+                errors.append(f'{kind.capitalize()} {resource_id} needs {count} lessons but only {free} periods are free.')
+    if errors:
+        return {'complete': False, 'slots': [], 'unplaced': [], 'errors': errors, 'total': len(lessons), 'placed': 0}
+
+    teacher_load = defaultdict(int)
+    for lesson in lessons:
+        teacher_load[lesson[2]] += 1
+
+    occupant = {}  # (kind, resource, cell) -> lesson index
+    placement = {}  # lesson index -> (cell, room)
+    subject_days = defaultdict(int)  # (class, subject, day) -> lessons
+    class_days = defaultdict(int)  # (class, day) -> lessons
+    tabu = {}  # (lesson index, cell) -> step it is allowed back
+
+    def resources(index, cell, room):
+        class_id, _, teacher_id, _ = lessons[index]
+        keys = [('class', class_id, cell), ('teacher', teacher_id, cell)]
+        if room:
+            keys.append(('room', _room_key(room), cell))
+        return keys
+
+    def place(index, cell, room):
+        for key in resources(index, cell, room):
+            occupant[key] = index
+        placement[index] = (cell, room)
+        class_id, subject_id = lessons[index][:2]
+        subject_days[class_id, subject_id, cell[0]] += 1
+        class_days[class_id, cell[0]] += 1
+
+    def unplace(index, step):
+        cell, room = placement.pop(index)
+        for key in resources(index, cell, room):
+            del occupant[key]
+        class_id, subject_id = lessons[index][:2]
+        subject_days[class_id, subject_id, cell[0]] -= 1
+        class_days[class_id, cell[0]] -= 1
+        tabu[index, cell] = step + TABU_TENURE
+
+    def best_cell(index, step):
+        class_id, subject_id, teacher_id, rooms = lessons[index]
+        best, best_score = None, None
+        for cell in cells:
+            if ('teacher', teacher_id, cell) in blocked or (step and tabu.get((index, cell), 0) > step):
+                continue
+            clashes = {occupant.get(('class', class_id, cell)), occupant.get(('teacher', teacher_id, cell))}
+            room = ''
+            if rooms:
+                open_rooms = [room for room in rooms if ('room', _room_key(room), cell) not in blocked]
+                if not open_rooms:
+                    continue
+                room = min(open_rooms, key=lambda room: ('room', _room_key(room), cell) in occupant)
+                clashes.add(occupant.get(('room', _room_key(room), cell)))
+            clashes.discard(None)
+            score = (len(clashes), subject_days[class_id, subject_id, cell[0]], class_days[class_id, cell[0]], rng.random())
+            if best_score is None or score < best_score:
+                best, best_score = (cell, room, clashes), score
+        return best
+
+    queue = deque(sorted(
+        range(len(lessons)),
+        key=lambda index: (len(lessons[index][3]) or len(cells), -teacher_load[lessons[index][2]]),
+    ))
+    best_placement, step = dict(placement), 0
+    deadline = started + time_budget
+    while queue and time.monotonic() < deadline:
+        step += 1
+        index = queue.popleft()
+        # When every open cell is tabu, the tabu list gives way
+        choice = best_cell(index, step) or best_cell(index, 0)
+        if choice is None:
+            # No cell has a free room for this lesson; it stays unplaced
+            continue
+        cell, room, clashes = choice
+        for other in clashes:
+            unplace(other, step)
+            queue.appendleft(other)
+        place(index, cell, room)
+        if len(placement) > len(best_placement):
+            best_placement = dict(placement)
+        if progress and step % PROGRESS_EVERY == 0:
+            progress(len(placement), len(lessons))
+    if len(placement) >= len(best_placement):
+        best_placement = placement
+    if progress:
+        progress(len(best_placement), len(lessons))
+
+    slots = []
+    for index, ((day, period), room) in sorted(best_placement.items()):
+        class_id, subject_id, teacher_id, _ = lessons[index]
+        start, end = periods[period]
+        slots.append({
+            'class_id': class_id, 'subject_id': subject_id, 'teacher_id': teacher_id, 'day': days[day],
+            'start_time': start.strftime('%H:%M'), 'end_time': end.strftime('%H:%M'), 'room': room,
+        })
+    unplaced = defaultdict(int)
+    for index in range(len(lessons)):
+        if index not in best_placement:
+            unplaced[lessons[index][:3]] += 1
+    return {
+        'complete': not unplaced,
+        'slots': slots,
+        'unplaced': [
+            {'class_id': class_id, 'subject_id': subject_id, 'teacher_id': teacher_id, 'lessons': count}
+            for (class_id, subject_id, teacher_id), count in sorted(unplaced.items())
+        ],
+        'errors': [],
+        'total': len(lessons),
+        'placed': len(best_placement),
+        'elapsed': round(time.monotonic() - started, 2),
+    }
+
+
+def generate_timetable(school_id, commit=True, **options):
+    """Solve a school's timetable and, when complete, replace its classes' slots with the result"""
+    result = solve_timetable(school_id, **options)
+    slots = result.pop('slots')
+    result.update(school_id=school_id, created=0)
+    if commit and result['complete'] and slots:
+        created, errors = import_timetable(school_id, slots, replace=True)
+        result['created'] = len(created)
+        result['errors'] = [
+            f"Slot {error['index']}: {' '.join(error['errors'])}" for error in errors
+        ]
+    elif not commit:
+        result['slots'] = slots
+    return result
@@ -1,15 +1,31 @@
+from collections import Counter
+from datetime import timedelta
+
 from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
+from django.db import transaction
 from django.db.models import Q, Count
+from django.utils import timezone
 from .models import Class, Subject, ClassSubject, ClassSchedule, Attendance, Assignment, AssignmentSubmission
 from .serializers import (
     ClassSerializer, SubjectSerializer, ClassSubjectSerializer, ClassScheduleSerializer, 
-    AttendanceSerializer, AssignmentSerializer, AssignmentSubmissionSerializer
+    AttendanceSerializer, AssignmentSerializer, AssignmentSubmissionSerializer, with_class_counts
 )
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from core.background import remember_task_school, task_visible_to
+from core.dashboard import invalidate_tiles
+from core.permissions import school_id_param
+from core.scope import UserScope
+from schools.stats import apply_deltas
+from . import attendance_stats
+from .attendance import CREATED, ERROR, UNCHANGED, UPDATED, bulk_mark_attendance, parse_date, sync_attendance
+from .tasks import generate_school_timetable
+from .rollover import rollover_academic_year
+from .timetable import import_timetable
+from .timetable_solver import parse_options
 
 
 class ClassPagination(PageNumberPagination):
@@ -34,22 +50,9 @@ class ClassViewSet(viewsets.ModelViewSet):
             queryset = Class.objects.all()
         elif user.role in [user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.SECRETARY]:
             queryset = Class.objects.filter(school=user.school)
-        elif user.role == user.UserRole.TEACHER:
-            try:
-                teacher = user.teacher_profile
-                class_ids = teacher.subjects.values_list('class_obj_id', flat=True)
-                queryset = Class.objects.filter(id__in=class_ids, school=user.school)
-            except:
-                queryset = Class.objects.none()
-        elif user.role == user.UserRole.STUDENT:
-            try:
-                student = user.student_profile
-                if student.current_class:
-                    queryset = Class.objects.filter(id=student.current_class.id, school=user.school)
-                else:
-                    queryset = Class.objects.none()
-            except:
-                queryset = Class.objects.none()
+        elif user.role in [user.UserRole.TEACHER, user.UserRole.STUDENT]:
+            # Classes the teacher teaches or heads / the student's current class
+            queryset = Class.objects.filter(id__in=UserScope.for_user(user).class_ids)
         else:
             queryset = Class.objects.none()
         
@@ -59,14 +62,14 @@ class ClassViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(academic_year=academic_year)
         
         # Ensure proper ordering: latest academic year first, then by name and section
-        return queryset.order_by('-academic_year', 'name', 'section')
+        return queryset.with_counts().order_by('-academic_year', 'name', 'section')
     
     @action(detail=True, methods=['get'])
     def students(self, request, pk=None):
         """Get students in this class"""
         class_obj = self.get_object()
-        from students.serializers import StudentSerializer
-        students = class_obj.enrolled_students.all()
+        from students.serializers import StudentSerializer, with_serializer_relations
+        students = with_serializer_relations(class_obj.enrolled_students.all())
         serializer = StudentSerializer(students, many=True)
         return Response(serializer.data)
     
@@ -74,31 +77,79 @@ class ClassViewSet(viewsets.ModelViewSet):
     def schedule(self, request, pk=None):
         """Get class schedule"""
         class_obj = self.get_object()
-        schedules = class_obj.schedules.all()
+        schedules = ClassScheduleViewSet.with_related(class_obj.schedules.all())
         serializer = ClassScheduleSerializer(schedules, many=True)
         return Response(serializer.data)
     
+    def get_date_range(self, request, default_days=30):
+        """Parse start_date/end_date query params, defaulting to the last ``default_days`` days"""
+        end_date = parse_date(request.query_params.get('end_date') or timezone.now().date())
+        start_date = parse_date(request.query_params.get('start_date') or end_date - timedelta(days=default_days))
+        if start_date is None or end_date is None or start_date > end_date:
+            raise ValidationError({'error': 'Invalid date range, expected start_date <= end_date as YYYY-MM-DD'})
+        return start_date, end_date
+    
     @action(detail=True, methods=['get'])
     def attendance_summary(self, request, pk=None):
-        """Get attendance summary for class"""
+        """Get per-student attendance counts for class over the last 30 days"""
+        from students.models import Student
         class_obj = self.get_object()
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Get attendance for last 30 days
         end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=30)
-        
-        attendance_data = Attendance.objects.filter(
-            class_obj=class_obj,
-            date__range=[start_date, end_date]
-        ).values('student__user__first_name', 'student__user__last_name', 'status').annotate(
-            present_count=Count('id', filter=Q(status='present')),
-            absent_count=Count('id', filter=Q(status='absent')),
-            late_count=Count('id', filter=Q(status='late'))
-        )
+        counts = attendance_stats.student_counts(class_obj.id, end_date - timedelta(days=30), end_date)
+        names = Student.objects.filter(id__in=list(counts)).values_list(
+            'id', 'user__first_name', 'user__last_name'
+        ).order_by()
+        
+        attendance_data = [{
+            'student_id': student_id,
+            'student__user__first_name': first_name,
+            'student__user__last_name': last_name,
+            'present_count': counts[student_id]['present'],
+            'absent_count': counts[student_id]['absent'],
+            'late_count': counts[student_id]['late'],
+            'excused_count': counts[student_id]['excused'],
+        } for student_id, first_name, last_name in names]
         
         return Response(attendance_data)
+    
+    @action(detail=True, methods=['get'])
+    def attendance_rates(self, request, pk=None):
+        """Daily and overall attendance rate for class over a date range"""
+        class_obj = self.get_object()
+        start_date, end_date = self.get_date_range(request)
+        return Response(attendance_stats.class_rates(class_obj.id, start_date, end_date))
+    
+    @action(detail=True, methods=['get'])
+    def attendance_streaks(self, request, pk=None):
+        """Full-attendance streaks for class, or attendance streaks of one student (?student=<id>)"""
+        class_obj = self.get_object()
+        start_date, end_date = self.get_date_range(request)
+        student_id = request.query_params.get('student')
+        if student_id:
+            if not str(student_id).isdigit():
+                return Response({'error': 'Invalid student id'}, status=status.HTTP_400_BAD_REQUEST)
+            if request.user.role == 'student' and int(student_id) not in UserScope.for_user(request.user).student_ids:
+                return Response({'error': 'You can only view your own attendance'}, status=status.HTTP_403_FORBIDDEN)
+            return Response(attendance_stats.student_streaks(int(student_id), class_obj.id, start_date, end_date))
+        return Response(attendance_stats.class_streaks(class_obj.id, start_date, end_date))
+    
+    @action(detail=True, methods=['get'])
+    def chronic_absence(self, request, pk=None):
+        """Students of class who missed at least ?threshold= (default 10%) of recorded days"""
+        if request.user.role in ['student', 'parent']:
+            return Response({'error': 'You do not have permission to view this report'}, status=status.HTTP_403_FORBIDDEN)
+        class_obj = self.get_object()
+        start_date, end_date = self.get_date_range(request, default_days=90)
+        try:
+            threshold = float(request.query_params.get('threshold', attendance_stats.CHRONIC_ABSENCE_THRESHOLD))
+        except ValueError:
+            return Response({'error': 'Invalid threshold'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'start_date': start_date,
+            'end_date': end_date,
+            'threshold': threshold,
+            'students': attendance_stats.chronic_absentees(class_obj.id, start_date, end_date, threshold),
+        })
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -139,10 +190,9 @@ class ClassViewSet(viewsets.ModelViewSet):
         # Get all classes from the latest year
         source_classes = Class.objects.filter(school=user.school, academic_year=latest_year)
         
-        created_classes = []
-        for source_class in source_classes:
-            # Create new class with same properties but new academic year
-            new_class = Class.objects.create(
+        # Create new classes with the same properties but the new academic year, in one insert
+        Class.objects.bulk_create([
+            Class(
                 school=user.school,
                 name=source_class.name,
                 section=source_class.section,
@@ -150,7 +200,11 @@ class ClassViewSet(viewsets.ModelViewSet):
                 capacity=source_class.capacity,
                 is_active=True
             )
-            created_classes.append(new_class)
+            for source_class in source_classes
+        ])
+        apply_deltas(user.school_id, {'total_classes': len(source_classes)})
+        transaction.on_commit(lambda: invalidate_tiles(['system_totals']))
+        created_classes = Class.objects.with_counts().filter(school=user.school, academic_year=target_year)
         
         return Response({
             'message': f'Successfully created {len(created_classes)} classes for academic year {target_year}',
@@ -160,6 +214,35 @@ class ClassViewSet(viewsets.ModelViewSet):
             'classes': ClassSerializer(created_classes, many=True).data
         })
 
+    @action(detail=False, methods=['post'])
+    def rollover(self, request):
+        """Roll classes, assignments, timetables, fee structures and students into a new academic year"""
+        user = request.user
+        if user.role not in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL]:
+            return Response({'error': 'Only administrators can roll over the academic year'},
+                          status=status.HTTP_403_FORBIDDEN)
+        
+        school_id = request.data.get('school_id') if user.role == user.UserRole.SUPER_ADMIN else user.school_id
+        source_year = request.data.get('source_year') or Class.objects.filter(school_id=school_id).order_by(
+            '-academic_year').values_list('academic_year', flat=True).first()
+        target_year = request.data.get('target_year')
+        if not school_id or not source_year or not target_year:
+            return Response({'error': 'school_id, source_year and target_year are required'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        # dry_run returns the same summary without writing; see classes.rollover
+        try:
+            summary = rollover_academic_year(
+                school_id, source_year, target_year,
+                promotions=request.data.get('promotions') or {},
+                repeat=request.data.get('repeat') or [],
+                deactivate_source=request.data.get('deactivate_source', True) not in [False, 'false', '0', 0],
+                dry_run=request.data.get('dry_run') in [True, 'true', '1', 1],
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary, status=status.HTTP_200_OK if summary['dry_run'] else status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['get'])
     def academic_years(self, request):
         """Get all available academic years for this school"""
@@ -196,12 +279,7 @@ class SubjectViewSet(viewsets.ModelViewSet):
             except:
                 return Subject.objects.none()
         elif user.role == user.UserRole.STUDENT:
-            try:
-                student = user.student_profile
-                if student.current_class:
-                    return student.current_class.subjects.all()
-            except:
-                pass
+            return Subject.objects.filter(classes__class_obj_id__in=UserScope.for_user(user).class_ids).distinct()
         return Subject.objects.none()
     
     def perform_create(self, serializer):
@@ -220,14 +298,19 @@ class ClassSubjectViewSet(viewsets.ModelViewSet):
     ordering_fields = ['class_obj__name', 'subject__name', 'teacher__user__first_name', 'created_at']
     ordering = ['class_obj__name', 'subject__name']
     
+    @staticmethod
+    def with_related(queryset):
+        """Load everything ClassSubjectSerializer nests in a fixed number of queries"""
+        return queryset.select_related('subject', 'teacher__user').prefetch_related(with_class_counts('class_obj'))
+    
     def get_queryset(self):
         user = self.request.user
         if user.role in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.SECRETARY]:
-            return ClassSubject.objects.filter(class_obj__school=user.school)
+            return self.with_related(ClassSubject.objects.filter(class_obj__school=user.school))
         elif user.role == user.UserRole.TEACHER:
             try:
                 teacher = user.teacher_profile
-                return ClassSubject.objects.filter(teacher=teacher)
+                return self.with_related(ClassSubject.objects.filter(teacher=teacher))
             except:
                 return ClassSubject.objects.none()
         else:
@@ -241,7 +324,7 @@ class ClassSubjectViewSet(viewsets.ModelViewSet):
             return Response({'error': 'class_id parameter is required'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        class_subjects = ClassSubject.objects.filter(class_obj_id=class_id)
+        class_subjects = self.with_related(ClassSubject.objects.filter(class_obj_id=class_id))
         serializer = self.get_serializer(class_subjects, many=True)
         return Response(serializer.data)
     
@@ -253,7 +336,7 @@ class ClassSubjectViewSet(viewsets.ModelViewSet):
             return Response({'error': 'teacher_id parameter is required'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        class_subjects = ClassSubject.objects.filter(teacher_id=teacher_id)
+        class_subjects = self.with_related(ClassSubject.objects.filter(teacher_id=teacher_id))
         serializer = self.get_serializer(class_subjects, many=True)
         return Response(serializer.data)
 
@@ -263,27 +346,84 @@ class ClassScheduleViewSet(viewsets.ModelViewSet):
     queryset = ClassSchedule.objects.all()
     serializer_class = ClassScheduleSerializer
     
+    @staticmethod
+    def with_related(queryset):
+        """Load everything ClassScheduleSerializer nests in a fixed number of queries"""
+        return queryset.select_related('subject', 'teacher__user').prefetch_related(with_class_counts('class_obj'))
+    
     def get_queryset(self):
         """Filter schedules based on user role"""
         user = self.request.user
         
         if user.role in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL]:
-            return ClassSchedule.objects.all()
+            return self.with_related(ClassSchedule.objects.all())
         elif user.role == user.UserRole.TEACHER:
             try:
                 teacher = user.teacher_profile
-                return ClassSchedule.objects.filter(teacher=teacher)
+                return self.with_related(ClassSchedule.objects.filter(teacher=teacher))
             except:
                 return ClassSchedule.objects.none()
         elif user.role == user.UserRole.STUDENT:
-            try:
-                student = user.student_profile
-                if student.current_class:
-                    return ClassSchedule.objects.filter(class_obj=student.current_class)
-            except:
-                pass
+            return self.with_related(ClassSchedule.objects.filter(class_obj_id__in=UserScope.for_user(user).class_ids))
         return ClassSchedule.objects.none()
 
+    def get_timetable_school_id(self, request):
+        """School whose timetable the user manages: their own, or ?school_id= / school_id for super admins"""
+        user = request.user
+        if user.role == user.UserRole.SUPER_ADMIN:
+            return school_id_param(request.data.get('school_id') or request.query_params.get('school_id'))
+        if user.role in [user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL] and user.school_id:
+            return user.school_id
+        raise PermissionDenied('You do not have permission to manage timetables.')
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_timetable(self, request):
+        """Validate and create many schedule slots at once; nothing is written if any slot fails"""
+        school_id = self.get_timetable_school_id(request)
+        slots = request.data.get('slots')
+        if not school_id or not isinstance(slots, list) or not all(isinstance(slot, dict) for slot in slots):
+            return Response({'error': 'school_id and a list of slots are required'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        # One pass over an interval index of the school's timetable; see classes.timetable
+        created, errors = import_timetable(school_id, slots, replace=bool(request.data.get('replace')))
+        if errors:
+            return Response({'error_count': len(errors), 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created_count': len(created)}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        """Queue a timetable solve for the school's classes; poll generate_status with the returned task_id"""
+        school_id = self.get_timetable_school_id(request)
+        if not school_id:
+            return Response({'error': 'school_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            options = parse_options(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        task = generate_school_timetable.delay(school_id, options)
+        remember_task_school(task.id, school_id)
+        return Response({'task_id': task.id}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'])
+    def generate_status(self, request):
+        """State of a timetable solve: PROGRESS with placed/total, then SUCCESS with the result"""
+        from celery.result import AsyncResult
+        school_id = self.get_timetable_school_id(request)
+        task_id = request.query_params.get('task_id')
+        if not task_id:
+            return Response({'error': 'task_id parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Checked for every state: pending and failed results don't name their school
+        if not task_visible_to(task_id, school_id):
+            return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
+        result = AsyncResult(task_id)
+        if result.failed():
+            return Response({'task_id': task_id, 'state': result.state, 'error': str(result.info)})
+        info = result.info if isinstance(result.info, dict) else {}
+        return Response({'task_id': task_id, 'state': result.state, **info})
+
 
 class AttendanceViewSet(viewsets.ModelViewSet):
     """Attendance management viewset"""
@@ -299,26 +439,14 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         elif user.role in ['school_admin', 'secretary']:
             return Attendance.objects.filter(class_obj__school=user.school)
         elif user.role == 'teacher':
-            try:
-                teacher = user.teacher_profile
-                if teacher.is_head_teacher:
-                    # Head teachers can see attendance for their assigned classes
-                    return Attendance.objects.filter(
-                        class_obj__in=teacher.head_teacher_classes.all(),
-                        class_obj__school=user.school
-                    )
-                else:
-                    # Regular teachers can see attendance for classes they teach
-                    class_ids = teacher.subjects.values_list('class_obj_id', flat=True)
-                    return Attendance.objects.filter(class_obj_id__in=class_ids)
-            except:
-                return Attendance.objects.none()
+            scope = UserScope.for_user(user)
+            if scope.is_head_teacher:
+                # Head teachers can see attendance for their assigned classes
+                return Attendance.objects.filter(class_obj_id__in=scope.head_class_ids)
+            # Regular teachers can see attendance for classes they teach
+            return Attendance.objects.filter(class_obj_id__in=scope.taught_class_ids)
         elif user.role == 'student':
-            try:
-                student = user.student_profile
-                return Attendance.objects.filter(student=student)
-            except:
-                return Attendance.objects.none()
+            return Attendance.objects.filter(student_id__in=UserScope.for_user(user).student_ids)
         return Attendance.objects.none()
     
     def check_attendance_permissions(self, user, class_id=None):
@@ -370,7 +498,7 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             self.check_attendance_permissions(user, class_id=class_id.id)
         else:
             self.check_attendance_permissions(user)
-        serializer.save(marked_by=user)
+        serializer.save(marked_by=user, changed_at=timezone.now())
     
     def perform_destroy(self, instance):
         """Enforce permissions for deleting attendance"""
@@ -396,37 +524,48 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         if not all([class_id, date, attendance_data]):
             return Response({'error': 'Missing required data'}, 
                           status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(attendance_data, list):
+            return Response({'error': 'attendance_data must be a list'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        date = parse_date(date)
+        if date is None:
+            return Response({'error': 'Invalid date, expected YYYY-MM-DD'},
+                          status=status.HTTP_400_BAD_REQUEST)
         
-        # Create or update attendance records
-        created_count = 0
-        updated_count = 0
-        
-        for record in attendance_data:
-            student_id = record.get('student_id')
-            status = record.get('status')
-            remarks = record.get('remarks', '')
-            
-            attendance, created = Attendance.objects.update_or_create(
-                student_id=student_id,
-                class_obj_id=class_id,
-                date=date,
-                defaults={
-                    'status': status,
-                    'remarks': remarks,
-                    'marked_by': user
-                }
-            )
-            
-            if created:
-                created_count += 1
-            else:
-                updated_count += 1
+        # Validate membership and upsert all rows in two queries; see classes.attendance
+        results = bulk_mark_attendance(class_id, date, attendance_data, user)
+        counts = Counter(result['result'] for result in results)
         
         return Response({
-            'message': f'Attendance marked successfully. Created: {created_count}, Updated: {updated_count}',
-            'created_count': created_count,
-            'updated_count': updated_count
+            'message': f'Attendance marked successfully. Created: {counts[CREATED]}, Updated: {counts[UPDATED]}',
+            'created_count': counts[CREATED],
+            'updated_count': counts[UPDATED],
+            'unchanged_count': counts[UNCHANGED],
+            'error_count': counts[ERROR],
+            'results': results,
         })
+    
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """Apply offline attendance changes for a class and return the server's changes since a sync token"""
+        user = request.user
+        class_id = request.data.get('class_id')
+        try:
+            self.check_attendance_permissions(user, class_id=class_id)
+        except PermissionDenied as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        
+        mutations = request.data.get('changes') or []
+        if not class_id or not isinstance(mutations, list):
+            return Response({'error': 'class_id and a list of changes are required'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        # One transaction for the whole batch, last writer wins per (student, class, date); see classes.attendance
+        try:
+            result = sync_attendance(class_id, mutations, request.data.get('token'), user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
 
 
 class AssignmentViewSet(viewsets.ModelViewSet):
@@ -443,26 +582,14 @@ class AssignmentViewSet(viewsets.ModelViewSet):
         elif user.role in ['school_admin', 'secretary']:
             return Assignment.objects.filter(class_obj__school=user.school)
         elif user.role == 'teacher':
-            try:
-                teacher = user.teacher_profile
-                if teacher.is_head_teacher:
-                    # Head teachers can see assignments for their assigned classes
-                    return Assignment.objects.filter(
-                        class_obj__in=teacher.head_teacher_classes.all(),
-                        class_obj__school=user.school
-                    )
-                else:
-                    # Regular teachers can see assignments they created
-                    return Assignment.objects.filter(teacher=teacher)
-            except:
-                return Assignment.objects.none()
+            scope = UserScope.for_user(user)
+            if scope.is_head_teacher:
+                # Head teachers can see assignments for their assigned classes
+                return Assignment.objects.filter(class_obj_id__in=scope.head_class_ids)
+            # Regular teachers can see assignments they created
+            return Assignment.objects.filter(teacher__user=user)
         elif user.role == 'student':
-            try:
-                student = user.student_profile
-                if student.current_class:
-                    return Assignment.objects.filter(class_obj=student.current_class)
-            except:
-                return Assignment.objects.none()
+            return Assignment.objects.filter(class_obj_id__in=UserScope.for_user(user).class_ids)
         return Assignment.objects.none()
     
     def check_assignment_permissions(self, user, class_id=None):
@@ -545,25 +672,14 @@ class AssignmentSubmissionViewSet(viewsets.ModelViewSet):
         elif user.role in ['school_admin', 'secretary']:
             return AssignmentSubmission.objects.filter(assignment__class_obj__school=user.school)
         elif user.role == 'teacher':
-            try:
-                teacher = user.teacher_profile
-                if teacher.is_head_teacher:
-                    # Head teachers can see submissions for their assigned classes
-                    return AssignmentSubmission.objects.filter(
-                        assignment__class_obj__in=teacher.head_teacher_classes.all(),
-                        assignment__class_obj__school=user.school
-                    )
-                else:
-                    # Regular teachers can see submissions for assignments they created
-                    return AssignmentSubmission.objects.filter(assignment__teacher=teacher)
-            except:
-                return AssignmentSubmission.objects.none()
+            scope = UserScope.for_user(user)
+            if scope.is_head_teacher:
+                # Head teachers can see submissions for their assigned classes
+                return AssignmentSubmission.objects.filter(assignment__class_obj_id__in=scope.head_class_ids)
+            # Regular teachers can see submissions for assignments they created
+            return AssignmentSubmission.objects.filter(assignment__teacher__user=user)
         elif user.role == 'student':
-            try:
-                student = user.student_profile
-                return AssignmentSubmission.objects.filter(student=student)
-            except:
-                return AssignmentSubmission.objects.none()
+            return AssignmentSubmission.objects.filter(student_id__in=UserScope.for_user(user).student_ids)
         return AssignmentSubmission.objects.none()
     
     def check_submission_permissions(self, user, assignment_id=None):
@@ -0,0 +1,35 @@
+"""
+Which school queued a background task.
+
+A Celery result only names its school once the task reports progress or
+succeeds; a pending or failed result carries nothing but its state and
+exception. Views that queue a per-school task record the school with
+remember_task_school, and the status endpoints answer only that school,
+whatever the state. Entries are kept in the cache for as long as Celery
+keeps results (CELERY_RESULT_EXPIRES, one day by default).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _key(task_id):
+    return f'task_school:{task_id}'
+
+
+def remember_task_school(task_id, school_id):
+    cache.set(_key(task_id), int(school_id), getattr(settings, 'CELERY_RESULT_EXPIRES', 60 * 60 * 24))
+
+
+def task_school_id(task_id):
+    """The school that queued a task, or None for unknown or expired tasks"""
+    return cache.get(_key(task_id))
+
+
+def task_visible_to(task_id, school_id):
+    """
+    Whether a status request for ``school_id`` may see the task; None means
+    every school (super admins who name none).
+    """
+    owner = task_school_id(task_id)
+    return owner is not None and (school_id is None or owner == school_id)
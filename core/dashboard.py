@@ -0,0 +1,180 @@
+"""
+Dashboard tiles.
+
+Each tile is computed from real data with as few combined (conditional
+aggregation) queries as possible and cached per (tile, role, school), plus the
+user for personal tiles, with a tile-specific TTL. Writes to the models a tile
+reads bump that tile's version for the affected school (see core.signals), so a
+stale tile is recomputed on the next dashboard load instead of waiting for its
+TTL to run out.
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+TILES = {}
+
+
+class Tile:
+    def __init__(self, name, compute, timeout, per_user=False, is_global=False):
+        self.name = name
+        self.compute = compute
+        self.timeout = timeout
+        self.per_user = per_user
+        self.is_global = is_global
+
+
+def tile(name, timeout, per_user=False, is_global=False):
+    """Register a tile; the decorated function takes the user and returns cacheable data"""
+    def register(compute):
+        TILES[name] = Tile(name, compute, timeout, per_user=per_user, is_global=is_global)
+        return compute
+    return register
+
+
+def _version_key(name, school_id):
+    return f'dashboard_version:{name}:{school_id}'
+
+
+def invalidate_tiles(names, school_id=None):
+    """Mark tiles stale for a school; global tiles are invalidated with school_id=None"""
+    for name in names:
+        key = _version_key(name, school_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_tile(name, user):
+    """Return a tile's data for the user, from cache when it is still current"""
+    spec = TILES[name]
+    school_id = None if spec.is_global else user.school_id
+    version = cache.get(_version_key(name, school_id), 0)
+    key = f'dashboard:{name}:{user.role}:{school_id}:{version}'
+    if spec.per_user:
+        key = f'{key}:{user.pk}'
+    data = cache.get(key)
+    if data is None:
+        data = spec.compute(user)
+        cache.set(key, data, spec.timeout)
+    return data
+
+
+@tile('system_totals', timeout=300, is_global=True)
+def system_totals(user):
+    from classes.models import Class
+    from schools.models import School, Subscription
+    from users.models import User
+
+    now = timezone.now()
+    users = User.objects.aggregate(
+        total=Count('id'),
+        students=Count('id', filter=Q(role=User.UserRole.STUDENT)),
+        teachers=Count('id', filter=Q(role=User.UserRole.TEACHER)),
+        joined_recently=Count('id', filter=Q(created_at__gte=now - timedelta(days=30))),
+        joined_before=Count('id', filter=Q(created_at__gte=now - timedelta(days=60), created_at__lt=now - timedelta(days=30))),
+    )
+    subscriptions = Subscription.objects.filter(status='active').aggregate(count=Count('id'), revenue=Sum('amount'))
+
+    # User growth over the last 30 days relative to the 30 days before
+    if users['joined_before']:
+        growth_rate = round((users['joined_recently'] - users['joined_before']) * 100 / users['joined_before'], 1)
+    else:
+        growth_rate = 100.0 if users['joined_recently'] else 0.0
+
+    return {
+        'totalSchools': School.objects.count(),
+        'totalUsers': users['total'],
+        'totalStudents': users['students'],
+        'totalTeachers': users['teachers'],
+        'totalClasses': Class.objects.count(),
+        'activeSubscriptions': subscriptions['count'],
+        'revenue': float(subscriptions['revenue'] or 0),
+        'growthRate': growth_rate,
+    }
+
+
+@tile('recent_activities', timeout=30, is_global=True)
+def recent_activities(user):
+    from users.models import UserActivity
+
+    activities = UserActivity.objects.select_related('user').order_by('-created_at')[:10]
+    return [{
+        'id': activity.id,
+        'action': activity.action,
+        'user': activity.user.get_full_name() or activity.user.username,
+        'time': f"{activity.created_at.strftime('%H:%M')} ago",
+        'type': 'info',
+    } for activity in activities]
+
+
+@tile('teacher_stats', timeout=300, per_user=True)
+def teacher_stats(user):
+    from classes.models import AssignmentSubmission, ClassSubject
+    from classes.relations import classes_of_teacher
+    from students.models import Student
+
+    teaching = ClassSubject.objects.filter(teacher__user=user).aggregate(
+        classes=Count('class_obj', distinct=True),
+        subjects=Count('subject', distinct=True),
+    )
+    return {
+        'students_count': Student.objects.filter(current_class_id__in=classes_of_teacher(user.id)).count(),
+        'classes_count': teaching['classes'],
+        'subjects_count': teaching['subjects'],
+        # Submissions to the teacher's assignments that are still waiting for marks
+        'pending_assignments': AssignmentSubmission.objects.filter(
+            assignment__teacher__user=user, marks_obtained__isnull=True,
+        ).count(),
+    }
+
+
+@tile('student_stats', timeout=600, per_user=True)
+def student_stats(user):
+    from classes.models import Attendance
+    from exams.models import ExamSchedule
+    from fees.models import StudentFee
+    from students.models import Student
+
+    student = Student.objects.filter(user=user).values('id', 'current_class_id').first()
+    if not student:
+        return {'attendance_percentage': None, 'pending_fees': 0, 'upcoming_exams': 0}
+
+    attendance = Attendance.objects.filter(student_id=student['id']).aggregate(
+        total=Count('id'),
+        attended=Count('id', filter=Q(status__in=[Attendance.Status.PRESENT, Attendance.Status.LATE])),
+    )
+    return {
+        'attendance_percentage': (
+            round(attendance['attended'] * 100 / attendance['total'], 1) if attendance['total'] else None
+        ),
+        'pending_fees': StudentFee.objects.filter(
+            student_id=student['id'],
+            status__in=[StudentFee.Status.PENDING, StudentFee.Status.PARTIAL, StudentFee.Status.OVERDUE],
+        ).count(),
+        'upcoming_exams': ExamSchedule.objects.filter(
+            exam__class_obj_id=student['current_class_id'],
+            exam_date__gte=timezone.localdate(),
+            is_active=True,
+            exam__is_active=True,
+        ).count() if student['current_class_id'] else 0,
+    }
+
+
+@tile('accountant_stats', timeout=120)
+def accountant_stats(user):
+    from fees.models import Payment
+
+    payments = Payment.objects.filter(student_fee__student__school_id=user.school_id).aggregate(
+        pending=Count('id', filter=Q(status=Payment.Status.PENDING)),
+        today=Sum('amount', filter=Q(status=Payment.Status.COMPLETED, created_at__date=timezone.localdate())),
+    )
+    return {
+        'pending_payments': payments['pending'],
+        'today_collections': float(payments['today'] or 0),
+    }
+
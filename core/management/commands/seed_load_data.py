@@ -0,0 +1,517 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from chat.models import ChatRoom, ChatParticipant, Message
+from classes.attendance_stats import rebuild_attendance_rollups
+from classes.models import Class, Subject, ClassSubject, Attendance
+from exams.models import Exam, ExamResult
+from fees.ledger import post_entries, settled_status
+from fees.models import FeeCategory, FeeStructure, LedgerEntry, ReceiptSequence, StudentFee, Payment
+from fees.rollups import rebuild_finance_rollups
+from schools.models import School, Subscription, SubscriptionPlan, subscription_post_delete
+from schools.stats import rebuild_school_stats
+from students.models import Student
+from users.models import User, Teacher
+
+
+SUBJECTS = [
+    ('Mathematics', 'MATH'),
+    ('English', 'ENG'),
+    ('Science', 'SCI'),
+    ('History', 'HIST'),
+    ('Geography', 'GEO'),
+    ('Physical Education', 'PE'),
+]
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+    'David', 'Elizabeth', 'Daniel', 'Sarah', 'Joseph', 'Karen', 'Thomas', 'Nancy',
+    'Abebe', 'Almaz', 'Dawit', 'Hana', 'Yonas', 'Meron', 'Samuel', 'Ruth',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+    'Tesfaye', 'Bekele', 'Girma', 'Haile', 'Kebede', 'Alemu', 'Wilson', 'Moore',
+]
+GRADES = 12
+CLASS_SIZE = 40
+# Cumulative attendance status distribution
+ATTENDANCE_WEIGHTS = [
+    (0.90, Attendance.Status.PRESENT),
+    (0.95, Attendance.Status.ABSENT),
+    (0.98, Attendance.Status.LATE),
+    (1.00, Attendance.Status.EXCUSED),
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate large, reproducible multi-tenant data sets for load and benchmark testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible data')
+        parser.add_argument('--schools', type=int, default=200)
+        parser.add_argument('--students', type=int, default=500000, help='Total students across all schools')
+        parser.add_argument('--attendance-days', type=int, default=40,
+                            help='School days of attendance per student (students x days rows)')
+        parser.add_argument('--messages', type=int, default=5000000, help='Total chat messages across all schools')
+        parser.add_argument('--fee-months', type=int, default=6, help='Months of monthly fee history per student')
+        parser.add_argument('--exams-per-subject', type=int, default=1)
+        parser.add_argument('--academic-year', default='2024-2025')
+        parser.add_argument('--prefix', default='LD', help='School code prefix used to tag generated data')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk_create batch')
+        parser.add_argument('--flush', action='store_true',
+                            help='Delete previously generated schools with the same prefix first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.options = options
+        prefix = options['prefix']
+        num_schools = options['schools']
+
+        existing = School.objects.filter(code__startswith=f'{prefix}-')
+        if existing.exists():
+            if not options['flush']:
+                raise CommandError(
+                    f'Load data with prefix "{prefix}" already exists. Use --flush to replace it.'
+                )
+            self.stdout.write(f'Deleting existing load data with prefix "{prefix}"...')
+            # Don't email every generated school about its subscription being deleted
+            post_delete.disconnect(subscription_post_delete, sender=Subscription)
+            try:
+                existing.delete()
+            finally:
+                post_delete.connect(subscription_post_delete, sender=Subscription)
+
+        started = timezone.now()
+        # Hash once: every generated account shares the same password
+        self.password_hash = make_password('loadtest123')
+        self.subjects = self._ensure_subjects(prefix)
+        self.fee_category, _ = FeeCategory.objects.get_or_create(name='Tuition')
+        self.school_days = self._school_days(options['attendance_days'])
+        self.fee_due_dates = self._fee_due_dates(options['fee_months'])
+
+        schools = self._create_schools(prefix, num_schools)
+        student_sizes = self._split(options['students'], num_schools)
+        message_sizes = self._split(options['messages'], num_schools)
+
+        totals = {}
+        for index, school in enumerate(schools):
+            with transaction.atomic():
+                counts = self._seed_school(school, student_sizes[index], message_sizes[index])
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+            self.stdout.write(
+                f'[{index + 1}/{num_schools}] {school.code}: '
+                + ', '.join(f'{key}={value}' for key, value in counts.items())
+            )
+
+        # The bulk inserts skip the signals that keep the rollups current, so rebuild them for the new schools
+        self.stdout.write('Rebuilding school, attendance and finance rollups...')
+        school_ids = [school.id for school in schools]
+        rebuild_school_stats(school_ids)
+        rebuild_attendance_rollups(Class.objects.filter(school_id__in=school_ids).values('id'))
+        rebuild_finance_rollups(school_ids)
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated load data for {num_schools} schools in {elapsed:.1f}s:\n'
+            + '\n'.join(f'- {key}: {value}' for key, value in totals.items())
+        ))
+
+    # Helpers
+
+    def _bulk_create(self, model, objs, **kwargs):
+        """Insert an iterable of unsaved objects in chunks, returning the row count"""
+        batch = []
+        count = 0
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= self.chunk_size:
+                model.objects.bulk_create(batch, **kwargs)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch, **kwargs)
+            count += len(batch)
+        return count
+
+    def _split(self, total, parts):
+        """Split a total into uneven but reproducible per-school shares"""
+        weights = [self.rng.uniform(0.5, 1.5) for _ in range(parts)]
+        weight_sum = sum(weights)
+        sizes = [int(total * weight / weight_sum) for weight in weights]
+        sizes[0] += total - sum(sizes)
+        return sizes
+
+    def _school_days(self, count):
+        days = []
+        current = timezone.now().date()
+        while len(days) < count:
+            if current.weekday() < 5:
+                days.append(current)
+            current -= timedelta(days=1)
+        return sorted(days)
+
+    def _fee_due_dates(self, months):
+        first = timezone.now().date().replace(day=1)
+        dates = []
+        for _ in range(months):
+            dates.append(first)
+            first = (first - timedelta(days=1)).replace(day=1)
+        return sorted(dates)
+
+    def _name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def _ensure_subjects(self, prefix):
+        subjects = []
+        for name, code in SUBJECTS:
+            subject, _ = Subject.objects.get_or_create(
+                code=f'{prefix}-{code}',
+                defaults={'name': name, 'is_core': True}
+            )
+            subjects.append(subject)
+        return subjects
+
+    def _create_schools(self, prefix, count):
+        self.stdout.write(f'Creating {count} schools...')
+        schools = [
+            School(
+                name=f'Load Test School {index:04d}',
+                code=f'{prefix}-{index:04d}',
+                address=f'{index} Benchmark Road',
+                phone=f'555-{index:04d}',
+                email=f'school{index:04d}@load.test',
+                principal_name='Load Principal',
+                principal_email=f'principal{index:04d}@load.test',
+                principal_phone=f'555-9{index:03d}',
+                school_type='mixed',
+                is_verified=True,
+            )
+            for index in range(1, count + 1)
+        ]
+        School.objects.bulk_create(schools, batch_size=self.chunk_size)
+        schools = list(School.objects.filter(code__startswith=f'{prefix}-').order_by('code'))
+
+        # bulk_create skips Subscription.save and its email signal handlers
+        plan, _ = SubscriptionPlan.objects.get_or_create(
+            name='enterprise',
+            defaults={'max_students': 100000, 'max_teachers': 5000}
+        )
+        today = timezone.now().date()
+        Subscription.objects.bulk_create([
+            Subscription(
+                school=school,
+                plan=plan,
+                status=Subscription.Status.ACTIVE,
+                start_date=today - timedelta(days=180),
+                end_date=today + timedelta(days=185),
+                amount=Decimal('1200.00'),
+                features=[],
+                max_users=100000,
+                max_students=100000,
+            )
+            for school in schools
+        ], batch_size=self.chunk_size)
+        return schools
+
+    def _create_users(self, school, role, count, tag):
+        users = []
+        for number in range(1, count + 1):
+            first_name, last_name = self._name()
+            username = f'{school.code.lower()}-{tag}{number:05d}'
+            users.append(User(
+                username=username,
+                email=f'{username}@load.test',
+                password=self.password_hash,
+                first_name=first_name,
+                last_name=last_name,
+                role=role,
+                school=school,
+            ))
+        User.objects.bulk_create(users, batch_size=self.chunk_size)
+        return list(User.objects.filter(school=school, role=role).order_by('username'))
+
+    # Per-school generation
+
+    def _seed_school(self, school, num_students, num_messages):
+        academic_year = self.options['academic_year']
+        num_classes = max(GRADES, -(-num_students // CLASS_SIZE))
+        sections_per_grade = -(-num_classes // GRADES)
+
+        classes = [
+            Class(
+                school=school,
+                name=f'Grade {grade}',
+                section=chr(ord('A') + section),
+                academic_year=academic_year,
+                capacity=CLASS_SIZE + 5,
+            )
+            for grade in range(1, GRADES + 1)
+            for section in range(sections_per_grade)
+        ]
+        Class.objects.bulk_create(classes, batch_size=self.chunk_size)
+        classes = list(Class.objects.filter(school=school, academic_year=academic_year).order_by('id'))
+
+        self._create_users(school, User.UserRole.SCHOOL_ADMIN, 1, 'a')
+
+        # Teachers: roughly one per two classes, each teaching one subject
+        num_teachers = max(len(self.subjects), len(classes) // 2)
+        teacher_users = self._create_users(school, User.UserRole.TEACHER, num_teachers, 't')
+        teachers = [
+            Teacher(
+                user=user,
+                employee_id=f'{school.code}-T{number:04d}',
+                department='Academics',
+                qualification='B.Ed',
+                experience_years=self.rng.randint(0, 30),
+                # Every teacher heads at least one class below, so all may mark attendance
+                is_head_teacher=True,
+            )
+            for number, user in enumerate(teacher_users, start=1)
+        ]
+        Teacher.objects.bulk_create(teachers, batch_size=self.chunk_size)
+        teachers = list(Teacher.objects.filter(user__school=school).select_related('user').order_by('id'))
+        teacher_subjects = {
+            teacher.id: self.subjects[index % len(self.subjects)]
+            for index, teacher in enumerate(teachers)
+        }
+        Teacher.subjects.through.objects.bulk_create([
+            Teacher.subjects.through(teacher_id=teacher_id, subject_id=subject.id)
+            for teacher_id, subject in teacher_subjects.items()
+        ], batch_size=self.chunk_size)
+
+        teachers_by_subject = {}
+        for teacher in teachers:
+            teachers_by_subject.setdefault(teacher_subjects[teacher.id].id, []).append(teacher)
+        class_subjects = []
+        for class_index, class_obj in enumerate(classes):
+            for subject in self.subjects:
+                candidates = teachers_by_subject[subject.id]
+                class_subjects.append(ClassSubject(
+                    class_obj=class_obj,
+                    subject=subject,
+                    teacher=candidates[class_index % len(candidates)],
+                ))
+        ClassSubject.objects.bulk_create(class_subjects, batch_size=self.chunk_size)
+        Teacher.head_teacher_classes.through.objects.bulk_create([
+            Teacher.head_teacher_classes.through(
+                teacher_id=teachers[index % len(teachers)].id, class_id=class_obj.id
+            )
+            for index, class_obj in enumerate(classes)
+        ], batch_size=self.chunk_size)
+
+        # Students, spread evenly across classes
+        student_users = self._create_users(school, User.UserRole.STUDENT, num_students, 's')
+        today = timezone.now().date()
+        students = []
+        for index, user in enumerate(student_users):
+            class_obj = classes[index % len(classes)]
+            grade = int(class_obj.name.split()[-1])
+            students.append(Student(
+                user=user,
+                school=school,
+                current_class=class_obj,
+                student_id=user.username,
+                date_of_birth=date(today.year - 5 - grade, self.rng.randint(1, 12), self.rng.randint(1, 28)),
+                gender=self.rng.choice(['M', 'F']),
+                address='Load test address',
+                emergency_contact=f'555{self.rng.randint(1000000, 9999999)}',
+                emergency_contact_name='Guardian',
+                year=str(grade),
+            ))
+        Student.objects.bulk_create(students, batch_size=self.chunk_size)
+        students = list(Student.objects.filter(school=school).only('id', 'user_id', 'current_class_id').order_by('id'))
+        students_by_class = {}
+        for student in students:
+            students_by_class.setdefault(student.current_class_id, []).append(student)
+        head_teacher_users = {
+            class_obj.id: teachers[index % len(teachers)].user_id
+            for index, class_obj in enumerate(classes)
+        }
+
+        counts = {
+            'admins': 1,
+            'classes': len(classes),
+            'teachers': len(teachers),
+            'students': len(students),
+        }
+        counts['attendance'] = self._bulk_create(
+            Attendance, self._attendance_rows(students_by_class, head_teacher_users)
+        )
+        counts.update(self._seed_fees(school, classes, students_by_class))
+        counts.update(self._seed_exams(classes, students_by_class))
+        counts.update(self._seed_chat(school, classes, class_subjects, students_by_class, num_messages))
+        return counts
+
+    def _attendance_rows(self, students_by_class, head_teacher_users):
+        rng = self.rng
+        for class_id, class_students in students_by_class.items():
+            marked_by_id = head_teacher_users[class_id]
+            for day in self.school_days:
+                for student in class_students:
+                    roll = rng.random()
+                    status = next(value for limit, value in ATTENDANCE_WEIGHTS if roll < limit)
+                    yield Attendance(
+                        student_id=student.id,
+                        class_obj_id=class_id,
+                        date=day,
+                        status=status,
+                        marked_by_id=marked_by_id,
+                    )
+
+    def _seed_fees(self, school, classes, students_by_class):
+        academic_year = self.options['academic_year']
+        structures = {}
+        for class_obj in classes:
+            grade = int(class_obj.name.split()[-1])
+            structures[class_obj.id] = FeeStructure(
+                class_obj=class_obj,
+                category=self.fee_category,
+                amount=Decimal(100 + grade * 10),
+                frequency='monthly',
+                academic_year=academic_year,
+            )
+        FeeStructure.objects.bulk_create(structures.values(), batch_size=self.chunk_size)
+
+        today = timezone.now().date()
+        fees = []
+        for class_id, class_students in students_by_class.items():
+            structure = structures[class_id]
+            for student in class_students:
+                for due_date in self.fee_due_dates:
+                    roll = self.rng.random()
+                    fee = StudentFee(
+                        student_id=student.id,
+                        fee_structure=structure,
+                        structure='monthly',
+                        due_date=due_date,
+                        amount=structure.amount,
+                    )
+                    if roll < 0.80:
+                        fee.paid_amount = fee.amount
+                    elif roll < 0.88:
+                        fee.paid_amount = (fee.amount / 2).quantize(Decimal('0.01'))
+                    fee.status = settled_status(fee, fee.paid_amount, today)
+                    fees.append(fee)
+        StudentFee.objects.bulk_create(fees, batch_size=self.chunk_size)
+
+        methods = [choice for choice, _ in Payment.PaymentMethod.choices]
+        payments = [
+            Payment(
+                student_fee_id=fee.id,
+                amount=fee.paid_amount,
+                payment_method=self.rng.choice(methods),
+                receipt_number=f'{school.code}-{sequence:07d}',
+                status=Payment.Status.COMPLETED,
+            )
+            for sequence, fee in enumerate((fee for fee in fees if fee.paid_amount), start=1)
+        ]
+        Payment.objects.bulk_create(payments, batch_size=self.chunk_size)
+        # Same format as fees.payments.allocate_receipt_numbers, which carries on from last_number
+        ReceiptSequence.objects.create(school=school, last_number=len(payments))
+
+        # bulk_create skips the ledger signals, so post each fee's charge and payment here
+        fees_by_id = {fee.id: fee for fee in fees}
+        entries = post_entries([
+            LedgerEntry(
+                student_id=fee.student_id, student_fee_id=fee.id, entry_type=LedgerEntry.EntryType.CHARGE,
+                amount=fee.amount, description=f'{fee.get_structure_display()} fee due {fee.due_date}',
+            )
+            for fee in fees
+        ] + [
+            LedgerEntry(
+                student_id=fees_by_id[payment.student_fee_id].student_id, student_fee_id=payment.student_fee_id,
+                payment_id=payment.id, entry_type=LedgerEntry.EntryType.PAYMENT, amount=-payment.amount,
+                description=f'Payment {payment.receipt_number}',
+            )
+            for payment in payments
+        ])
+
+        return {
+            'fees': len(fees),
+            'payments': len(payments),
+            'ledger_entries': len(entries),
+        }
+
+    def _seed_exams(self, classes, students_by_class):
+        exams = []
+        for class_obj in classes:
+            for subject in self.subjects:
+                for number in range(1, self.options['exams_per_subject'] + 1):
+                    exams.append(Exam(
+                        name=f'{subject.name} Exam {number}',
+                        subject=subject,
+                        class_obj=class_obj,
+                        exam_type='midterm' if number % 2 else 'final',
+                        total_marks=Decimal('100.00'),
+                    ))
+        Exam.objects.bulk_create(exams, batch_size=self.chunk_size)
+
+        def results():
+            for exam in exams:
+                for student in students_by_class.get(exam.class_obj_id, []):
+                    marks = Decimal(min(100, max(0, int(self.rng.gauss(72, 15)))))
+                    yield ExamResult(
+                        student_id=student.id,
+                        exam_id=exam.id,
+                        marks_obtained=marks,
+                        total_marks=exam.total_marks,
+                        grade=ExamResult.calculate_grade(marks, exam.total_marks),
+                    )
+
+        return {
+            'exams': len(exams),
+            'exam_results': self._bulk_create(ExamResult, results()),
+        }
+
+    def _seed_chat(self, school, classes, class_subjects, students_by_class, num_messages):
+        rooms = [
+            ChatRoom(
+                name=f'{school.code} {class_obj.name}{class_obj.section}',
+                room_type=ChatRoom.RoomType.CLASS,
+                class_obj=class_obj,
+            )
+            for class_obj in classes
+        ]
+        ChatRoom.objects.bulk_create(rooms, batch_size=self.chunk_size)
+
+        teacher_users_by_class = {}
+        for class_subject in class_subjects:
+            teacher_users_by_class.setdefault(class_subject.class_obj_id, set()).add(
+                class_subject.teacher.user_id
+            )
+        members_by_room = {}
+        for room in rooms:
+            members = sorted(teacher_users_by_class.get(room.class_obj_id, set()))
+            members += [student.user_id for student in students_by_class.get(room.class_obj_id, [])]
+            members_by_room[room.id] = members
+
+        participants = self._bulk_create(ChatParticipant, (
+            ChatParticipant(room_id=room_id, user_id=user_id)
+            for room_id, members in members_by_room.items()
+            for user_id in members
+        ))
+
+        def messages():
+            room_ids = [room_id for room_id, members in members_by_room.items() if members]
+            if not room_ids:
+                return
+            for number in range(num_messages):
+                room_id = room_ids[number % len(room_ids)]
+                yield Message(
+                    room_id=room_id,
+                    sender_id=self.rng.choice(members_by_room[room_id]),
+                    content=f'Load test message {number}',
+                )
+
+        return {
+            'chat_participants': participants,
+            'messages': self._bulk_create(Message, messages()),
+        }
@@ -1,6 +1,7 @@
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
 from core.models import SystemSettings
+from core import session_state
 
 class MaintenanceModeMiddleware(MiddlewareMixin):
     def process_request(self, request):
@@ -39,7 +40,10 @@ class MaintenanceModeMiddleware(MiddlewareMixin):
 class SessionTimeoutMiddleware(MiddlewareMixin):
     def process_request(self, request):
         if request.user.is_authenticated:
-            settings = SystemSettings.get_solo()
-            timeout = settings.session_timeout * 60  # minutes to seconds
-            request.session.set_expiry(timeout)
+            # set_expiry rewrites the session row, so slide the expiry at most once per interval
+            if session_state.should_refresh_session_expiry(request.session.session_key):
+                settings = SystemSettings.get_solo()
+                timeout = settings.session_timeout * 60  # minutes to seconds
+                request.session.set_expiry(timeout)
+            session_state.touch_last_seen(request.user.pk)
         return None
\ No newline at end of file
@@ -23,4 +23,15 @@ class SubscriptionAccessPermission(BasePermission):
             else:
                 # Block all access
                 return False
-        return False  # No subscription, block access 
\ No newline at end of file
+        return False  # No subscription, block access 
+
+def school_id_param(value):
+    """A school_id given in a request as an int, or None when missing; raises ValidationError (400)"""
+    from rest_framework.exceptions import ValidationError
+
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({'school_id': 'A valid integer is required.'})
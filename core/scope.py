@@ -0,0 +1,149 @@
+"""
+Role-scoped visibility sets.
+
+UserScope resolves, once per request, which schools, classes, students and
+chat rooms a user can see, so viewsets filter with plain ``id__in`` lists
+instead of rebuilding multi-hop joins for every queryset. Scopes are cached per
+user; the cached copy is discarded when its school's scope version is bumped
+(teacher, class subject or student assignment changes, see core.signals) or
+when the user's own chat memberships change.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+SCHOOL_WIDE_ROLES = ['school_admin', 'principal', 'secretary', 'accountant']
+
+
+def _scope_key(user_id):
+    return f'user_scope:{user_id}'
+
+
+def _version_key(school_id):
+    return f'scope_version:{school_id}'
+
+
+def bump_school_scope(school_id):
+    """Invalidate the cached scopes of every user in a school"""
+    if school_id is None:
+        return
+    try:
+        cache.incr(_version_key(school_id))
+    except ValueError:
+        cache.set(_version_key(school_id), 1, None)
+
+
+def invalidate_user_scope(user_id):
+    cache.delete(_scope_key(user_id))
+
+
+class UserScope:
+    """Ids visible to one user; empty lists mean nothing is visible"""
+
+    FIELDS = [
+        'school_id', 'is_head_teacher', 'class_ids', 'head_class_ids', 'taught_class_ids',
+        'class_subject_pairs', 'student_ids', 'room_ids',
+    ]
+
+    def __init__(self, user, school_id=None, is_head_teacher=False, class_ids=(), head_class_ids=(), taught_class_ids=(),
+                 class_subject_pairs=(), student_ids=(), room_ids=()):
+        self.user = user
+        self.role = user.role
+        self.school_id = school_id
+        self.is_head_teacher = is_head_teacher
+        self.class_ids = list(class_ids)
+        self.head_class_ids = list(head_class_ids)
+        self.taught_class_ids = list(taught_class_ids)
+        self.class_subject_pairs = [tuple(pair) for pair in class_subject_pairs]
+        self.student_ids = list(student_ids)
+        self.room_ids = list(room_ids)
+
+    @property
+    def is_global(self):
+        return self.role == 'super_admin'
+
+    @property
+    def is_school_wide(self):
+        return self.role in SCHOOL_WIDE_ROLES
+
+    def class_subject_q(self, class_field='class_obj_id', subject_field='subject_id'):
+        """Q matching rows for the (class, subject) pairs a teacher teaches"""
+        q = Q(pk__in=[])
+        for class_id, subject_id in self.class_subject_pairs:
+            q |= Q(**{class_field: class_id, subject_field: subject_id})
+        return q
+
+    @classmethod
+    def for_user(cls, user):
+        """Return the user's scope, memoized on the user object for the request"""
+        scope = getattr(user, '_scope', None)
+        if scope is None:
+            scope = cls._load(user)
+            user._scope = scope
+        return scope
+
+    @classmethod
+    def _load(cls, user):
+        version = cache.get(_version_key(user.school_id), 0) if user.school_id else 0
+        cached = cache.get(_scope_key(user.pk))
+        if cached and (cached['version'], cached['role'], cached['school_id']) == (version, user.role, user.school_id):
+            return cls(user, **{field: cached[field] for field in cls.FIELDS})
+        scope = cls._resolve(user)
+        data = {field: getattr(scope, field) for field in cls.FIELDS}
+        data.update(version=version, role=user.role)
+        cache.set(_scope_key(user.pk), data, settings.USER_SCOPE_CACHE_TIMEOUT)
+        return scope
+
+    @classmethod
+    def _resolve(cls, user):
+        from chat.models import ChatRoom
+        from classes.relations import classes_headed_by, subjects_taught_by
+        from students.models import Student
+        from users.models import Teacher
+
+        if user.role == 'super_admin':
+            return cls(user, school_id=user.school_id)
+        if user.role in SCHOOL_WIDE_ROLES:
+            # Schools, classes and students are filtered by school for these roles, but chat is still per room
+            room_ids = ChatRoom.objects.filter(participants__user=user).values_list('id', flat=True).distinct()
+            return cls(user, school_id=user.school_id, room_ids=room_ids)
+
+        is_head_teacher, head_class_ids, taught_class_ids, pairs = False, [], [], []
+        if user.role == 'teacher':
+            # Classes a teacher teaches or heads, as classes.relations defines them
+            is_head_teacher = Teacher.objects.filter(user=user, is_head_teacher=True).exists()
+            pairs = list(subjects_taught_by(user.id))
+            taught_class_ids = sorted({class_id for class_id, _ in pairs})
+            head_class_ids = sorted(classes_headed_by(user.id).values_list('id', flat=True))
+            class_ids = sorted(set(taught_class_ids) | set(head_class_ids))
+            student_ids = list(Student.objects.filter(current_class_id__in=class_ids).values_list('id', flat=True))
+        elif user.role == 'student':
+            student = Student.objects.filter(user=user).values('id', 'current_class_id').first()
+            student_ids = [student['id']] if student else []
+            class_ids = [student['current_class_id']] if student and student['current_class_id'] else []
+        elif user.role == 'parent':
+            children = Student.objects.filter(parents__user=user).values_list('id', 'current_class_id')
+            student_ids = [student_id for student_id, _ in children]
+            class_ids = sorted({class_id for _, class_id in children if class_id})
+        else:
+            class_ids, student_ids = [], []
+
+        # Teachers see the class rooms of classes they teach, students that of their own class
+        room_class_ids = taught_class_ids if user.role == 'teacher' else class_ids if user.role == 'student' else []
+        room_ids = ChatRoom.objects.filter(
+            Q(participants__user=user) |
+            Q(room_type=ChatRoom.RoomType.CLASS, class_obj_id__in=room_class_ids)
+        ).values_list('id', flat=True).distinct()
+
+        return cls(
+            user,
+            school_id=user.school_id,
+            is_head_teacher=is_head_teacher,
+            class_ids=class_ids,
+            head_class_ids=head_class_ids,
+            taught_class_ids=taught_class_ids,
+            class_subject_pairs=pairs,
+            student_ids=student_ids,
+            room_ids=room_ids,
+        )
@@ -0,0 +1,52 @@
+"""
+Session and token state kept in the cache instead of the database.
+
+Backed by Redis when CACHE_REDIS_URL is set and by local memory otherwise:
+
+- revoked JWT ids (jti), kept until the token would have expired anyway
+- last-seen timestamps per user
+- throttled sliding-expiry refreshes, so a session row is rewritten at most
+  once per SESSION_STATE_REFRESH_INTERVAL seconds instead of on every request
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
+
+
+def _revoked_key(jti):
+    return f'revoked_jti:{jti}'
+
+
+def revoke_token(token):
+    """Mark a simplejwt token as revoked until its exp claim"""
+    ttl = int(token['exp'] - time.time())
+    if ttl > 0:
+        cache.set(_revoked_key(token[api_settings.JTI_CLAIM]), 1, ttl)
+
+
+def is_token_revoked(token):
+    return cache.get(_revoked_key(token.get(api_settings.JTI_CLAIM))) is not None
+
+
+def touch_last_seen(user_id):
+    """Record that the user was active now, at most once per refresh interval"""
+    if cache.add(f'last_seen_lock:{user_id}', 1, settings.SESSION_STATE_REFRESH_INTERVAL):
+        cache.set(f'last_seen:{user_id}', time.time(), None)
+
+
+def get_last_seen(user_id):
+    """Unix timestamp of the user's last authenticated request, or None"""
+    return cache.get(f'last_seen:{user_id}')
+
+
+def should_refresh_session_expiry(session_key):
+    """
+    True at most once per refresh interval per session. cache.add is atomic
+    (SET NX on Redis), so concurrent requests on the same session don't all win.
+    """
+    if not session_key:
+        return True
+    return cache.add(f'session_refresh:{session_key}', 1, settings.SESSION_STATE_REFRESH_INTERVAL)
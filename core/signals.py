@@ -1,7 +1,19 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Model
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from .models import SystemSettings
+from .dashboard import invalidate_tiles
+from .scope import bump_school_scope, invalidate_user_scope
+from schools import stats as school_stats
+from classes.attendance_stats import refresh_attendance_rollups
+from classes.timetable import schedule_changed, schedule_slot
+from fees import ledger as fee_ledger
+from fees.reports import invalidate_fee_reports
+from fees.rollups import refresh_finance_rollups
+from fees.signals import fees_overdue
 from django.conf import settings
+from django.utils import timezone
 
 try:
     from django_celery_beat.models import PeriodicTask, IntervalSchedule
@@ -32,4 +44,246 @@ def update_backup_schedule(sender, instance, **kwargs):
         name='auto-backup-task',
         task='core.tasks.run_auto_backup',
         enabled=True,
-    ) 
\ No newline at end of file
+    ) 
+
+
+# Scope invalidation (see core.scope): assignment changes bump the school's scope version
+@receiver([post_save, post_delete], sender='classes.ClassSubject')
+def class_subject_scope_changed(sender, instance, **kwargs):
+    bump_school_scope(instance.class_obj.school_id)
+
+
+@receiver([post_save, post_delete], sender='users.Teacher')
+def teacher_scope_changed(sender, instance, **kwargs):
+    bump_school_scope(instance.user.school_id)
+
+
+@receiver(m2m_changed, sender='users.Teacher_head_teacher_classes')
+def head_teacher_classes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_user_scope(instance.user_id)
+    elif pk_set is None:
+        # class_obj.head_teachers.clear(): the teachers it had are gone from the signal
+        bump_school_scope(instance.school_id)
+    else:
+        # class_obj.head_teachers changed: instance is the Class, pk_set holds Teacher ids
+        from users.models import Teacher
+        for user_id in Teacher.objects.filter(pk__in=pk_set).values_list('user_id', flat=True):
+            invalidate_user_scope(user_id)
+
+
+@receiver([post_save, post_delete], sender='students.Student')
+def student_scope_changed(sender, instance, **kwargs):
+    bump_school_scope(instance.school_id)
+
+
+@receiver(m2m_changed, sender='students.Student_parents')
+def student_parents_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_school_scope(instance.school_id)
+        return
+    # parent.children changed: instance is the Parent, pk_set holds Student ids
+    from students.models import Student
+    invalidate_user_scope(instance.user_id)
+    for school_id in Student.objects.filter(pk__in=pk_set or ()).values_list('school_id', flat=True).order_by().distinct():
+        bump_school_scope(school_id)
+
+
+@receiver([post_save, post_delete], sender='chat.ChatRoom')
+def chat_room_scope_changed(sender, instance, **kwargs):
+    if instance.class_obj_id:
+        bump_school_scope(instance.class_obj.school_id)
+
+
+@receiver([post_save, post_delete], sender='chat.ChatParticipant')
+def chat_participant_scope_changed(sender, instance, **kwargs):
+    invalidate_user_scope(instance.user_id)
+
+
+# Dashboard invalidation (see core.dashboard): writes mark the tiles that read them stale
+def _school_id_of(model_label, pk, path):
+    from django.apps import apps
+    return apps.get_model(model_label).objects.filter(pk=pk).values_list(path, flat=True).first()
+
+
+@receiver([post_save, post_delete], sender='users.User')
+@receiver([post_save, post_delete], sender='schools.School')
+@receiver([post_save, post_delete], sender='schools.Subscription')
+@receiver([post_save, post_delete], sender='classes.Class')
+def system_dashboard_changed(sender, instance, **kwargs):
+    invalidate_tiles(['system_totals'])
+
+
+@receiver([post_save, post_delete], sender='students.Student')
+def student_dashboard_changed(sender, instance, **kwargs):
+    invalidate_tiles(['teacher_stats', 'student_stats'], instance.school_id)
+
+
+@receiver([post_save, post_delete], sender='classes.ClassSubject')
+@receiver([post_save, post_delete], sender='classes.Assignment')
+def teaching_dashboard_changed(sender, instance, **kwargs):
+    invalidate_tiles(['teacher_stats'], _school_id_of('classes.Class', instance.class_obj_id, 'school_id'))
+
+
+@receiver([post_save, post_delete], sender='classes.AssignmentSubmission')
+def submission_dashboard_changed(sender, instance, **kwargs):
+    invalidate_tiles(['teacher_stats'], _school_id_of('students.Student', instance.student_id, 'school_id'))
+
+
+@receiver([post_save, post_delete], sender='classes.Attendance')
+def attendance_dashboard_changed(sender, instance, **kwargs):
+    invalidate_tiles(['student_stats'], _school_id_of('classes.Class', instance.class_obj_id, 'school_id'))
+
+
+@receiver([post_save, post_delete], sender='exams.ExamSchedule')
+def exam_schedule_dashboard_changed(sender, instance, **kwargs):
+    invalidate_tiles(['student_stats'], _school_id_of('exams.Exam', instance.exam_id, 'class_obj__school_id'))
+
+
+@receiver([post_save, post_delete], sender='fees.StudentFee')
+def student_fee_dashboard_changed(sender, instance, **kwargs):
+    invalidate_tiles(['student_stats'], _school_id_of('students.Student', instance.student_id, 'school_id'))
+
+
+@receiver([post_save, post_delete], sender='fees.Payment')
+def payment_dashboard_changed(sender, instance, **kwargs):
+    invalidate_tiles(
+        ['accountant_stats', 'student_stats'],
+        _school_id_of('fees.StudentFee', instance.student_fee_id, 'student__school_id'),
+    )
+
+
+# SchoolStats rollup (see schools.stats): tracked rows push their deltas to their school's row
+def _track_school_stats(label):
+    def pre_save_handler(sender, instance, update_fields=None, raw=False, **kwargs):
+        if not raw:
+            school_stats.remember_old_contribution(instance, update_fields)
+
+    def post_save_handler(sender, instance, created, update_fields=None, raw=False, **kwargs):
+        if not raw:
+            school_stats.record_save(instance, created, update_fields)
+
+    def post_delete_handler(sender, instance, **kwargs):
+        school_stats.record_delete(instance)
+
+    uid = f'school_stats:{label}'
+    pre_save.connect(pre_save_handler, sender=label, weak=False, dispatch_uid=uid)
+    post_save.connect(post_save_handler, sender=label, weak=False, dispatch_uid=uid)
+    post_delete.connect(post_delete_handler, sender=label, weak=False, dispatch_uid=uid)
+
+
+for _label in school_stats.TRACKED:
+    _track_school_stats(_label)
+
+
+# Attendance rollups (see classes.attendance_stats); bulk_mark refreshes them itself
+@receiver([post_save, post_delete], sender='classes.Attendance')
+def attendance_rollups_changed(sender, instance, origin=None, **kwargs):
+    # origin is the instance or queryset whose delete() started the cascade
+    origin_model = type(origin) if isinstance(origin, Model) else getattr(origin, 'model', None)
+    if origin_model is not None and origin_model is not sender:
+        # Cascade from a deleted class or student: its rollup rows go with it
+        return
+    refresh_attendance_rollups(instance.class_obj_id, [instance.date], [instance.student_id])
+
+
+# Timetable conflict index (see classes.timetable): committed slot writes bump the school's version
+@receiver(post_save, sender='classes.ClassSchedule')
+def timetable_slot_saved(sender, instance, **kwargs):
+    school_id = _school_id_of('classes.Class', instance.class_obj_id, 'school_id')
+    slot = schedule_slot(instance)
+    transaction.on_commit(lambda: schedule_changed(school_id, instance.pk, slot))
+
+
+@receiver(post_delete, sender='classes.ClassSchedule')
+def timetable_slot_deleted(sender, instance, **kwargs):
+    school_id = _school_id_of('classes.Class', instance.class_obj_id, 'school_id')
+    transaction.on_commit(lambda: schedule_changed(school_id, instance.pk))
+
+
+# Fee ledger (see fees.ledger): fee and payment writes post the entries that bring the ledger in line
+def _origin_label(origin):
+    # origin is the instance or queryset whose delete() started the cascade
+    origin_model = type(origin) if isinstance(origin, Model) else getattr(origin, 'model', None)
+    return origin_model._meta.label if origin_model is not None else None
+
+
+def _deleted_with_student(origin):
+    # A deleted student, school or user takes the student's whole ledger with it
+    return _origin_label(origin) in ('students.Student', 'schools.School', 'users.User')
+
+
+@receiver(post_save, sender='fees.StudentFee')
+def student_fee_ledger_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fee_ledger.sync_fee(instance)
+
+
+@receiver(post_delete, sender='fees.StudentFee')
+def student_fee_ledger_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_student(origin):
+        fee_ledger.sync_fee(instance, deleted=True)
+
+
+@receiver(post_save, sender='fees.Payment')
+def payment_ledger_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fee_ledger.sync_payment(instance)
+
+
+@receiver(post_delete, sender='fees.Payment')
+def payment_ledger_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_student(origin):
+        fee_ledger.sync_payment(instance, deleted=True)
+
+
+# Fee report cache (see fees.reports): committed fee and payment writes bump the school's report version
+@receiver([post_save, post_delete], sender='fees.StudentFee')
+def student_fee_reports_changed(sender, instance, **kwargs):
+    school_id = _school_id_of('students.Student', instance.student_id, 'school_id')
+    transaction.on_commit(lambda: invalidate_fee_reports(school_id))
+
+
+@receiver([post_save, post_delete], sender='fees.Payment')
+def payment_reports_changed(sender, instance, **kwargs):
+    school_id = _school_id_of('fees.StudentFee', instance.student_fee_id, 'student__school_id')
+    transaction.on_commit(lambda: invalidate_fee_reports(school_id))
+
+
+@receiver([post_save, post_delete], sender='students.Student')
+def student_reports_changed(sender, instance, **kwargs):
+    # The class-wise report groups fees by the students' current class and counts class sizes
+    school_id = instance.school_id
+    transaction.on_commit(lambda: invalidate_fee_reports(school_id))
+
+
+# Daily finance rollups (see fees.rollups); registered after the ledger receivers, which move paid_amount first
+@receiver([post_save, post_delete], sender='fees.StudentFee')
+def student_fee_rollups_changed(sender, instance, origin=None, **kwargs):
+    if _origin_label(origin) == 'schools.School':
+        return
+    school_id = _school_id_of('students.Student', instance.student_id, 'school_id')
+    refresh_finance_rollups(school_id, [instance.due_date])
+
+
+@receiver([post_save, post_delete], sender='fees.Payment')
+def payment_rollups_changed(sender, instance, origin=None, **kwargs):
+    if _origin_label(origin) == 'schools.School':
+        return
+    from fees.models import StudentFee
+    school_id, due_date = StudentFee.objects.filter(pk=instance.student_fee_id).values_list(
+        'student__school_id', 'due_date',
+    ).first() or (None, None)
+    # The payment counts on the day it was received; its fee's unpaid part counts on the fee's due date
+    refresh_finance_rollups(school_id, [timezone.localdate(instance.created_at), due_date])
+
+
+# Fee reminders (see fees.reminders): guardians hear about fees as soon as the sweep marks them overdue
+@receiver(fees_overdue)
+def fees_overdue_remind(sender, school_id, fee_ids, **kwargs):
+    from fees.tasks import send_school_fee_reminders
+    send_school_fee_reminders.delay(school_id, fee_ids)
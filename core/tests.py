@@ -1,3 +1,169 @@
+from datetime import date
+from io import StringIO
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.http import QueryDict
 from django.test import TestCase
 
-# Create your tests here.
+from chat.models import ChatParticipant, ChatRoom, Message
+from chat.views import ChatRoomViewSet, MessageViewSet
+from classes.models import Attendance, Class, ClassAttendanceDaily, ClassSubject, Subject
+from classes.views import ClassViewSet
+from fees.ledger import backfill_ledger
+from fees.models import Payment, ReceiptSequence, SchoolFinanceDaily, StudentBalance, StudentFee
+from fees.payments import allocate_receipt_numbers
+from fees.views import StudentFeeViewSet
+from schools.models import School, SchoolStats
+from students.models import Student
+from students.views import StudentViewSet
+from users.models import Parent, Teacher, User
+from .scope import UserScope
+
+
+class UserScopeQuerysetTests(TestCase):
+    """Viewsets filtered by UserScope show each role what it may see"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Scope School', code='USS', address='1 Main St', phone='555-0100', email='office@uss.test',
+            principal_name='Pat Principal', principal_email='principal@uss.test', principal_phone='555-0101',
+        )
+        cls.taught, cls.headed, cls.other = [
+            Class.objects.create(school=cls.school, name=name, academic_year='2024-2025')
+            for name in ('Grade 1', 'Grade 2', 'Grade 3')
+        ]
+        cls.teacher_user = User.objects.create_user('uss-teacher', role=User.UserRole.TEACHER, school=cls.school)
+        teacher = Teacher.objects.create(user=cls.teacher_user, employee_id='USS-T1', department='-', qualification='-')
+        ClassSubject.objects.create(
+            class_obj=cls.taught, subject=Subject.objects.create(name='Maths', code='USS-MTH'), teacher=teacher,
+        )
+        teacher.head_teacher_classes.add(cls.headed)
+        cls.students = {
+            class_obj: Student.objects.create(
+                user=User.objects.create_user(f'uss-{class_obj.name}', role=User.UserRole.STUDENT, school=cls.school),
+                school=cls.school, current_class=class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            for class_obj in (cls.taught, cls.headed, cls.other)
+        }
+        cls.parent_user = User.objects.create_user('uss-parent', role=User.UserRole.PARENT, school=cls.school)
+        Parent.objects.create(user=cls.parent_user, occupation='-', emergency_contact='555').children.add(
+            cls.students[cls.other],
+        )
+        cls.fees = {
+            student: StudentFee.objects.create(student=student, due_date=date(2025, 1, 1), amount=10)
+            for student in cls.students.values()
+        }
+
+        cls.accountant = User.objects.create_user('uss-accountant', role=User.UserRole.ACCOUNTANT, school=cls.school)
+        cls.secretary = User.objects.create_user('uss-secretary', role=User.UserRole.SECRETARY, school=cls.school)
+        cls.staff_room = ChatRoom.objects.create(name='Staff')
+        cls.class_room = ChatRoom.objects.create(name='Grade 1', room_type=ChatRoom.RoomType.CLASS, class_obj=cls.taught)
+        ChatRoom.objects.create(name='Elsewhere')
+        for user in (cls.accountant, cls.secretary):
+            ChatParticipant.objects.create(room=cls.staff_room, user=user)
+        Message.objects.create(room=cls.staff_room, sender=cls.accountant, content='Hello')
+
+    def get_queryset(self, view_class, user):
+        view = view_class()
+        view.request = SimpleNamespace(user=user, query_params=QueryDict())
+        return view.get_queryset()
+
+    def test_chat(self):
+        student = self.students[self.taught].user
+        self.assertEqual(UserScope.for_user(self.accountant).room_ids, [self.staff_room.id])
+        self.assertEqual(UserScope.for_user(self.secretary).room_ids, [self.staff_room.id])
+        self.assertEqual(list(self.get_queryset(ChatRoomViewSet, self.accountant)), [self.staff_room])
+        self.assertEqual(list(self.get_queryset(ChatRoomViewSet, student)), [self.class_room])
+        for user in (self.accountant, self.secretary):
+            self.assertEqual(self.get_queryset(MessageViewSet, user).count(), 1)
+        self.assertEqual(self.get_queryset(MessageViewSet, student).count(), 0)
+
+    def test_students_fees_and_classes(self):
+        student = self.students[self.taught]
+        self.assertEqual(
+            set(self.get_queryset(StudentViewSet, self.teacher_user)), {student, self.students[self.headed]},
+        )
+        self.assertEqual(list(self.get_queryset(StudentViewSet, self.parent_user)), [self.students[self.other]])
+        self.assertEqual(list(self.get_queryset(StudentViewSet, student.user)), [student])
+        self.assertEqual(list(self.get_queryset(StudentFeeViewSet, student.user)), [self.fees[student]])
+        self.assertEqual(self.get_queryset(StudentFeeViewSet, self.accountant).count(), 3)
+        self.assertEqual(set(self.get_queryset(ClassViewSet, self.teacher_user)), {self.taught, self.headed})
+        self.assertEqual(list(self.get_queryset(ClassViewSet, student.user)), [self.taught])
+
+
+    def test_reverse_m2m_changes_invalidate_scopes(self):
+        def scope(user):
+            return UserScope.for_user(User.objects.get(pk=user.pk))
+
+        cache.clear()
+        parent = self.parent_user.parent_profile
+        self.assertEqual(scope(self.parent_user).student_ids, [self.students[self.other].id])
+        parent.children.add(self.students[self.taught])
+        self.assertEqual(
+            sorted(scope(self.parent_user).student_ids), sorted([self.students[self.other].id, self.students[self.taught].id]),
+        )
+        parent.children.clear()
+        self.assertEqual(scope(self.parent_user).student_ids, [])
+
+        self.assertNotIn(self.other.id, scope(self.teacher_user).class_ids)
+        self.other.head_teachers.add(self.teacher_user.teacher_profile)
+        self.assertIn(self.other.id, scope(self.teacher_user).class_ids)
+        self.other.head_teachers.clear()
+        self.assertNotIn(self.other.id, scope(self.teacher_user).class_ids)
+
+class SeedLoadDataTests(TestCase):
+    """seed_load_data writes a small tenant set whose rollups and ledger match the rows it inserted"""
+
+    def seed(self, **options):
+        call_command(
+            'seed_load_data', schools=2, students=30, attendance_days=2, messages=20, fee_months=2,
+            prefix='SMK', stdout=StringIO(), **options,
+        )
+
+    def test_seed_builds_rollups_and_ledger(self):
+        self.seed()
+        schools = School.objects.filter(code__startswith='SMK-')
+        self.assertEqual(schools.count(), 2)
+        stats = SchoolStats.objects.filter(school__in=schools).aggregate(
+            students=Sum('total_students'), attendance=Sum('attendance_total'), collected=Sum('fees_collected'),
+        )
+        self.assertEqual(stats['students'], 30)
+        self.assertEqual(stats['attendance'], Attendance.objects.count())
+        self.assertEqual(stats['collected'], Payment.objects.aggregate(total=Sum('amount'))['total'])
+        self.assertEqual(
+            ClassAttendanceDaily.objects.aggregate(present=Sum('present'))['present'],
+            Attendance.objects.filter(status='present').count(),
+        )
+        self.assertEqual(
+            SchoolFinanceDaily.objects.aggregate(billed=Sum('billed'))['billed'],
+            StudentFee.objects.aggregate(billed=Sum('amount'))['billed'],
+        )
+        owed = sum(fee.balance for fee in StudentFee.objects.all())
+        self.assertEqual(StudentBalance.objects.aggregate(balance=Sum('balance'))['balance'], owed)
+        # The ledger is already in step with the fees and payments
+        self.assertEqual(backfill_ledger(), (0, 0))
+
+    def test_receipt_numbers_carry_on_from_the_seeded_payments(self):
+        self.seed()
+        for school in School.objects.filter(code__startswith='SMK-'):
+            receipts = set(Payment.objects.filter(
+                student_fee__student__school=school,
+            ).values_list('receipt_number', flat=True))
+            self.assertEqual(ReceiptSequence.objects.get(school=school).last_number, len(receipts))
+            self.assertIn(f'{school.code}-{len(receipts):07d}', receipts)
+            # The next live payment gets a fresh number in the same format
+            [number] = allocate_receipt_numbers(school.id, 1)
+            self.assertEqual(number, f'{school.code}-{len(receipts) + 1:07d}')
+            self.assertNotIn(number, receipts)
+
+    def test_existing_data_needs_flush(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+        self.seed(flush=True)
+        self.assertEqual(Student.objects.count(), 30)
@@ -82,32 +82,39 @@ class ExamResult(models.Model):
     def __str__(self):
         return f"{self.student.user.get_full_name()} - {self.exam.name}"
     
+    @staticmethod
+    def calculate_grade(marks_obtained, total_marks):
+        """Return the letter grade for a score, or None if it cannot be graded"""
+        if not marks_obtained or not total_marks:
+            return None
+        percentage = (marks_obtained / total_marks) * 100
+        if percentage >= 97:
+            return 'A+'
+        elif percentage >= 93:
+            return 'A'
+        elif percentage >= 90:
+            return 'A-'
+        elif percentage >= 87:
+            return 'B+'
+        elif percentage >= 83:
+            return 'B'
+        elif percentage >= 80:
+            return 'B-'
+        elif percentage >= 77:
+            return 'C+'
+        elif percentage >= 73:
+            return 'C'
+        elif percentage >= 70:
+            return 'C-'
+        elif percentage >= 67:
+            return 'D+'
+        elif percentage >= 63:
+            return 'D'
+        return 'F'
+    
     def save(self, *args, **kwargs):
         # Auto-calculate grade based on percentage
-        if self.marks_obtained and self.total_marks:
-            percentage = (self.marks_obtained / self.total_marks) * 100
-            if percentage >= 97:
-                self.grade = 'A+'
-            elif percentage >= 93:
-                self.grade = 'A'
-            elif percentage >= 90:
-                self.grade = 'A-'
-            elif percentage >= 87:
-                self.grade = 'B+'
-            elif percentage >= 83:
-                self.grade = 'B'
-            elif percentage >= 80:
-                self.grade = 'B-'
-            elif percentage >= 77:
-                self.grade = 'C+'
-            elif percentage >= 73:
-                self.grade = 'C'
-            elif percentage >= 70:
-                self.grade = 'C-'
-            elif percentage >= 67:
-                self.grade = 'D+'
-            elif percentage >= 63:
-                self.grade = 'D'
-            else:
-                self.grade = 'F'
+        grade = self.calculate_grade(self.marks_obtained, self.total_marks)
+        if grade:
+            self.grade = grade
         super().save(*args, **kwargs)
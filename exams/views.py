@@ -4,6 +4,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db.models import Q
 from rest_framework.exceptions import PermissionDenied
+from core.scope import UserScope
 from .models import Exam, ExamSchedule, ExamResult
 from .serializers import (
     ExamSerializer, ExamScheduleSerializer, ExamResultSerializer
@@ -25,26 +26,14 @@ class ExamViewSet(viewsets.ModelViewSet):
         elif user.role in ['school_admin', 'secretary']:
             return Exam.objects.filter(class_obj__school=user.school)
         elif user.role == 'teacher':
-            try:
-                teacher = user.teacher_profile
-                if teacher.is_head_teacher:
-                    # Head teachers can see exams for their assigned classes
-                    return Exam.objects.filter(
-                        class_obj__in=teacher.head_teacher_classes.all(),
-                        class_obj__school=user.school
-                    )
-                else:
-                    # Regular teachers can see exams for subjects they teach
-                    return Exam.objects.filter(subject__teacher=teacher)
-            except:
-                return Exam.objects.none()
+            scope = UserScope.for_user(user)
+            if scope.is_head_teacher:
+                # Head teachers can see exams for their assigned classes
+                return Exam.objects.filter(class_obj_id__in=scope.head_class_ids)
+            # Regular teachers can see exams for the subjects they teach in each class
+            return Exam.objects.filter(scope.class_subject_q())
         elif user.role == 'student':
-            try:
-                student = user.student_profile
-                if student.current_class:
-                    return Exam.objects.filter(class_obj=student.current_class)
-            except:
-                return Exam.objects.none()
+            return Exam.objects.filter(class_obj_id__in=UserScope.for_user(user).class_ids)
         return Exam.objects.none()
     
     @action(detail=True, methods=['get'])
@@ -71,26 +60,14 @@ class ExamScheduleViewSet(viewsets.ModelViewSet):
         elif user.role in ['school_admin', 'secretary']:
             return ExamSchedule.objects.filter(exam__class_obj__school=user.school)
         elif user.role == 'teacher':
-            try:
-                teacher = user.teacher_profile
-                if teacher.is_head_teacher:
-                    # Head teachers can see schedules for their assigned classes
-                    return ExamSchedule.objects.filter(
-                        exam__class_obj__in=teacher.head_teacher_classes.all(),
-                        exam__class_obj__school=user.school
-                    )
-                else:
-                    # Regular teachers can see schedules for subjects they teach
-                    return ExamSchedule.objects.filter(exam__subject__teacher=teacher)
-            except:
-                return ExamSchedule.objects.none()
+            scope = UserScope.for_user(user)
+            if scope.is_head_teacher:
+                # Head teachers can see schedules for their assigned classes
+                return ExamSchedule.objects.filter(exam__class_obj_id__in=scope.head_class_ids)
+            # Regular teachers can see schedules for the subjects they teach in each class
+            return ExamSchedule.objects.filter(scope.class_subject_q('exam__class_obj_id', 'exam__subject_id'))
         elif user.role == 'student':
-            try:
-                student = user.student_profile
-                if student.current_class:
-                    return ExamSchedule.objects.filter(exam__class_obj=student.current_class)
-            except:
-                return ExamSchedule.objects.none()
+            return ExamSchedule.objects.filter(exam__class_obj_id__in=UserScope.for_user(user).class_ids)
         return ExamSchedule.objects.none()
     
     @action(detail=False, methods=['get'])
@@ -119,25 +96,14 @@ class ExamResultViewSet(viewsets.ModelViewSet):
         elif user.role in ['school_admin', 'secretary']:
             return ExamResult.objects.filter(exam__class_obj__school=user.school)
         elif user.role == 'teacher':
-            try:
-                teacher = user.teacher_profile
-                if teacher.is_head_teacher:
-                    # Head teachers can see results for their assigned classes
-                    return ExamResult.objects.filter(
-                        exam__class_obj__in=teacher.head_teacher_classes.all(),
-                        exam__class_obj__school=user.school
-                    )
-                else:
-                    # Regular teachers can see results for subjects they teach
-                    return ExamResult.objects.filter(exam__subject__teacher=teacher)
-            except:
-                return ExamResult.objects.none()
+            scope = UserScope.for_user(user)
+            if scope.is_head_teacher:
+                # Head teachers can see results for their assigned classes
+                return ExamResult.objects.filter(exam__class_obj_id__in=scope.head_class_ids)
+            # Regular teachers can see results for the subjects they teach in each class
+            return ExamResult.objects.filter(scope.class_subject_q('exam__class_obj_id', 'exam__subject_id'))
         elif user.role == 'student':
-            try:
-                student = user.student_profile
-                return ExamResult.objects.filter(student=student)
-            except:
-                return ExamResult.objects.none()
+            return ExamResult.objects.filter(student_id__in=UserScope.for_user(user).student_ids)
         return ExamResult.objects.none()
     
     def check_grade_permissions(self, user, exam_id=None, class_id=None):
@@ -0,0 +1,194 @@
+"""
+Billing runs.
+
+run_billing charges a school's enrolled students for one period (a month)
+from the active FeeStructure rows of their class's academic year:
+
+* monthly structures bill every month, quarterly ones in January, April,
+  July and October, annual and one-time ones in ANNUAL_BILLING_MONTH;
+* a student has one StudentFee per (structure, due date), so structures of
+  the same frequency are billed together as one fee;
+* current Scholarships discount each fee: their percentages add up to at
+  most 100%, then fixed amounts come off, down to zero.
+
+Students are billed in chunks of ``chunk_size`` in id order, each chunk in
+one transaction: one bulk_create(ignore_conflicts=True) for the fees, then
+the charge and scholarship ledger entries of every fee of the chunk that has
+none yet. Fees that already exist are left alone, so repeating a run is a
+no-op and an interrupted run resumes with ``start_after``, the last student
+id of the last committed chunk.
+"""
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+
+from .ledger import post_entries
+from .models import FeeStructure, LedgerEntry, Scholarship, StudentFee
+from .rollups import refresh_finance_rollups
+
+FREQUENCY_STRUCTURES = {'monthly': 'monthly', 'quarterly': 'quarterly', 'annually': 'yearly', 'one_time': 'one_time'}
+QUARTER_MONTHS = (1, 4, 7, 10)
+ANNUAL_BILLING_MONTH = 9  # Start of the academic year
+DEFAULT_CHUNK_SIZE = 2000
+CENT = Decimal('0.01')
+
+
+def parse_period(value):
+    """First day of the month given as a date or 'YYYY-MM'; raises ValueError"""
+    if isinstance(value, datetime.date):
+        return value.replace(day=1)
+    try:
+        return datetime.datetime.strptime(str(value)[:7], '%Y-%m').date()
+    except ValueError:
+        raise ValueError('period must be given as YYYY-MM')
+
+
+def frequencies_due(period):
+    """FeeStructure frequencies billed in the month starting at ``period``"""
+    frequencies = ['monthly']
+    if period.month in QUARTER_MONTHS:
+        frequencies.append('quarterly')
+    if period.month == ANNUAL_BILLING_MONTH:
+        frequencies.extend(['annually', 'one_time'])
+    return frequencies
+
+
+def scholarship_discount(gross, scholarships):
+    """Discount on ``gross`` from (percentage, fixed amount) pairs of current scholarships"""
+    if not scholarships:
+        return Decimal(0)
+    percentage = min(sum(percentage for percentage, _ in scholarships), 100)
+    discount = gross * percentage / 100 + sum(amount or 0 for _, amount in scholarships)
+    return min(discount.quantize(CENT), gross)
+
+
+def _billing_plan(school_id, period):
+    """class id -> [(StudentFee.structure, gross amount, FeeStructure id or None, label)]"""
+    grouped = defaultdict(list)
+    for structure_id, class_id, frequency, amount, category in FeeStructure.objects.filter(
+        class_obj__school_id=school_id, class_obj__is_active=True, is_active=True,
+        academic_year=F('class_obj__academic_year'), frequency__in=frequencies_due(period),
+    ).values_list('id', 'class_obj_id', 'frequency', 'amount', 'category__name').order_by('category__name'):
+        grouped[class_id, FREQUENCY_STRUCTURES[frequency]].append((structure_id, amount, category))
+
+    plan = defaultdict(list)
+    for (class_id, structure), rows in grouped.items():
+        plan[class_id].append((
+            structure,
+            sum(amount for _, amount, _ in rows),
+            rows[0][0] if len(rows) == 1 else None,
+            ', '.join(category for _, _, category in rows),
+        ))
+    return plan
+
+
+def run_billing(school_id, period, chunk_size=DEFAULT_CHUNK_SIZE, start_after=None, dry_run=False, progress=None):
+    """
+    Bill a school's enrolled students for ``period``; see the module docstring.
+
+    ``progress(summary)`` is called after every chunk. Returns the summary:
+    students billed, fees created and already present, gross billed and
+    scholarship discounts (as strings), and the last student id reached.
+    """
+    from students.models import Student
+
+    period = parse_period(period)
+    plan = _billing_plan(school_id, period)
+    students = Student.objects.filter(
+        school_id=school_id, academic_status='enrolled', current_class_id__in=list(plan),
+    )
+    if start_after:
+        students = students.filter(id__gt=start_after)
+
+    totals = {'students': 0, 'fees_created': 0, 'fees_existing': 0, 'billed': Decimal(0), 'discounts': Decimal(0)}
+    summary = {'school_id': school_id, 'period': period.strftime('%Y-%m'), 'dry_run': dry_run,
+               'total_students': students.count(), 'last_student_id': start_after}
+    last_id = start_after or 0
+    while True:
+        chunk = list(students.filter(id__gt=last_id).order_by('id').values_list('id', 'current_class_id')[:chunk_size])
+        if not chunk:
+            break
+        _bill_chunk(school_id, period, chunk, plan, totals, dry_run)
+        last_id = summary['last_student_id'] = chunk[-1][0]
+        summary.update(totals, billed=str(totals['billed']), discounts=str(totals['discounts']))
+        if progress:
+            progress(summary)
+    summary.update(totals, billed=str(totals['billed']), discounts=str(totals['discounts']))
+    if totals['fees_created'] and not dry_run:
+        # Once per run: every chunk adds to the same day of the rollup
+        refresh_finance_rollups(school_id, [period])
+    return summary
+
+
+def _bill_chunk(school_id, period, chunk, plan, totals, dry_run):
+    student_ids = [student_id for student_id, _ in chunk]
+    structures = {structure for rows in plan.values() for structure, _, _, _ in rows}
+    scholarships = defaultdict(list)
+    for student_id, percentage, amount in Scholarship.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=period),
+        student_id__in=student_ids, is_active=True, start_date__lte=period,
+    ).values_list('student_id', 'percentage', 'amount'):
+        scholarships[student_id].append((percentage, amount))
+    existing = set(StudentFee.objects.filter(
+        student_id__in=student_ids, due_date=period, structure__in=structures,
+    ).values_list('student_id', 'structure'))
+
+    fees, charges = [], {}
+    for student_id, class_id in chunk:
+        for structure, gross, structure_id, label in plan[class_id]:
+            if (student_id, structure) in existing:
+                totals['fees_existing'] += 1
+                continue
+            discount = scholarship_discount(gross, scholarships.get(student_id))
+            charges[student_id, structure] = (gross, discount, label)
+            fees.append(StudentFee(
+                student_id=student_id, fee_structure_id=structure_id, structure=structure, due_date=period,
+                amount=gross - discount, remarks=label,
+                status=StudentFee.Status.PENDING if gross > discount else StudentFee.Status.PAID,
+            ))
+            totals['fees_created'] += 1
+            totals['billed'] += gross
+            totals['discounts'] += discount
+    totals['students'] += len(chunk)
+    if dry_run or not fees:
+        return
+
+    with transaction.atomic():
+        StudentFee.objects.bulk_create(fees, batch_size=1000, ignore_conflicts=True)
+        # Ids are not returned for ignore_conflicts inserts, so read back the chunk's fees without ledger entries
+        unposted = StudentFee.objects.filter(
+            ~Exists(LedgerEntry.objects.filter(student_fee_id=OuterRef('pk'))),
+            student_id__in=student_ids, due_date=period, structure__in=structures,
+        ).values_list('id', 'student_id', 'structure', 'amount')
+        entries = []
+        for fee_id, student_id, structure, amount in unposted:
+            gross, discount, label = charges.get((student_id, structure), (amount, 0, ''))
+            description = f'{label or structure.capitalize()} fee due {period}'
+            entries.append(LedgerEntry(
+                student_id=student_id, student_fee_id=fee_id, entry_type=LedgerEntry.EntryType.CHARGE,
+                amount=gross, description=description,
+            ))
+            entries.append(LedgerEntry(
+                student_id=student_id, student_fee_id=fee_id, entry_type=LedgerEntry.EntryType.SCHOLARSHIP,
+                amount=-discount, description=f'Scholarship on {description}',
+            ))
+        post_entries(entries)
+        _record_billing(school_id, sum(gross - discount for gross, discount, _ in charges.values()))
+
+
+def _record_billing(school_id, billed):
+    """bulk_create skips the signals that keep the rollups and dashboards current, so do their work here"""
+    from core.dashboard import invalidate_tiles
+    from schools.stats import apply_deltas, refresh_pending_students
+    from .reports import invalidate_fee_reports
+
+    apply_deltas(school_id, {'fees_billed': billed})
+    refresh_pending_students(school_id)
+    transaction.on_commit(lambda: (
+        invalidate_tiles(['student_stats'], school_id),
+        invalidate_fee_reports(school_id),
+    ))
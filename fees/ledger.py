@@ -0,0 +1,200 @@
+"""
+Per-student fee ledger.
+
+Every change to what a student owes is appended to LedgerEntry, and the
+student's StudentBalance row holds the balance after their latest entry.
+Posting locks that row, so concurrent writers for one student queue up and
+each entry gets the next sequence number and running balance. Per-fee paid
+totals live on StudentFee.paid_amount and move in the same transaction.
+
+Fees and payments are reconciled rather than diffed: sync_fee and
+sync_payment compare what a row should contribute to the balance with the
+sum of the entries already posted for it, and post the difference. Signals
+call them on every save and delete (see core.signals), the backfill command
+calls them for rows written before the ledger existed, and calling them
+again is a no-op.
+
+What a row contributes:
+
+* a fee charges its amount, and a waived fee gets a waiver entry for
+  whatever had not been paid when it was waived;
+* a completed payment credits its amount; a refunded, failed or pending one
+  credits nothing, so refunding a completed payment posts a refund entry.
+
+Moving a fee's paid total also re-settles its status (settled_status), so a
+refunded fee is open again and a fee paid in full is marked paid.
+
+Reading balances is then a single indexed query: class_balances and
+school_arrears never touch fees or payments.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import LedgerEntry, Payment, StudentBalance, StudentFee
+
+ZERO = Decimal('0.00')
+PAYMENT_SIDE = Q(payment_id__isnull=False)
+WAIVER = Q(entry_type=LedgerEntry.EntryType.WAIVER)
+
+
+def post_entries(entries):
+    """
+    Append unsaved LedgerEntry objects, for any number of students.
+
+    Each student's StudentBalance row is created if needed and locked, the
+    entries get consecutive sequence numbers and running balances in list
+    order, and the entries and balances are written with one bulk_create
+    each. Zero amounts are dropped. Returns the saved entries.
+    """
+    from students.models import Student
+
+    entries = [entry for entry in entries if entry.amount]
+    if not entries:
+        return []
+    student_ids = {entry.student_id for entry in entries}
+    with transaction.atomic():
+        missing = student_ids - set(
+            StudentBalance.objects.filter(student_id__in=student_ids).values_list('student_id', flat=True)
+        )
+        if missing:
+            StudentBalance.objects.bulk_create([
+                StudentBalance(student_id=student_id, school_id=school_id)
+                for student_id, school_id in Student.objects.filter(id__in=missing).values_list('id', 'school_id')
+            ], ignore_conflicts=True)
+        # Lock in a fixed order so two multi-student posts cannot deadlock
+        balances = {
+            row.student_id: row
+            for row in StudentBalance.objects.select_for_update().filter(student_id__in=student_ids).order_by('student_id')
+        }
+        now = timezone.now()
+        for entry in entries:
+            row = balances[entry.student_id]
+            row.last_sequence += 1
+            row.balance += entry.amount
+            row.updated_at = now
+            entry.sequence, entry.balance_after = row.last_sequence, row.balance
+        LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+        # The rows are locked, so write them back with one upsert per batch rather than bulk_update's CASE chains
+        StudentBalance.objects.bulk_create(
+            balances.values(), batch_size=1000, update_conflicts=True, unique_fields=['student'],
+            update_fields=['balance', 'last_sequence', 'updated_at'],
+        )
+    return entries
+
+
+def _fee_label(fee):
+    return f'{fee.get_structure_display()} fee due {fee.due_date}'
+
+
+def sync_fee(fee, deleted=False):
+    """Post the entries that bring a fee's charge and waiver in line with the row; returns them"""
+    posted = LedgerEntry.objects.filter(student_fee_id=fee.pk).aggregate(
+        charged=Sum('amount', filter=~PAYMENT_SIDE & ~WAIVER),
+        charges=Count('id', filter=~PAYMENT_SIDE & ~WAIVER),
+        waived=Sum('amount', filter=WAIVER),
+        paid=Sum('amount', filter=PAYMENT_SIDE),
+    )
+    charged, waived = posted['charged'] or ZERO, posted['waived'] or ZERO
+    paid = -(posted['paid'] or ZERO)
+
+    charge_target = ZERO if deleted else fee.amount
+    waiver_target = ZERO
+    if not deleted and fee.status == StudentFee.Status.WAIVED:
+        waiver_target = -max(fee.amount - paid, ZERO)
+
+    entries = []
+    if charge_target != charged:
+        first = not posted['charges'] and not deleted
+        entries.append(LedgerEntry(
+            student_id=fee.student_id, student_fee_id=fee.pk,
+            entry_type=LedgerEntry.EntryType.CHARGE if first else LedgerEntry.EntryType.ADJUSTMENT,
+            amount=charge_target - charged,
+            description=_fee_label(fee) if first else f'{_fee_label(fee)} {"removed" if deleted else "amended"}',
+        ))
+    if waiver_target != waived:
+        entries.append(LedgerEntry(
+            student_id=fee.student_id, student_fee_id=fee.pk, entry_type=LedgerEntry.EntryType.WAIVER,
+            amount=waiver_target - waived,
+            description=f'{_fee_label(fee)} {"waived" if waiver_target else "waiver withdrawn"}',
+        ))
+    return post_entries(entries)
+
+
+def settled_status(fee, paid_amount, today=None):
+    """Status of a fee with ``paid_amount`` paid: paid in full, else overdue past its due date, else partial or pending"""
+    if fee.status == StudentFee.Status.WAIVED:
+        return fee.status
+    if paid_amount >= fee.amount:
+        return StudentFee.Status.PAID
+    if fee.due_date < (today or timezone.localdate()):
+        return StudentFee.Status.OVERDUE
+    return StudentFee.Status.PARTIAL if paid_amount > 0 else StudentFee.Status.PENDING
+
+
+def sync_payment(payment, deleted=False):
+    """Post the entry that brings a payment's credit in line with the row, and move its fee's paid total and status"""
+    posted = LedgerEntry.objects.filter(payment_id=payment.pk).aggregate(total=Sum('amount'))['total'] or ZERO
+    target = -payment.amount if not deleted and payment.status == Payment.Status.COMPLETED else ZERO
+    delta = target - posted
+    if not delta:
+        return []
+
+    if delta < 0:
+        entry_type, description = LedgerEntry.EntryType.PAYMENT, f'Payment {payment.receipt_number}'
+    elif payment.status == Payment.Status.REFUNDED and not deleted:
+        entry_type, description = LedgerEntry.EntryType.REFUND, f'Refund of payment {payment.receipt_number}'
+    else:
+        entry_type = LedgerEntry.EntryType.ADJUSTMENT
+        description = f'Payment {payment.receipt_number} {"removed" if deleted else payment.get_status_display().lower()}'
+    student_id = StudentFee.objects.filter(pk=payment.student_fee_id).values_list('student_id', flat=True).first()
+    if student_id is None:
+        # The fee went first in a cascade; sync_fee already reversed the whole fee
+        student_id = LedgerEntry.objects.filter(payment_id=payment.pk).values_list('student_id', flat=True).first()
+    with transaction.atomic():
+        entries = post_entries([LedgerEntry(
+            student_id=student_id, student_fee_id=payment.student_fee_id, payment_id=payment.pk,
+            entry_type=entry_type, amount=delta, description=description, created_by_id=payment.processed_by_id,
+        )])
+        StudentFee.objects.filter(pk=payment.student_fee_id).update(paid_amount=F('paid_amount') - delta)
+        # A refund or removal can reopen a paid fee, and a payment can settle one
+        fee = StudentFee.objects.select_for_update().filter(pk=payment.student_fee_id).first()
+        if fee and fee.status != settled_status(fee, fee.paid_amount):
+            fee.status = settled_status(fee, fee.paid_amount)
+            fee.save(update_fields=['status', 'updated_at'])
+    return entries
+
+
+def class_balances(class_id):
+    """Ledger balance of every student of a class with ledger activity, in one query"""
+    return StudentBalance.objects.filter(student__current_class_id=class_id).values(
+        'student_id', 'balance', 'last_sequence', 'updated_at',
+    ).order_by('-balance')
+
+
+def school_arrears(school_id, min_balance=ZERO):
+    """Students of a school owing more than ``min_balance``, largest first, read off the balance index"""
+    return StudentBalance.objects.filter(school_id=school_id, balance__gt=min_balance).values(
+        'student_id', 'balance', 'last_sequence', 'updated_at',
+    ).order_by('-balance')
+
+
+def backfill_ledger(school_id=None):
+    """Post the ledger entries of fees and payments written before the ledger existed; returns (fees, payments) synced"""
+    fees = StudentFee.objects.all()
+    payments = Payment.objects.all()
+    if school_id is not None:
+        fees = fees.filter(student__school_id=school_id)
+        payments = payments.filter(student_fee__student__school_id=school_id)
+    fee_count = payment_count = 0
+    for fee in fees.order_by('id').iterator():
+        fee_count += bool(sync_fee(fee))
+    for payment in payments.order_by('id').iterator():
+        payment_count += bool(sync_payment(payment))
+    # Waivers credit what was unpaid when they were posted, so settle them once payments are in
+    for fee in fees.filter(status=StudentFee.Status.WAIVED).order_by('id').iterator():
+        sync_fee(fee)
+    return fee_count, payment_count
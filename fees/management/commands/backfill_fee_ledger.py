@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from fees.ledger import backfill_ledger
+
+
+class Command(BaseCommand):
+    help = 'Posts fee ledger entries for fees and payments recorded before the ledger existed. Safe to re-run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', type=int, help='Only backfill students of this school id')
+
+    def handle(self, *args, **options):
+        fees, payments = backfill_ledger(options['school'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Posted ledger entries for {fees} fees and {payments} payments.'
+        ))
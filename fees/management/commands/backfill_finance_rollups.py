@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from classes.attendance import parse_date
+from fees.rollups import rebuild_finance_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily school finance rollups from fees and payments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school', type=int, help='Only rebuild this school id')
+        parser.add_argument('--start-date', help='First date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last date to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start, end = (
+            parse_date(options[name]) if options[name] else None for name in ('start_date', 'end_date')
+        )
+        if (options['start_date'] and not start) or (options['end_date'] and not end):
+            raise CommandError('Dates must be given as YYYY-MM-DD.')
+
+        school_ids = [options['school']] if options['school'] else None
+        count = rebuild_finance_rollups(school_ids, start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} school finance days.'))
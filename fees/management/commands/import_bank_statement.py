@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from fees.payments import IMPORT_CHUNK_SIZE, import_bank_statement
+
+
+class Command(BaseCommand):
+    help = 'Imports the payments of a bank statement CSV (transaction_id, fee_id, amount[, remarks]) for a school.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('school', type=int, help='School id')
+        parser.add_argument('path', help='CSV file')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Rows per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as rows:
+                summary = import_bank_statement(options['school'], rows, chunk_size=options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in summary['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['imported']} payments ({summary['amount']}), "
+            f"{summary['duplicates']} already imported, {len(summary['errors'])} rejected."
+        ))
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.23 on 2026-10-19 02:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0002_initial'),
+        ('schools', '0002_school_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('fees', '0005_alter_studentfee_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentfee',
+            name='paid_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fee_balance', serialize=False, to='students.student')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_sequence', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_balances', to='schools.school')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['school', 'balance'], name='fees_balance_school_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('charge', 'Charge'), ('payment', 'Payment'), ('refund', 'Refund'), ('waiver', 'Waiver'), ('scholarship', 'Scholarship'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('sequence', models.PositiveIntegerField()),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('payment', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ledger_entries', to='fees.payment')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='students.student')),
+                ('student_fee', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ledger_entries', to='fees.studentfee')),
+            ],
+            options={
+                'ordering': ['student', 'sequence'],
+                'unique_together': {('student', 'sequence')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-19 02:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schools', '0002_school_stats'),
+        ('fees', '0006_fee_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialreport',
+            name='school',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='financial_reports', to='schools.school'),
+        ),
+        migrations.CreateModel(
+            name='SchoolFinanceDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('billed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('overdue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payments', models.PositiveIntegerField(default=0)),
+                ('by_method', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='finance_days', to='schools.school')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('school', 'date')},
+            },
+        ),
+    ]
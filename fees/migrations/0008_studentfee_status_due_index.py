@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-19 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fees', '0007_finance_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentfee',
+            index=models.Index(fields=['status', 'due_date'], name='fees_status_due_idx'),
+        ),
+    ]
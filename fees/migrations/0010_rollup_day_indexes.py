@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-19 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fees', '0009_payment_receipts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created_at'], name='fees_payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentfee',
+            index=models.Index(fields=['due_date'], name='fees_due_date_idx'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 
 
@@ -48,6 +48,8 @@ class StudentFee(models.Model):
     structure = models.CharField(max_length=20, choices=STRUCTURE_CHOICES, default='monthly')
     due_date = models.DateField()
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Completed payments less refunds, kept current by fees.ledger
+    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     
     class Status(models.TextChoices):
         PENDING = 'pending', _('Pending')
@@ -63,18 +65,35 @@ class StudentFee(models.Model):
     
     class Meta:
         unique_together = ('student', 'structure', 'due_date')
+        indexes = [
+            # Overdue sweeps and reminder selection: unpaid statuses by due date
+            models.Index(fields=['status', 'due_date'], name='fees_status_due_idx'),
+            # Daily finance rollups (fees.rollups) read the fees due on a day
+            models.Index(fields=['due_date'], name='fees_due_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.student} - {self.structure} - {self.due_date}"
+
+    # The ledger entries posted by the save and delete signals commit or roll back with the row
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
     
     @property
     def balance(self):
-        return self.amount - self.paid_amount
+        if self.status == self.Status.WAIVED:
+            return 0
+        return max(self.amount - self.paid_amount, 0)
     
     @property
     def is_overdue(self):
         from django.utils import timezone
-        return self.due_date < timezone.now().date() and self.status != Status.PAID
+        return self.due_date < timezone.now().date() and self.status not in (self.Status.PAID, self.Status.WAIVED)
 
     @staticmethod
     def get_or_create_for_current_month(student, structure, amount):
@@ -105,6 +124,8 @@ class Payment(models.Model):
     payment_method = models.CharField(max_length=20, choices=PaymentMethod.choices, default=PaymentMethod.CASH)
     transaction_id = models.CharField(max_length=100, blank=True)
     receipt_number = models.CharField(max_length=50, unique=True)
+    # Client-supplied key, scoped to the school, that makes retried submissions return the first payment
+    idempotency_key = models.CharField(max_length=150, unique=True, null=True, blank=True, editable=False)
     
     class Status(models.TextChoices):
         PENDING = 'pending', _('Pending')
@@ -116,10 +137,36 @@ class Payment(models.Model):
     processed_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True)
     remarks = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Daily finance rollups (fees.rollups) read the payments received on a day
+            models.Index(fields=['created_at'], name='fees_payment_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.student_fee.student} - {self.amount} - {self.payment_method}"
 
+    # Atomic like StudentFee.save, so the payment and its ledger entry land together
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class ReceiptSequence(models.Model):
+    """Last receipt number issued by a school (see fees.payments)"""
+    school = models.OneToOneField('schools.School', on_delete=models.CASCADE, primary_key=True,
+                                  related_name='receipt_sequence')
+    last_number = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.school} - {self.last_number}"
+
 
 class Scholarship(models.Model):
     """Student scholarships and discounts"""
@@ -174,8 +221,89 @@ class FinancialReport(models.Model):
     total_pending = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     total_overdue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     report_data = models.JSONField(default=dict)  # Detailed report data
+    school = models.ForeignKey('schools.School', on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='financial_reports')
     generated_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.title} - {self.start_date} to {self.end_date}"
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only record of every change to what a student owes.
+
+    Positive amounts add to the balance (charges, refunds), negative amounts
+    reduce it (payments, waivers, scholarships). Entries are never edited:
+    a correction is a new entry. The fee and payment references outlive the
+    rows they point at, so deleted fees and payments keep their history.
+    """
+    class EntryType(models.TextChoices):
+        CHARGE = 'charge', _('Charge')
+        PAYMENT = 'payment', _('Payment')
+        REFUND = 'refund', _('Refund')
+        WAIVER = 'waiver', _('Waiver')
+        SCHOLARSHIP = 'scholarship', _('Scholarship')
+        ADJUSTMENT = 'adjustment', _('Adjustment')
+
+    student = models.ForeignKey('students.Student', on_delete=models.CASCADE, related_name='ledger_entries')
+    student_fee = models.ForeignKey(StudentFee, on_delete=models.DO_NOTHING, db_constraint=False,
+                                    null=True, blank=True, related_name='ledger_entries')
+    payment = models.ForeignKey(Payment, on_delete=models.DO_NOTHING, db_constraint=False,
+                                null=True, blank=True, related_name='ledger_entries')
+    entry_type = models.CharField(max_length=20, choices=EntryType.choices)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    sequence = models.PositiveIntegerField()  # Per student, gapless
+    description = models.CharField(max_length=200, blank=True)
+    created_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['student', 'sequence']
+        unique_together = ['student', 'sequence']
+
+    def __str__(self):
+        return f"{self.student} - {self.entry_type} - {self.amount}"
+
+
+class StudentBalance(models.Model):
+    """Running ledger balance of a student, the state after their latest LedgerEntry"""
+    student = models.OneToOneField('students.Student', on_delete=models.CASCADE, primary_key=True,
+                                   related_name='fee_balance')
+    school = models.ForeignKey('schools.School', on_delete=models.CASCADE, related_name='student_balances')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_sequence = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # School arrears lists: balance > x, largest first
+            models.Index(fields=['school', 'balance'], name='fees_balance_school_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student} - {self.balance}"
+
+
+class SchoolFinanceDaily(models.Model):
+    """Fee totals for one school on one day (see fees.rollups)"""
+    school = models.ForeignKey('schools.School', on_delete=models.CASCADE, related_name='finance_days')
+    date = models.DateField()
+    # Fees due that day, and the unpaid part of them by status
+    billed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    overdue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Completed payments received that day
+    collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payments = models.PositiveIntegerField(default=0)
+    by_method = models.JSONField(default=dict)  # payment method -> {'amount': '12.50', 'count': 1}
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['school', 'date']
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.school} - {self.date}"
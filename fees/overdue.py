@@ -0,0 +1,70 @@
+"""
+Overdue sweep.
+
+sweep_overdue_fees moves unpaid fees (pending or partially paid) whose due
+date has passed to overdue. Candidates are read off the (status, due_date)
+index, so a run only visits fees that became due since the last one: fees
+already marked overdue are outside the range it scans. Each batch is one
+UPDATE in its own transaction, guarded by the unpaid statuses so a fee paid
+in the meantime is left alone.
+
+Bulk updates skip model signals, so each batch refreshes the finance rollup
+days it moved, marks the dashboards and fee reports of its schools stale,
+and sends fees.signals.fees_overdue per school once committed, which
+reminder generation listens to.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StudentFee
+from .signals import fees_overdue
+
+SWEEP_STATUSES = [StudentFee.Status.PENDING, StudentFee.Status.PARTIAL]
+DEFAULT_BATCH_SIZE = 1000
+
+
+def sweep_overdue_fees(today=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Mark unpaid fees due before ``today`` overdue; returns the number of fees moved"""
+    today = today or timezone.localdate()
+    moved = 0
+    while True:
+        candidates = list(StudentFee.objects.filter(
+            status__in=SWEEP_STATUSES, due_date__lt=today,
+        ).values_list('id', 'student__school_id', 'due_date').order_by()[:batch_size])
+        if not candidates:
+            return moved
+        fee_ids = [fee_id for fee_id, _, _ in candidates]
+        with transaction.atomic():
+            updated = StudentFee.objects.filter(id__in=fee_ids, status__in=SWEEP_STATUSES).update(
+                status=StudentFee.Status.OVERDUE, updated_at=timezone.now(),
+            )
+            if updated < len(candidates):
+                # Some were paid or waived after the read; announce only the fees that moved
+                overdue = set(StudentFee.objects.filter(
+                    id__in=fee_ids, status=StudentFee.Status.OVERDUE,
+                ).values_list('id', flat=True))
+                candidates = [candidate for candidate in candidates if candidate[0] in overdue]
+            _record_sweep(candidates)
+        moved += updated
+
+
+def _record_sweep(candidates):
+    """Do the work the StudentFee signals would have done for the batch, and announce it"""
+    from core.dashboard import invalidate_tiles
+    from .reports import invalidate_fee_reports
+    from .rollups import refresh_finance_rollups
+
+    by_school = defaultdict(lambda: (set(), []))
+    for fee_id, school_id, due_date in candidates:
+        by_school[school_id][0].add(due_date)
+        by_school[school_id][1].append(fee_id)
+    for school_id, (dates, fee_ids) in by_school.items():
+        refresh_finance_rollups(school_id, dates)
+        transaction.on_commit(lambda school_id=school_id, fee_ids=fee_ids: (
+            invalidate_tiles(['student_stats'], school_id),
+            invalidate_fee_reports(school_id),
+            fees_overdue.send(sender=StudentFee, school_id=school_id, fee_ids=fee_ids),
+        ))
@@ -0,0 +1,234 @@
+"""
+Payment processing.
+
+record_payment takes one payment against a fee. The fee row is locked with
+select_for_update, so concurrent payments of one fee queue up and each is
+checked against the balance left by the one before. A client-supplied
+idempotency key, stored scoped to the school, makes a retried submission
+return the payment it already created instead of charging twice.
+
+Receipt numbers come from the school's ReceiptSequence row: a caller locks it
+once and takes a block of consecutive numbers for everything it is about to
+write, in the same transaction, so numbers are issued without scanning
+existing receipts, and a rolled-back write returns its block, leaving no gaps.
+A school's receipts are numbered <school code>-0000001 onwards.
+
+import_bank_statement records the payments of a bank statement CSV in
+chunks, each chunk in one transaction: the fees are locked together, the
+receipts taken as one block, the payments written with one bulk_create and
+their ledger entries posted together. Each row's transaction id becomes its
+idempotency key, so importing a statement again skips the rows already in.
+"""
+
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .ledger import post_entries, settled_status
+from .models import LedgerEntry, Payment, ReceiptSequence, StudentFee
+
+IMPORT_CHUNK_SIZE = 500
+IMPORT_COLUMNS = ['transaction_id', 'fee_id', 'amount']
+
+
+def allocate_receipt_numbers(school_id, count):
+    """Take the next ``count`` receipt numbers of a school; call inside the transaction that uses them"""
+    from schools.models import School
+
+    ReceiptSequence.objects.bulk_create([ReceiptSequence(school_id=school_id)], ignore_conflicts=True)
+    sequence = ReceiptSequence.objects.select_for_update().get(school_id=school_id)
+    ReceiptSequence.objects.filter(pk=school_id).update(last_number=F('last_number') + count, updated_at=timezone.now())
+    code = School.objects.filter(pk=school_id).values_list('code', flat=True).get()
+    return [f'{code}-{number:07d}' for number in range(sequence.last_number + 1, sequence.last_number + count + 1)]
+
+
+def parse_amount(value):
+    """A positive amount with at most two decimal places; raises ValueError"""
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError):
+        raise ValueError('amount must be a number')
+    if not amount.is_finite() or amount <= 0 or amount != amount.quantize(Decimal('0.01')):
+        raise ValueError('amount must be positive, in cents at most')
+    return amount
+
+
+def _closed(fee):
+    """Why a fee takes no more payments, or None"""
+    # Gated on the balance: status defaults to paid, so fees created outside billing can be open while marked paid
+    if fee.balance <= 0:
+        return f'already {"waived" if fee.status == StudentFee.Status.WAIVED else "paid"}'
+    return None
+
+
+def _scoped_key(school_id, key):
+    return f'{school_id}:{key}' if key else None
+
+
+def _replay(school_id, key, fee_id, amount):
+    """The payment already recorded under an idempotency key, if the request matches it; raises ValueError"""
+    payment = Payment.objects.filter(idempotency_key=_scoped_key(school_id, key)).first()
+    if payment and (payment.student_fee_id != int(fee_id) or payment.amount != amount):
+        raise ValueError('idempotency key was already used for a different payment')
+    return payment
+
+
+def record_payment(school_id, fee_id, amount, payment_method, idempotency_key=None, transaction_id='', remarks='',
+                   user=None):
+    """
+    Record a completed payment against a fee of the school; see the module docstring.
+
+    Returns (payment, created): created is False when ``idempotency_key``
+    was already used for the same fee and amount. Raises
+    StudentFee.DoesNotExist for a fee outside the school and ValueError for
+    an invalid payment.
+    """
+    amount = parse_amount(amount)
+    if payment_method not in Payment.PaymentMethod.values:
+        raise ValueError(f'Unknown payment method {payment_method}')
+    if idempotency_key:
+        payment = _replay(school_id, idempotency_key, fee_id, amount)
+        if payment:
+            return payment, False
+    try:
+        with transaction.atomic():
+            fee = StudentFee.objects.select_for_update().get(pk=fee_id, student__school_id=school_id)
+            if idempotency_key:
+                # A concurrent request with the same key may have committed while this one waited for the lock
+                payment = _replay(school_id, idempotency_key, fee_id, amount)
+                if payment:
+                    return payment, False
+            if _closed(fee):
+                raise ValueError(f'Fee is {_closed(fee)}')
+            if amount > fee.balance:
+                raise ValueError(f'amount exceeds the outstanding balance of {fee.balance}')
+            payment = Payment.objects.create(
+                student_fee=fee, amount=amount, payment_method=payment_method, transaction_id=transaction_id,
+                receipt_number=allocate_receipt_numbers(school_id, 1)[0], status=Payment.Status.COMPLETED,
+                processed_by=user, remarks=remarks, idempotency_key=_scoped_key(school_id, idempotency_key),
+            )
+            # The ledger receiver has moved the fee's paid total and status
+    except IntegrityError:
+        # The same key reused for another fee, committed concurrently
+        payment = idempotency_key and _replay(school_id, idempotency_key, fee_id, amount)
+        if not payment:
+            raise
+        return payment, False
+    return payment, True
+
+
+def import_bank_statement(school_id, rows, user=None, payment_method=Payment.PaymentMethod.BANK_TRANSFER,
+                          chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Record the payments of a bank statement for a school; see the module docstring.
+
+    ``rows`` are the lines of a CSV with transaction_id, fee_id and amount
+    columns (and optionally remarks), e.g. an open text file. Rows that fail
+    validation are reported and skipped. Returns a summary: rows read,
+    payments imported and already imported, the amount imported (as a
+    string) and the errors as {'line', 'error'}.
+    """
+    reader = csv.DictReader(rows)
+    missing = [column for column in IMPORT_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f'Missing columns: {", ".join(missing)}')
+
+    summary = {'rows': 0, 'imported': 0, 'duplicates': 0, 'amount': Decimal(0), 'errors': []}
+    chunk = []
+    for line, row in enumerate(reader, start=2):
+        summary['rows'] += 1
+        try:
+            transaction_id = (row['transaction_id'] or '').strip()
+            if not transaction_id:
+                raise ValueError('transaction_id is required')
+            chunk.append((line, transaction_id, int(row['fee_id']), parse_amount(row['amount']),
+                          (row.get('remarks') or '').strip()))
+        except (TypeError, ValueError) as e:
+            summary['errors'].append({'line': line, 'error': str(e)})
+        if len(chunk) >= chunk_size:
+            _import_chunk(school_id, chunk, user, payment_method, summary)
+            chunk = []
+    if chunk:
+        _import_chunk(school_id, chunk, user, payment_method, summary)
+    summary['amount'] = str(summary['amount'])
+    return summary
+
+
+def _import_chunk(school_id, chunk, user, payment_method, summary):
+    keys = {_scoped_key(school_id, f'bank:{transaction_id}') for _, transaction_id, _, _, _ in chunk}
+    with transaction.atomic():
+        fees = {
+            fee.pk: fee
+            for fee in StudentFee.objects.select_for_update().filter(
+                id__in={fee_id for _, _, fee_id, _, _ in chunk}, student__school_id=school_id,
+            ).order_by('id')
+        }
+        seen = set(Payment.objects.filter(idempotency_key__in=keys).values_list('idempotency_key', flat=True))
+        accepted = []
+        for line, transaction_id, fee_id, amount, remarks in chunk:
+            key = _scoped_key(school_id, f'bank:{transaction_id}')
+            fee = fees.get(fee_id)
+            if key in seen:
+                summary['duplicates'] += 1
+                continue
+            if fee is None:
+                error = f'Fee {fee_id} not found'
+            elif _closed(fee):
+                error = f'Fee {fee_id} is {_closed(fee)}'
+            elif amount > fee.balance:
+                error = f'amount exceeds the outstanding balance of {fee.balance}'
+            else:
+                seen.add(key)
+                fee.paid_amount += amount
+                accepted.append((fee, amount, transaction_id, remarks, key))
+                continue
+            summary['errors'].append({'line': line, 'error': error})
+        if not accepted:
+            return
+
+        receipts = allocate_receipt_numbers(school_id, len(accepted))
+        payments = Payment.objects.bulk_create([
+            Payment(
+                student_fee=fee, amount=amount, payment_method=payment_method, transaction_id=transaction_id,
+                receipt_number=receipt, status=Payment.Status.COMPLETED, processed_by=user,
+                remarks=remarks or f'Bank statement {transaction_id}', idempotency_key=key,
+            )
+            for (fee, amount, transaction_id, remarks, key), receipt in zip(accepted, receipts)
+        ])
+        post_entries([
+            LedgerEntry(
+                student_id=payment.student_fee.student_id, student_fee_id=payment.student_fee_id, payment=payment,
+                entry_type=LedgerEntry.EntryType.PAYMENT, amount=-payment.amount,
+                description=f'Payment {payment.receipt_number}', created_by=user,
+            )
+            for payment in payments
+        ])
+        changed = {fee.pk: fee for fee, _, _, _, _ in accepted}.values()
+        now = timezone.now()
+        for fee in changed:
+            fee.status, fee.updated_at = settled_status(fee, fee.paid_amount), now
+        # The fees are locked, so their paid totals can be written back as computed
+        StudentFee.objects.bulk_update(changed, ['paid_amount', 'status', 'updated_at'])
+        total = sum(amount for _, amount, _, _, _ in accepted)
+        _record_import(school_id, total, [fee.due_date for fee in changed])
+    summary['imported'] += len(accepted)
+    summary['amount'] += total
+
+
+def _record_import(school_id, collected, due_dates):
+    """bulk_create and bulk_update skip the payment and fee signals, so do their work here"""
+    from core.dashboard import invalidate_tiles
+    from schools.stats import apply_deltas, refresh_pending_students
+    from .reports import invalidate_fee_reports
+    from .rollups import refresh_finance_rollups
+
+    apply_deltas(school_id, {'fees_collected': collected})
+    refresh_pending_students(school_id)
+    refresh_finance_rollups(school_id, [timezone.localdate(), *due_dates])
+    transaction.on_commit(lambda: (
+        invalidate_tiles(['accountant_stats', 'student_stats'], school_id),
+        invalidate_fee_reports(school_id),
+    ))
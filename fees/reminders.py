@@ -0,0 +1,202 @@
+"""
+Fee reminder campaigns.
+
+send_fee_reminders reminds the guardians of a school's students about
+unpaid fees (pending, partially paid or overdue) that are due within
+``lead_days`` or already past due, skipping fees reminded successfully in
+the last ``interval_days``. Fees are read off the (status, due_date) index.
+
+One message goes to each guardian, covering all of their children's fees:
+parents linked through Student.parents, or the emergency contact of a
+student without any, which groups siblings sharing a contact. Guardians
+with an email address get an email, others an SMS. Each template is loaded
+once per run; emails go out over one connection per batch and SMS through
+one SmsService batch.
+
+Sends count against the school's monthly SchoolCommunicationUsage: the
+messages of a run are reserved up front under a row lock, capped at what the
+plan has left, and whatever was reserved but not delivered is handed back.
+Every attempt, sent or not, is recorded as FeeReminder rows (one per fee and
+channel) with a single bulk_create.
+"""
+
+import datetime
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import FeeReminder, StudentFee
+
+REMINDER_STATUSES = [StudentFee.Status.PENDING, StudentFee.Status.PARTIAL, StudentFee.Status.OVERDUE]
+DEFAULT_LEAD_DAYS = 3
+DEFAULT_INTERVAL_DAYS = 7
+EMAIL_BATCH_SIZE = 100
+
+Guardian = namedtuple('Guardian', 'name email phone')
+
+
+def due_fees(school_id, today=None, lead_days=DEFAULT_LEAD_DAYS, interval_days=DEFAULT_INTERVAL_DAYS, fee_ids=None):
+    """Unpaid fees of a school due by today + lead_days that were not reminded in the last interval_days"""
+    today = today or timezone.localdate()
+    recently_reminded = FeeReminder.objects.filter(
+        student_fee_id=OuterRef('pk'), is_sent=True,
+        sent_at__gte=timezone.now() - datetime.timedelta(days=interval_days),
+    )
+    fees = StudentFee.objects.filter(
+        ~Exists(recently_reminded),
+        status__in=REMINDER_STATUSES, due_date__lte=today + datetime.timedelta(days=lead_days),
+        student__school_id=school_id,
+    )
+    if fee_ids is not None:
+        fees = fees.filter(id__in=fee_ids)
+    return list(fees.select_related('student__user').order_by('student_id', 'due_date'))
+
+
+def group_by_guardian(fees):
+    """Map each Guardian to the fees of their children"""
+    from students.models import Student
+
+    student_ids = {fee.student_id for fee in fees}
+    parents = defaultdict(list)
+    for student_id, first_name, last_name, email, phone, contact in Student.parents.through.objects.filter(
+        student_id__in=student_ids,
+    ).values_list(
+        'student_id', 'parent__user__first_name', 'parent__user__last_name', 'parent__user__email',
+        'parent__user__phone', 'parent__emergency_contact',
+    ):
+        parents[student_id].append(Guardian(f'{first_name} {last_name}'.strip(), email or '', phone or contact or ''))
+
+    grouped = defaultdict(list)
+    for fee in fees:
+        student = fee.student
+        guardians = parents.get(student.id) or [
+            Guardian(student.emergency_contact_name, '', student.emergency_contact or ''),
+        ]
+        for guardian in guardians:
+            if guardian.email or guardian.phone:
+                grouped[guardian].append(fee)
+    return grouped
+
+
+def reserve_quota(school_id, emails, sms):
+    """Atomically take up to ``emails`` and ``sms`` sends from the school's monthly allowance; returns the grant"""
+    from schools.models import SchoolCommunicationUsage, Subscription
+
+    subscription = Subscription.objects.filter(
+        school_id=school_id, status=Subscription.Status.ACTIVE,
+    ).select_related('plan').order_by('-end_date').first()
+    if not subscription:
+        return 0, 0
+    now = timezone.now()
+    with transaction.atomic():
+        SchoolCommunicationUsage.objects.bulk_create([
+            SchoolCommunicationUsage(school_id=school_id, year=now.year, month=now.month),
+        ], ignore_conflicts=True)
+        usage = SchoolCommunicationUsage.objects.select_for_update().get(school_id=school_id, year=now.year, month=now.month)
+        granted_emails = max(0, min(emails, subscription.plan.max_emails_per_month - usage.emails_sent))
+        granted_sms = max(0, min(sms, subscription.plan.max_sms_per_month - usage.sms_sent))
+        SchoolCommunicationUsage.objects.filter(pk=usage.pk).update(
+            emails_sent=F('emails_sent') + granted_emails, sms_sent=F('sms_sent') + granted_sms,
+        )
+    return granted_emails, granted_sms
+
+
+def release_quota(school_id, emails, sms):
+    """Hand back reserved sends that were not delivered"""
+    from schools.models import SchoolCommunicationUsage
+
+    if emails or sms:
+        now = timezone.now()
+        SchoolCommunicationUsage.objects.filter(school_id=school_id, year=now.year, month=now.month).update(
+            emails_sent=F('emails_sent') - emails, sms_sent=F('sms_sent') - sms,
+        )
+
+
+def _send_emails(messages):
+    """Send EmailMessages over one connection per batch; returns whether each was sent"""
+    results = []
+    for start in range(0, len(messages), EMAIL_BATCH_SIZE):
+        batch = messages[start:start + EMAIL_BATCH_SIZE]
+        try:
+            connection = get_connection()
+            connection.send_messages(batch)
+            results.extend([True] * len(batch))
+        except Exception:
+            results.extend([False] * len(batch))
+    return results
+
+
+def send_fee_reminders(school_id, fee_ids=None, today=None, lead_days=DEFAULT_LEAD_DAYS,
+                       interval_days=DEFAULT_INTERVAL_DAYS):
+    """Run a reminder campaign for a school; returns counts of fees, guardians and messages sent or held back"""
+    from core.models import SystemSettings
+    from notifications.services import SmsService
+    from schools.models import School
+
+    summary = {'school_id': school_id, 'fees': 0, 'guardians': 0, 'emails_sent': 0, 'sms_sent': 0,
+               'over_quota': 0, 'failed': 0, 'unreachable': 0}
+    fees = due_fees(school_id, today, lead_days, interval_days, fee_ids)
+    summary['fees'] = len(fees)
+    if not fees:
+        return summary
+    school = School.objects.get(pk=school_id)
+    email_enabled, sms_enabled = SystemSettings.email_enabled(), SystemSettings.sms_enabled()
+
+    # Render: each template is compiled once and filled in per guardian
+    email_template = get_template('fees/fee_reminder.txt')
+    sms_template = get_template('fees/fee_reminder_sms.txt')
+    subject = f'Fee reminder - {school.name}'
+    today = today or timezone.localdate()
+    outbox = []  # (channel, recipient, text, fees)
+    for guardian, guardian_fees in group_by_guardian(fees).items():
+        summary['guardians'] += 1
+        rows = [{
+            'student_name': fee.student.user.get_full_name() or fee.student.user.username,
+            'description': fee.remarks or fee.get_structure_display(),
+            'due_date': fee.due_date,
+            'balance': fee.balance,
+            'overdue': fee.due_date < today,
+        } for fee in guardian_fees]
+        context = {
+            'school': school, 'guardian': guardian, 'fees': rows,
+            'total': sum(row['balance'] for row in rows),
+            'students': sorted({row['student_name'] for row in rows}),
+            'overdue': any(row['overdue'] for row in rows),
+        }
+        if guardian.email and email_enabled:
+            outbox.append((FeeReminder.ReminderType.EMAIL, guardian.email, email_template.render(context), guardian_fees))
+        elif guardian.phone and sms_enabled:
+            outbox.append((FeeReminder.ReminderType.SMS, guardian.phone, sms_template.render(context).strip(), guardian_fees))
+        else:
+            summary['unreachable'] += 1
+
+    emails = [item for item in outbox if item[0] == FeeReminder.ReminderType.EMAIL]
+    sms = [item for item in outbox if item[0] == FeeReminder.ReminderType.SMS]
+    granted_emails, granted_sms = reserve_quota(school_id, len(emails), len(sms))
+    summary['over_quota'] = len(emails) - granted_emails + len(sms) - granted_sms
+
+    email_results = _send_emails([
+        EmailMessage(subject, text, settings.DEFAULT_FROM_EMAIL, [recipient])
+        for _, recipient, text, _ in emails[:granted_emails]
+    ])
+    sms_results = SmsService.send_batch([(recipient, text) for _, recipient, text, _ in sms[:granted_sms]])
+    summary['emails_sent'], summary['sms_sent'] = sum(email_results), sum(sms_results)
+    summary['failed'] = len(email_results) - summary['emails_sent'] + len(sms_results) - summary['sms_sent']
+    release_quota(school_id, granted_emails - summary['emails_sent'], granted_sms - summary['sms_sent'])
+
+    reminders = []
+    for items, results in [(emails, email_results), (sms, sms_results)]:
+        for index, (channel, recipient, text, guardian_fees) in enumerate(items):
+            sent = index < len(results) and results[index]
+            reminders.extend(
+                FeeReminder(student_id=fee.student_id, student_fee=fee, reminder_type=channel, message=text,
+                            is_sent=sent, sent_to=recipient)
+                for fee in guardian_fees
+            )
+    FeeReminder.objects.bulk_create(reminders, batch_size=1000)
+    return summary
@@ -0,0 +1,79 @@
+"""
+Fee reports.
+
+Reports are computed with grouped queries over StudentFee, whose paid_amount
+the fee ledger keeps current, so no report joins payments. Results are cached
+per (report, school, period) under the school's report version; fee and
+payment writes bump that version (see core.signals), so the next request
+recomputes instead of serving stale totals.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from .models import StudentFee
+
+
+def _version_key(school_id):
+    return f'fee_report_version:{school_id}'
+
+
+def invalidate_fee_reports(school_id):
+    """Mark every cached fee report of a school stale"""
+    if school_id is None:
+        return
+    try:
+        cache.incr(_version_key(school_id))
+    except ValueError:
+        cache.set(_version_key(school_id), 1, None)
+
+
+def _cached(name, school_id, period, compute):
+    version = cache.get(_version_key(school_id), 0)
+    key = f'fee_report:{name}:{school_id}:{version}:{period[0]}:{period[1]}'
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, settings.FEE_REPORT_CACHE_TIMEOUT)
+    return data
+
+
+def class_wise_report(school_id, start_date=None, end_date=None):
+    """Fees billed, paid and pending per class of a school, for fees due in the period (all time without one)"""
+    return _cached('class_wise', school_id, (start_date, end_date),
+                   lambda: _class_wise(school_id, start_date, end_date))
+
+
+def _class_wise(school_id, start_date, end_date):
+    from classes.models import Class
+
+    fees = StudentFee.objects.filter(student__school_id=school_id)
+    if start_date and end_date:
+        fees = fees.filter(due_date__range=[start_date, end_date])
+    totals = {
+        row['student__current_class']: row
+        for row in fees.values('student__current_class').annotate(
+            total_fees=Sum('amount'),
+            total_paid=Sum('paid_amount'),
+            pending_count=Count('id', filter=Q(status=StudentFee.Status.PENDING)),
+        ).order_by()
+    }
+
+    class_data = []
+    for class_obj in Class.objects.with_counts().filter(school_id=school_id).order_by('name', 'section'):
+        if not class_obj.students_count:
+            continue
+        row = totals.get(class_obj.id, {})
+        total_fees, total_paid = row.get('total_fees') or 0, row.get('total_paid') or 0
+        class_data.append({
+            'class_id': class_obj.id,
+            'class_name': f"{class_obj.name} - {class_obj.section}" if class_obj.section else class_obj.name,
+            'academic_year': class_obj.academic_year,
+            'total_students': class_obj.students_count,
+            'total_fees': total_fees,
+            'total_paid': total_paid,
+            'pending_count': row.get('pending_count', 0),
+            'collection_rate': round(total_paid / total_fees * 100, 2) if total_fees > 0 else 0,
+        })
+    return class_data
@@ -0,0 +1,201 @@
+"""
+Daily financial rollups and the reports built from them.
+
+SchoolFinanceDaily holds, for each (school, date), the fees due that day
+(billed, and the unpaid part still pending or overdue) and the completed
+payments received that day (collected, with a per-method breakdown). Every
+column adds up over a date range, so a report for any range sums at most one
+row per day instead of scanning fees and payments.
+
+Rows are recomputed from StudentFee and Payment for exactly the days a write
+touched: the fee and payment signals (see core.signals) and bulk write paths
+call refresh_finance_rollups, and the reconcile_finance_rollups task rebuilds
+recent days to catch anything else (``manage.py backfill_finance_rollups``
+rebuilds history).
+
+A refresh reads only the touched days: fees through the due_date index and
+payments through the created_at index, on a half-open range of local
+datetimes per day rather than a ``__date`` cast the index cannot serve.
+"""
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import FinancialReport, Payment, SchoolFinanceDaily, StudentFee
+
+AMOUNT_FIELDS = ['billed', 'pending', 'overdue', 'collected']
+PENDING_STATUSES = [StudentFee.Status.PENDING, StudentFee.Status.PARTIAL]
+UNPAID = F('amount') - F('paid_amount')
+
+
+def _fee_aggregates():
+    return {
+        'billed': Sum('amount'),
+        'pending': Sum(UNPAID, filter=Q(status__in=PENDING_STATUSES)),
+        'overdue': Sum(UNPAID, filter=Q(status=StudentFee.Status.OVERDUE)),
+    }
+
+
+def _empty_row():
+    return {'billed': 0, 'pending': 0, 'overdue': 0, 'collected': Decimal(0), 'payments': 0, 'by_method': {}}
+
+
+def _add_collection(row, method, amount, count):
+    row['collected'] += amount
+    row['payments'] += count
+    row['by_method'][method] = {'amount': str(amount), 'count': count}
+
+
+def day_start(day):
+    """The first instant of a local day, for half-open created_at ranges"""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def received_on(dates):
+    """Payments received on any of the given local days, as created_at ranges"""
+    return reduce(or_, (
+        Q(created_at__gte=day_start(day), created_at__lt=day_start(day + datetime.timedelta(days=1)))
+        for day in dates
+    ))
+
+
+def _upsert(rows, batch_size=1000):
+    SchoolFinanceDaily.objects.bulk_create(
+        rows, batch_size=batch_size, update_conflicts=True, unique_fields=['school', 'date'],
+        update_fields=AMOUNT_FIELDS + ['payments', 'by_method', 'updated_at'],
+    )
+
+
+def refresh_finance_rollups(school_id, dates):
+    """Recompute a school's rows for the given days"""
+    dates = sorted({day for day in dates if day})
+    if school_id is None or not dates:
+        return
+    days = {day: _empty_row() for day in dates}
+    for row in StudentFee.objects.filter(
+        student__school_id=school_id, due_date__in=dates,
+    ).values('due_date').annotate(**_fee_aggregates()).order_by():
+        days[row.pop('due_date')].update({field: value or 0 for field, value in row.items()})
+    for day, method, amount, count in Payment.objects.filter(
+        received_on(dates), student_fee__student__school_id=school_id, status=Payment.Status.COMPLETED,
+    ).annotate(day=TruncDate('created_at')).values('day', 'payment_method').annotate(
+        amount=Sum('amount'), count=Count('id'),
+    ).values_list('day', 'payment_method', 'amount', 'count').order_by():
+        _add_collection(days[day], method, amount, count)
+    _upsert([SchoolFinanceDaily(school_id=school_id, date=day, **row) for day, row in days.items()])
+
+
+def rebuild_finance_rollups(school_ids=None, start=None, end=None, batch_size=1000):
+    """Backfill the rollup from fees and payments for due and payment days in the range; returns rows written"""
+    fees = StudentFee.objects.all()
+    payments = Payment.objects.filter(status=Payment.Status.COMPLETED)
+    if school_ids is not None:
+        fees = fees.filter(student__school_id__in=school_ids)
+        payments = payments.filter(student_fee__student__school_id__in=school_ids)
+    if start:
+        fees = fees.filter(due_date__gte=start)
+        payments = payments.filter(created_at__gte=day_start(start))
+    if end:
+        fees = fees.filter(due_date__lte=end)
+        payments = payments.filter(created_at__lt=day_start(end + datetime.timedelta(days=1)))
+
+    days = defaultdict(_empty_row)
+    for row in fees.values('student__school_id', 'due_date').annotate(**_fee_aggregates()).order_by():
+        key = (row.pop('student__school_id'), row.pop('due_date'))
+        days[key].update({field: value or 0 for field, value in row.items()})
+    for school_id, day, method, amount, count in payments.annotate(day=TruncDate('created_at')).values(
+        'student_fee__student__school_id', 'day', 'payment_method',
+    ).annotate(amount=Sum('amount'), count=Count('id')).values_list(
+        'student_fee__student__school_id', 'day', 'payment_method', 'amount', 'count',
+    ).order_by():
+        _add_collection(days[school_id, day], method, amount, count)
+
+    # Days that no longer have fees or payments are zeroed rather than left stale
+    stale = SchoolFinanceDaily.objects.all()
+    if school_ids is not None:
+        stale = stale.filter(school_id__in=school_ids)
+    if start:
+        stale = stale.filter(date__gte=start)
+    if end:
+        stale = stale.filter(date__lte=end)
+    for key in stale.values_list('school_id', 'date'):
+        days.setdefault(key, _empty_row())
+
+    rows = [SchoolFinanceDaily(school_id=school_id, date=day, **row) for (school_id, day), row in days.items()]
+    for index in range(0, len(rows), batch_size):
+        _upsert(rows[index:index + batch_size], batch_size)
+    return len(rows)
+
+
+def finance_totals(school_id, start, end):
+    """Sum a school's rollup rows over a date range, with a monthly breakdown"""
+    totals = _empty_row()
+    methods = defaultdict(lambda: {'amount': Decimal(0), 'count': 0})
+    months = defaultdict(_empty_row)
+    for day in SchoolFinanceDaily.objects.filter(school_id=school_id, date__range=[start, end]):
+        month = months[day.date.replace(day=1)]
+        for row in (totals, month):
+            for field in AMOUNT_FIELDS + ['payments']:
+                row[field] += getattr(day, field)
+        for method, value in day.by_method.items():
+            methods[method]['amount'] += Decimal(value['amount'])
+            methods[method]['count'] += value['count']
+    totals.pop('by_method')
+    totals['collection_rate'] = round(totals['collected'] / totals['billed'] * 100, 2) if totals['billed'] else 0
+    totals['by_method'] = dict(sorted(methods.items()))
+    totals['months'] = [
+        {'month': month.strftime('%Y-%m'), **{field: row[field] for field in AMOUNT_FIELDS + ['payments']}}
+        for month, row in sorted(months.items())
+    ]
+    return totals
+
+
+def _report_type(start, end):
+    days = (end - start).days + 1
+    for limit, report_type in [(1, 'daily'), (7, 'weekly'), (31, 'monthly'), (92, 'quarterly')]:
+        if days <= limit:
+            return report_type
+    return 'annual'
+
+
+def generate_financial_report(school_id, start, end, title=None, report_type=None, user=None):
+    """Create a FinancialReport for a school and date range from the rollup"""
+    if start > end:
+        raise ValueError('start_date must not be after end_date')
+    totals = finance_totals(school_id, start, end)
+    report_type = report_type or _report_type(start, end)
+    if report_type not in dict(FinancialReport._meta.get_field('report_type').choices):
+        raise ValueError(f'Unknown report type {report_type}')
+
+    def plain(value):
+        return str(value) if isinstance(value, Decimal) else value
+
+    return FinancialReport.objects.create(
+        school_id=school_id,
+        title=title or f'{report_type.capitalize()} financial report {start} to {end}',
+        report_type=report_type,
+        start_date=start,
+        end_date=end,
+        total_collected=totals['collected'],
+        total_pending=totals['pending'],
+        total_overdue=totals['overdue'],
+        report_data={
+            'billed': plain(totals['billed']),
+            'payments': totals['payments'],
+            'collection_rate': plain(totals['collection_rate']),
+            'by_method': {
+                method: {'amount': plain(value['amount']), 'count': value['count']}
+                for method, value in totals['by_method'].items()
+            },
+            'months': [{key: plain(value) for key, value in month.items()} for month in totals['months']],
+        },
+        generated_by=user,
+    )
+
@@ -1,6 +1,5 @@
 from rest_framework import serializers
-from django.db import models
-from .models import FeeStructure, StudentFee, Payment, FeeCategory, Scholarship
+from .models import FeeStructure, StudentFee, Payment, FeeCategory, Scholarship, LedgerEntry
 
 
 class FeeCategorySerializer(serializers.ModelSerializer):
@@ -8,9 +7,9 @@ class FeeCategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = FeeCategory
         fields = [
-            'id', 'name', 'description', 'is_active', 'created_at', 'updated_at'
+            'id', 'name', 'description', 'is_active', 'created_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at']
 
 
 class FeeStructureSerializer(serializers.ModelSerializer):
@@ -22,9 +21,9 @@ class FeeStructureSerializer(serializers.ModelSerializer):
         model = FeeStructure
         fields = [
             'id', 'class_obj', 'category', 'amount', 'frequency',
-            'academic_year', 'is_active', 'created_at', 'updated_at'
+            'academic_year', 'is_active', 'created_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at']
     
     def get_class_obj(self, obj):
         return {
@@ -39,14 +38,16 @@ class StudentFeeSerializer(serializers.ModelSerializer):
     student_info = serializers.SerializerMethodField()
     fee_structure = FeeStructureSerializer(read_only=True)
     payments = serializers.SerializerMethodField()
+    # Both kept current by the fee ledger, so no per-row payment sums
+    remaining_amount = serializers.DecimalField(source='balance', max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = StudentFee
         fields = [
-            'id', 'student', 'student_info', 'structure', 'fee_structure', 'amount',
-            'due_date', 'status', 'payments', 'created_at', 'updated_at'
+            'id', 'student', 'student_info', 'structure', 'fee_structure', 'amount', 'paid_amount',
+            'remaining_amount', 'due_date', 'status', 'payments', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'paid_amount', 'created_at', 'updated_at']
     
     def get_student_info(self, obj):
         return {
@@ -65,15 +66,6 @@ class StudentFeeSerializer(serializers.ModelSerializer):
             'status': payment.status,
             'created_at': payment.created_at
         } for payment in payments]
-    
-    def get_paid_amount(self, obj):
-        return obj.payments.filter(status='completed').aggregate(
-            total=models.Sum('amount')
-        )['total'] or 0
-    
-    def get_remaining_amount(self, obj):
-        paid = self.get_paid_amount(obj)
-        return max(0, obj.amount - paid)
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -84,10 +76,10 @@ class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = [
-            'id', 'student_fee', 'amount', 'payment_method', 'reference_number',
-            'status', 'processed_by', 'processed_by_info', 'created_at', 'updated_at'
+            'id', 'student_fee', 'amount', 'payment_method', 'transaction_id', 'receipt_number',
+            'status', 'processed_by', 'processed_by_info', 'remarks', 'created_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'receipt_number', 'created_at']
     
     def get_processed_by_info(self, obj):
         if obj.processed_by:
@@ -99,6 +91,17 @@ class PaymentSerializer(serializers.ModelSerializer):
         return None
 
 
+class LedgerEntrySerializer(serializers.ModelSerializer):
+    """Fee ledger entry serializer"""
+    class Meta:
+        model = LedgerEntry
+        fields = [
+            'id', 'student', 'student_fee', 'payment', 'entry_type', 'amount', 'balance_after',
+            'sequence', 'description', 'created_by', 'created_at'
+        ]
+        read_only_fields = fields
+
+
 class ScholarshipSerializer(serializers.ModelSerializer):
     """Scholarship serializer"""
     student_info = serializers.SerializerMethodField()
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent once the overdue sweep commits a batch: sender=StudentFee, school_id, fee_ids
+fees_overdue = Signal()
@@ -0,0 +1,71 @@
+import datetime
+
+from celery import shared_task
+from django.db import DatabaseError
+from django.utils import timezone
+
+from schools.models import School
+from .billing import run_billing
+from .overdue import sweep_overdue_fees
+from .reminders import send_fee_reminders
+from .rollups import rebuild_finance_rollups
+
+# Days back the nightly reconcile rebuilds; later due dates are always included
+FINANCE_RECONCILE_DAYS = 31
+
+
+@shared_task
+def run_monthly_billing():
+    """Queue this month's billing run for every active school"""
+    period = timezone.localdate().strftime('%Y-%m')
+    school_ids = list(School.objects.filter(is_active=True).values_list('id', flat=True))
+    for school_id in school_ids:
+        bill_school_fees.delay(school_id, period)
+    return f'Queued {period} billing for {len(school_ids)} schools.'
+
+
+@shared_task(bind=True, max_retries=3)
+def bill_school_fees(self, school_id, period, start_after=None):
+    """Bill one school for a period, reporting progress per chunk; a retry resumes after the last committed chunk"""
+    reached = {'last_student_id': start_after}
+
+    def progress(summary):
+        reached['last_student_id'] = summary['last_student_id']
+        self.update_state(state='PROGRESS', meta=summary)
+
+    try:
+        return run_billing(school_id, period, start_after=start_after, progress=progress)
+    except DatabaseError as exc:
+        raise self.retry(
+            exc=exc, countdown=60,
+            kwargs={'school_id': school_id, 'period': period, 'start_after': reached['last_student_id']},
+        )
+
+
+@shared_task
+def reconcile_finance_rollups():
+    """Rebuild recent days of the finance rollup, catching writes that bypassed the signals"""
+    count = rebuild_finance_rollups(start=timezone.localdate() - datetime.timedelta(days=FINANCE_RECONCILE_DAYS))
+    return f'Reconciled {count} school finance days.'
+
+
+@shared_task
+def mark_overdue_fees():
+    """Move unpaid fees past their due date to overdue"""
+    count = sweep_overdue_fees()
+    return f'Marked {count} fees overdue.'
+
+
+@shared_task
+def send_daily_fee_reminders():
+    """Queue a fee reminder campaign for every active school"""
+    school_ids = list(School.objects.filter(is_active=True).values_list('id', flat=True))
+    for school_id in school_ids:
+        send_school_fee_reminders.delay(school_id)
+    return f'Queued fee reminders for {len(school_ids)} schools.'
+
+
+@shared_task
+def send_school_fee_reminders(school_id, fee_ids=None):
+    """Remind a school's guardians of unpaid fees, optionally only the given fees"""
+    return send_fee_reminders(school_id, fee_ids=fee_ids)
@@ -1,3 +1,566 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from classes.models import Class
+from classes.rollover import rollover_academic_year
+from core.models import SystemSettings
+from schools.models import School, SchoolCommunicationUsage, SchoolStats, Subscription, SubscriptionPlan
+from students.models import Student
+from users.models import Parent, User
+from .billing import run_billing
+from .ledger import backfill_ledger, class_balances, school_arrears, sync_fee
+from .models import (
+    FeeCategory, FeeReminder, FeeStructure, LedgerEntry, Payment, ReceiptSequence, Scholarship, SchoolFinanceDaily,
+    StudentBalance, StudentFee,
+)
+from .overdue import sweep_overdue_fees
+from .payments import import_bank_statement, record_payment
+from .reminders import send_fee_reminders
+from .reports import class_wise_report
+from .rollups import finance_totals, generate_financial_report, rebuild_finance_rollups, refresh_finance_rollups
+from .signals import fees_overdue
+
+
+class FeeLedgerTests(TestCase):
+    """Fee and payment writes keep the ledger, running balances and paid totals in step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Ledger School', code='LGS', address='1 Main St', phone='555-0100', email='office@lgs.test',
+            principal_name='Pat Principal', principal_email='principal@lgs.test', principal_phone='555-0101',
+        )
+        cls.class_obj = Class.objects.create(school=cls.school, name='Grade 1', academic_year='2024-2025')
+        cls.alice, cls.bob = [
+            Student.objects.create(
+                user=User.objects.create_user(name, role=User.UserRole.STUDENT, school=cls.school),
+                school=cls.school, current_class=cls.class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            for name in ('alice', 'bob')
+        ]
+
+    def fee(self, student, amount, due_date=date(2024, 9, 1)):
+        return StudentFee.objects.create(student=student, due_date=due_date, amount=Decimal(amount), status='pending')
+
+    def pay(self, fee, amount, receipt):
+        return Payment.objects.create(student_fee=fee, amount=Decimal(amount), receipt_number=receipt, status='completed')
+
+    def balance(self, student):
+        return StudentBalance.objects.get(student=student).balance
+
+    def test_payments_refunds_and_waivers(self):
+        fee = self.fee(self.alice, '100.00')
+        payment = self.pay(fee, '40.00', 'R-1')
+        fee.refresh_from_db()
+        self.assertEqual((fee.paid_amount, fee.balance, self.balance(self.alice)), (40, 60, 60))
+
+        payment.status = Payment.Status.REFUNDED
+        payment.save()
+        payment.save()  # Saving again posts nothing
+        fee.refresh_from_db()
+        self.assertEqual((fee.paid_amount, self.balance(self.alice)), (0, 100))
+
+        self.pay(fee, '30.00', 'R-2')
+        fee.refresh_from_db()
+        fee.status = StudentFee.Status.WAIVED
+        fee.save()
+        self.assertEqual(self.balance(self.alice), 0)
+
+        entries = list(LedgerEntry.objects.filter(student=self.alice).values_list('entry_type', 'amount', 'balance_after'))
+        self.assertEqual(entries, [
+            ('charge', 100, 100), ('payment', -40, 60), ('refund', 40, 100), ('payment', -30, 70), ('waiver', -70, 0),
+        ])
+        self.assertEqual(
+            list(LedgerEntry.objects.filter(student=self.alice).values_list('sequence', flat=True)), [1, 2, 3, 4, 5]
+        )
+
+        # Deleting the fee (and its payments) reverses everything it posted
+        fee.delete()
+        self.assertEqual(self.balance(self.alice), 0)
+        self.assertEqual(LedgerEntry.objects.filter(student=self.alice).count(), 8)
+
+    def test_balance_reads_and_backfill(self):
+        self.fee(self.alice, '100.00')
+        self.pay(self.fee(self.bob, '50.00'), '50.00', 'R-3')
+        with self.assertNumQueries(1):
+            arrears = list(school_arrears(self.school.id))
+        self.assertEqual([(row['student_id'], row['balance']) for row in arrears], [(self.alice.id, 100)])
+        with self.assertNumQueries(1):
+            self.assertEqual(len(class_balances(self.class_obj.id)), 2)
+
+        # Rows written before the ledger existed are posted once, however often the backfill runs
+        LedgerEntry.objects.all().delete()
+        StudentBalance.objects.all().delete()
+        StudentFee.objects.update(paid_amount=0)
+        self.assertEqual(backfill_ledger(self.school.id), (2, 1))
+        self.assertEqual(backfill_ledger(self.school.id), (0, 0))
+        self.assertEqual((self.balance(self.alice), self.balance(self.bob)), (100, 0))
+        self.assertEqual(StudentFee.objects.get(student=self.bob).paid_amount, 50)
+
+
+class BillingRunTests(TestCase):
+    """Billing runs charge each enrolled student once per period, net of scholarships"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Billing School', code='BLS', address='1 Main St', phone='555-0100', email='office@bls.test',
+            principal_name='Pat Principal', principal_email='principal@bls.test', principal_phone='555-0101',
+        )
+        cls.class_obj = Class.objects.create(school=cls.school, name='Grade 1', academic_year='2024-2025')
+        for name, amount, frequency in [('Tuition', 100, 'monthly'), ('Library', 20, 'monthly'), ('Sports', 50, 'quarterly')]:
+            FeeStructure.objects.create(
+                class_obj=cls.class_obj, category=FeeCategory.objects.create(name=name), amount=amount,
+                frequency=frequency, academic_year='2024-2025',
+            )
+        cls.students = [
+            Student.objects.create(
+                user=User.objects.create_user(f'billed-{i}', role=User.UserRole.STUDENT, school=cls.school),
+                school=cls.school, current_class=cls.class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            for i in range(3)
+        ]
+        Scholarship.objects.create(
+            student=cls.students[0], name='Merit', percentage=50, amount=10, start_date=date(2024, 9, 1),
+        )
+
+    def test_chunked_run_is_idempotent(self):
+        summary = run_billing(self.school.id, '2025-01', chunk_size=2)
+        self.assertEqual((summary['students'], summary['fees_created'], summary['fees_existing']), (3, 6, 0))
+        self.assertEqual((summary['billed'], summary['discounts'], summary['last_student_id']),
+                         ('510.00', '105.00', self.students[-1].id))
+
+        scholar = StudentFee.objects.filter(student=self.students[0]).order_by('structure')
+        self.assertEqual([(fee.structure, fee.amount, fee.remarks) for fee in scholar],
+                         [('monthly', 50, 'Library, Tuition'), ('quarterly', 15, 'Sports')])
+        self.assertEqual(StudentBalance.objects.get(student=self.students[0]).balance, 65)
+        self.assertEqual(StudentBalance.objects.get(student=self.students[1]).balance, 170)
+        # The bulk-posted entries are what the signal path would have posted
+        self.assertEqual(sync_fee(scholar[0]), [])
+
+        again = run_billing(self.school.id, '2025-01', chunk_size=2)
+        self.assertEqual((again['fees_created'], again['fees_existing']), (0, 6))
+        resumed = run_billing(self.school.id, '2025-02', start_after=self.students[1].id)
+        self.assertEqual((resumed['students'], resumed['fees_created']), (1, 1))
+        self.assertEqual(LedgerEntry.objects.filter(student=self.students[2]).count(), 3)
+
+
+class ClassWiseReportTests(TestCase):
+    """The class-wise report is two grouped queries, cached until a fee or payment of the school changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Report School', code='RPS', address='1 Main St', phone='555-0100', email='office@rps.test',
+            principal_name='Pat Principal', principal_email='principal@rps.test', principal_phone='555-0101',
+        )
+        cls.grade1, cls.grade2, cls.empty = [
+            Class.objects.create(school=cls.school, name=name, academic_year='2024-2025')
+            for name in ('Grade 1', 'Grade 2', 'Grade 3')
+        ]
+        cls.fees = []
+        for i, class_obj in enumerate([cls.grade1, cls.grade1, cls.grade2]):
+            student = Student.objects.create(
+                user=User.objects.create_user(f'reported-{i}', role=User.UserRole.STUDENT, school=cls.school),
+                school=cls.school, current_class=class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            cls.fees.append(StudentFee.objects.create(
+                student=student, due_date=date(2024, 9, 1), amount=Decimal('100.00'), status='pending',
+            ))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_grouped_and_cached(self):
+        with self.assertNumQueries(2):
+            report = class_wise_report(self.school.id)
+        self.assertEqual(
+            [(row['class_name'], row['total_students'], row['total_fees'], row['pending_count']) for row in report],
+            [('Grade 1', 2, 200, 2), ('Grade 2', 1, 100, 1)],
+        )
+        with self.assertNumQueries(0):
+            class_wise_report(self.school.id)
+        self.assertEqual(class_wise_report(self.school.id, date(2025, 1, 1), date(2025, 1, 31))[0]['total_fees'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(student_fee=self.fees[0], amount=Decimal('50.00'), receipt_number='R-9', status='completed')
+        grade1 = class_wise_report(self.school.id)[0]
+        self.assertEqual((grade1['total_paid'], grade1['collection_rate']), (50, 25))
+
+    def test_class_changes_refresh_the_report(self):
+        class_wise_report(self.school.id)
+        student = self.fees[2].student
+        with self.captureOnCommitCallbacks(execute=True):
+            student.current_class = self.empty
+            student.save()
+        self.assertEqual(
+            [(row['class_name'], row['total_students']) for row in class_wise_report(self.school.id)],
+            [('Grade 1', 2), ('Grade 3', 1)],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rollover_academic_year(self.school.id, '2024-2025', '2025-2026')
+        self.assertIn('2025-2026', {row['academic_year'] for row in class_wise_report(self.school.id)})
+
+    def test_invalid_school_id_is_a_bad_request(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('report-super', role=User.UserRole.SUPER_ADMIN))
+        for action in ('summary', 'class_wise'):
+            self.assertEqual(client.get(f'/api/v1/fees/reports/{action}/', {'school_id': 'abc'}).status_code, 400)
+        self.assertEqual(client.post('/api/v1/fees/reports/generate/?school_id=abc').status_code, 400)
+
+
+class FinanceRollupTests(TestCase):
+    """Fee and payment writes keep one rollup row per school and day, which reports sum"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Rollup School', code='RLS', address='1 Main St', phone='555-0100', email='office@rls.test',
+            principal_name='Pat Principal', principal_email='principal@rls.test', principal_phone='555-0101',
+        )
+        cls.student = Student.objects.create(
+            user=User.objects.create_user('rolled', role=User.UserRole.STUDENT, school=cls.school),
+            school=cls.school, date_of_birth=date(2010, 1, 1),
+            gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+        )
+
+    def test_rollups_follow_writes_and_feed_reports(self):
+        september = StudentFee.objects.create(
+            student=self.student, due_date=date(2024, 9, 1), amount=Decimal('100.00'), status='pending',
+        )
+        StudentFee.objects.create(
+            student=self.student, due_date=date(2024, 10, 1), amount=Decimal('80.00'), status='overdue',
+        )
+        Payment.objects.create(student_fee=september, amount=Decimal('30.00'), receipt_number='R-1',
+                               status='completed', payment_method='cash')
+        Payment.objects.create(student_fee=september, amount=Decimal('20.00'), receipt_number='R-2',
+                               status='completed', payment_method='card')
+        today = timezone.localdate()
+
+        # Part-paid after its due date, the September fee is settled as overdue
+        rows = {row.date: row for row in SchoolFinanceDaily.objects.filter(school=self.school)}
+        self.assertEqual((rows[date(2024, 9, 1)].billed, rows[date(2024, 9, 1)].pending), (100, 0))
+        self.assertEqual((rows[date(2024, 9, 1)].overdue, rows[date(2024, 10, 1)].overdue), (50, 80))
+        self.assertEqual((rows[today].collected, rows[today].payments, rows[today].by_method['card']['count']), (50, 2, 1))
+
+        # The signal path and the rebuild agree
+        snapshot = list(SchoolFinanceDaily.objects.values_list('date', 'billed', 'pending', 'overdue', 'collected', 'by_method'))
+        rebuild_finance_rollups([self.school.id])
+        self.assertEqual(
+            list(SchoolFinanceDaily.objects.values_list('date', 'billed', 'pending', 'overdue', 'collected', 'by_method')),
+            snapshot,
+        )
+
+        with self.assertNumQueries(1):
+            totals = finance_totals(self.school.id, date(2024, 1, 1), today)
+        self.assertEqual((totals['billed'], totals['collected'], totals['pending'], totals['overdue']), (180, 50, 0, 130))
+        self.assertEqual(totals['by_method']['cash'], {'amount': 30, 'count': 1})
+
+        report = generate_financial_report(self.school.id, date(2024, 9, 1), date(2024, 10, 31))
+        self.assertEqual((report.report_type, report.total_pending, report.total_overdue), ('quarterly', 0, 130))
+        self.assertEqual([month['month'] for month in report.report_data['months']], ['2024-09', '2024-10'])
+
+
+    @override_settings(TIME_ZONE='Africa/Addis_Ababa')
+    def test_payments_are_read_by_local_day_range(self):
+        fee = StudentFee.objects.create(
+            student=self.student, due_date=date(2024, 9, 1), amount=Decimal('100.00'), status='pending',
+        )
+        payment = Payment.objects.create(student_fee=fee, amount=Decimal('30.00'), receipt_number='R-1',
+                                         status='completed', payment_method='cash')
+        # 22:30 UTC on the 1st is already the 2nd in Addis Ababa (UTC+3)
+        Payment.objects.filter(pk=payment.pk).update(created_at=datetime(2024, 9, 1, 22, 30, tzinfo=dt_timezone.utc))
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_finance_rollups(self.school.id, [date(2024, 9, 1), date(2024, 9, 2)])
+        # A range on created_at, which its index serves, rather than a cast to a date
+        self.assertFalse([query for query in queries if 'cast_date' in query['sql'].partition(' WHERE ')[2]])
+        rows = {row.date: row for row in SchoolFinanceDaily.objects.filter(school=self.school)}
+        self.assertEqual((rows[date(2024, 9, 1)].collected, rows[date(2024, 9, 2)].collected), (0, 30))
+
+class OverdueSweepTests(TestCase):
+    """The sweep moves only unpaid fees past due, in batches, and announces them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Sweep School', code='SWS', address='1 Main St', phone='555-0100', email='office@sws.test',
+            principal_name='Pat Principal', principal_email='principal@sws.test', principal_phone='555-0101',
+        )
+        cls.student = Student.objects.create(
+            user=User.objects.create_user('swept', role=User.UserRole.STUDENT, school=cls.school),
+            school=cls.school, date_of_birth=date(2010, 1, 1),
+            gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+        )
+
+    def test_sweep(self):
+        fees = {
+            status: StudentFee.objects.create(
+                student=self.student, structure=structure, due_date=due_date, amount=Decimal('10.00'), status=status,
+            )
+            for status, structure, due_date in [
+                ('pending', 'monthly', date(2024, 9, 1)), ('partial', 'quarterly', date(2024, 9, 1)),
+                ('paid', 'yearly', date(2024, 9, 1)), ('waived', 'one_time', date(2024, 9, 1)),
+            ]
+        }
+        upcoming = StudentFee.objects.create(student=self.student, due_date=date(2025, 2, 1), amount=10, status='pending')
+        self.assertEqual([fee.is_overdue for fee in fees.values()], [True, True, False, False])
+
+        events = []
+        fees_overdue.connect(lambda sender, **kwargs: events.append(kwargs), weak=False, dispatch_uid='test-sweep')
+        self.addCleanup(fees_overdue.disconnect, dispatch_uid='test-sweep')
+        with mock.patch('fees.tasks.send_school_fee_reminders.delay') as remind, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_overdue_fees(today=date(2025, 1, 15), batch_size=1), 2)
+        self.assertEqual(remind.call_count, 2)
+        self.assertEqual(
+            sorted(fee_id for event in events for fee_id in event['fee_ids']),
+            [fees['pending'].id, fees['partial'].id],
+        )
+        self.assertEqual(
+            dict(StudentFee.objects.values_list('id', 'status')),
+            {fees['pending'].id: 'overdue', fees['partial'].id: 'overdue', fees['paid'].id: 'paid',
+             fees['waived'].id: 'waived', upcoming.id: 'pending'},
+        )
+        self.assertEqual(SchoolFinanceDaily.objects.get(school=self.school, date=date(2024, 9, 1)).overdue, 20)
+        self.assertEqual(sweep_overdue_fees(today=date(2025, 1, 15)), 0)
+
+
+class FeeReminderTests(TestCase):
+    """A campaign sends one message per guardian within the school's quota and records every attempt"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Reminder School', code='RMS', address='1 Main St', phone='555-0100', email='office@rms.test',
+            principal_name='Pat Principal', principal_email='principal@rms.test', principal_phone='555-0101',
+        )
+        plan = SubscriptionPlan.objects.create(name='basic', max_emails_per_month=5, max_sms_per_month=1)
+        Subscription.objects.create(
+            school=cls.school, plan=plan, status=Subscription.Status.ACTIVE,
+            start_date=date(2024, 1, 1), end_date=date(2099, 1, 1), amount=0,
+        )
+        cls.students = {
+            name: Student.objects.create(
+                user=User.objects.create_user(name, role=User.UserRole.STUDENT, school=cls.school),
+                school=cls.school, date_of_birth=date(2010, 1, 1), gender='F', address='-',
+                emergency_contact=contact, emergency_contact_name='Guardian', year='1',
+            )
+            for name, contact in [('alice', '555-1'), ('bob', '555-1'), ('carol', '555-2'), ('dave', '555-2'),
+                                  ('erin', '555-3')]
+        }
+        parent = Parent.objects.create(
+            user=User.objects.create_user('parent', email='parent@rms.test', role=User.UserRole.PARENT, school=cls.school),
+            occupation='-', emergency_contact='555-9',
+        )
+        parent.children.set([cls.students['alice'], cls.students['bob']])
+        cls.fees = [
+            StudentFee.objects.create(student=student, due_date=date(2025, 1, 1), amount=10, status='overdue')
+            for student in cls.students.values()
+        ]
+        StudentFee.objects.create(student=cls.students['erin'], due_date=date(2025, 6, 1), amount=10)
+        settings = SystemSettings.get_solo()
+        settings.sms_notifications = True
+        settings.save()
+
+    def test_campaign(self):
+        # As if an SMS gateway accepted every message
+        with mock.patch('notifications.services.SmsService.send_batch', side_effect=lambda messages: [True] * len(messages)):
+            summary = send_fee_reminders(self.school.id, today=date(2025, 1, 15))
+        self.assertEqual(
+            {key: summary[key] for key in ('fees', 'guardians', 'emails_sent', 'sms_sent', 'over_quota')},
+            {'fees': 5, 'guardians': 3, 'emails_sent': 1, 'sms_sent': 1, 'over_quota': 1},
+        )
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['parent@rms.test'])
+        self.assertIn('alice', mail.outbox[0].body)
+        self.assertIn('bob', mail.outbox[0].body)
+        usage = SchoolCommunicationUsage.objects.get(school=self.school)
+        self.assertEqual((usage.emails_sent, usage.sms_sent), (1, 1))
+        self.assertEqual(FeeReminder.objects.count(), 5)
+        self.assertEqual(FeeReminder.objects.filter(is_sent=True).count(), 4)
+
+        # Reminded fees wait out the interval; the fee held back by the quota is still due one
+        summary = send_fee_reminders(self.school.id, today=date(2025, 1, 15))
+        self.assertEqual((summary['fees'], summary['over_quota']), (1, 1))
+        self.assertEqual(FeeReminder.objects.count(), 6)
+
+    def test_sms_without_a_gateway_is_not_counted_as_sent(self):
+        summary = send_fee_reminders(self.school.id, today=date(2025, 1, 15))
+        self.assertEqual((summary['sms_sent'], summary['failed'], summary['over_quota']), (0, 1, 1))
+        usage = SchoolCommunicationUsage.objects.get(school=self.school)
+        self.assertEqual((usage.emails_sent, usage.sms_sent), (1, 0))
+        self.assertEqual(FeeReminder.objects.filter(reminder_type=FeeReminder.ReminderType.SMS, is_sent=True).count(), 0)
+
+        # The fees whose SMS was not delivered are still due a reminder
+        self.assertEqual(send_fee_reminders(self.school.id, today=date(2025, 1, 15))['fees'], 3)
+
+
+class PaymentServiceTests(TestCase):
+    """Payments are idempotent, checked against the locked fee and numbered from the school's receipt sequence"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Payment School', code='PYS', address='1 Main St', phone='555-0100', email='office@pys.test',
+            principal_name='Pat Principal', principal_email='principal@pys.test', principal_phone='555-0101',
+        )
+        cls.student = Student.objects.create(
+            user=User.objects.create_user('payer', role=User.UserRole.STUDENT, school=cls.school),
+            school=cls.school, date_of_birth=date(2010, 1, 1),
+            gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+        )
+
+    def setUp(self):
+        self.due_date = timezone.localdate() + timedelta(days=30)
+        self.fees = [
+            StudentFee.objects.create(student=self.student, structure=structure, due_date=self.due_date,
+                                      amount=Decimal('100.00'), status='pending')
+            for structure in ('monthly', 'quarterly')
+        ]
+
+    def test_record_payment(self):
+        fee = self.fees[0]
+        payment, created = record_payment(self.school.id, fee.id, '40.00', 'cash', idempotency_key='k1')
+        self.assertTrue(created)
+        self.assertEqual(payment.receipt_number, 'PYS-0000001')
+        self.assertEqual(record_payment(self.school.id, fee.id, '40.00', 'cash', idempotency_key='k1'), (payment, False))
+        with self.assertRaises(ValueError):
+            record_payment(self.school.id, fee.id, '41.00', 'cash', idempotency_key='k1')
+        with self.assertRaises(ValueError):
+            record_payment(self.school.id, fee.id, '60.01', 'cash')
+        fee.refresh_from_db()
+        self.assertEqual((fee.status, fee.paid_amount), ('partial', Decimal('40.00')))
+
+        payment, _ = record_payment(self.school.id, fee.id, '60', 'card')
+        fee.refresh_from_db()
+        self.assertEqual((payment.receipt_number, fee.status, fee.balance), ('PYS-0000002', 'paid', 0))
+        self.assertEqual(StudentBalance.objects.get(student=self.student).balance, Decimal('100.00'))
+
+    def test_refund_reopens_the_fee(self):
+        fee = self.fees[0]
+        payment, _ = record_payment(self.school.id, fee.id, '100', 'cash')
+        fee.refresh_from_db()
+        self.assertEqual(fee.status, 'paid')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.status = Payment.Status.REFUNDED
+            payment.save()
+        fee.refresh_from_db()
+        self.assertEqual((fee.status, fee.paid_amount, fee.balance), ('pending', 0, 100))
+        self.assertEqual(StudentBalance.objects.get(student=self.student).balance, Decimal('200.00'))
+        self.assertEqual(SchoolFinanceDaily.objects.get(school=self.school, date=self.due_date).pending, 200)
+        self.assertEqual(SchoolStats.objects.get(school=self.school).students_with_pending_fees, 1)
+
+        record_payment(self.school.id, fee.id, '100', 'card')
+        fee.refresh_from_db()
+        self.assertEqual((fee.status, fee.balance), ('paid', 0))
+
+        # Past its due date, a reopened fee is overdue again
+        fee.due_date = date(2025, 1, 1)
+        fee.save()
+        fee.payments.filter(status=Payment.Status.COMPLETED).delete()
+        fee.refresh_from_db()
+        self.assertEqual(fee.status, 'overdue')
+
+    def test_fee_marked_paid_by_default_takes_payments(self):
+        # StudentFee.status defaults to paid, so fees created outside billing say paid with nothing paid
+        fee = StudentFee.objects.create(student=self.student, structure='yearly', due_date=self.due_date,
+                                        amount=Decimal('50.00'))
+        self.assertEqual((fee.status, fee.balance), ('paid', 50))
+        record_payment(self.school.id, fee.id, '20', 'cash')
+        fee.refresh_from_db()
+        self.assertEqual((fee.status, fee.balance), ('partial', 30))
+        summary = import_bank_statement(self.school.id, ['transaction_id,fee_id,amount', f'T9,{fee.id},30'])
+        self.assertEqual((summary['imported'], summary['errors']), (1, []))
+        with self.assertRaisesMessage(ValueError, 'Fee is already paid'):
+            record_payment(self.school.id, fee.id, '1', 'cash')
+
+        fee.status = StudentFee.Status.WAIVED
+        fee.save()
+        with self.assertRaisesMessage(ValueError, 'Fee is already waived'):
+            record_payment(self.school.id, fee.id, '1', 'cash')
+
+    def test_import_bank_statement(self):
+        first, second = self.fees
+        statement = [
+            'transaction_id,fee_id,amount,remarks',
+            f'T1,{first.id},100.00,',
+            f'T2,{second.id},30.00,',
+            f'T3,{second.id},80.00,',  # More than the 70 left once T2 is in
+            f'T4,{second.id},abc,',
+            f'T5,999999,10,',
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = import_bank_statement(self.school.id, statement, chunk_size=2)
+        self.assertEqual((summary['imported'], summary['amount']), (2, '130.00'))
+        self.assertEqual([error['line'] for error in summary['errors']], [5, 4, 6])
+        self.assertEqual(
+            sorted(Payment.objects.values_list('receipt_number', flat=True)), ['PYS-0000001', 'PYS-0000002'],
+        )
+        self.assertEqual(ReceiptSequence.objects.get(school=self.school).last_number, 2)
+        self.assertEqual(
+            list(StudentFee.objects.order_by('id').values_list('status', 'paid_amount')),
+            [('paid', Decimal('100.00')), ('partial', Decimal('30.00'))],
+        )
+        self.assertEqual(StudentBalance.objects.get(student=self.student).balance, Decimal('70.00'))
+        self.assertEqual(SchoolFinanceDaily.objects.get(school=self.school, date=self.due_date).pending, 70)
+
+        summary = import_bank_statement(self.school.id, statement[:3])
+        self.assertEqual((summary['imported'], summary['duplicates']), (0, 2))
+
+
+class BillingTaskViewTests(TestCase):
+    """Billing runs are only reported to the school that queued them, whatever their state"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school, other = [
+            School.objects.create(
+                name=f'Billing School {code}', code=code, address='-', phone='-', email=f'office@{code}.test',
+                principal_name='-', principal_email=f'principal@{code}.test', principal_phone='-',
+            )
+            for code in ('BLA', 'BLB')
+        ]
+        cls.accountant = User.objects.create_user('bl-accountant', role=User.UserRole.ACCOUNTANT, school=cls.school)
+        cls.outsider = User.objects.create_user('bl-outsider', role=User.UserRole.ACCOUNTANT, school=other)
+        cls.parent = User.objects.create_user('bl-parent', role=User.UserRole.PARENT, school=cls.school)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def request(self, user, method, action, data):
+        self.client.force_authenticate(user)
+        return getattr(self.client, method)(f'/api/v1/fees/structures/{action}/', data, format='json')
+
+    def test_status_is_checked_for_every_state(self):
+        with mock.patch('fees.tasks.bill_school_fees.delay', return_value=SimpleNamespace(id='bill-1')):
+            response = self.request(self.accountant, 'post', 'bill', {'period': '2024-09'})
+        self.assertEqual(response.data, {'task_id': 'bill-1'})
+
+        failed = mock.Mock(state='FAILURE', info=RuntimeError('billing crashed'))
+        failed.failed.return_value = True
+        with mock.patch('celery.result.AsyncResult', return_value=failed):
+            self.assertEqual(self.request(self.parent, 'get', 'bill_status', {'task_id': 'bill-1'}).status_code, 403)
+            self.assertEqual(self.request(self.outsider, 'get', 'bill_status', {'task_id': 'bill-1'}).status_code, 404)
+            response = self.request(self.accountant, 'get', 'bill_status', {'task_id': 'bill-1'})
+        self.assertEqual((response.data['state'], response.data['error']), ('FAILURE', 'billing crashed'))
+
+    def test_invalid_school_id_is_a_bad_request(self):
+        admin = User.objects.create_user('bl-super', role=User.UserRole.SUPER_ADMIN)
+        self.assertEqual(self.request(admin, 'post', 'bill', {'school_id': 'abc', 'dry_run': True}).status_code, 400)
@@ -2,16 +2,26 @@ from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Sum, Count
+from django.db.models import Sum
 from django.utils import timezone
+import io
 from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from .billing import parse_period, run_billing
+from .ledger import class_balances, school_arrears
+from .payments import import_bank_statement, record_payment
+from .reports import class_wise_report
+from .rollups import finance_totals, generate_financial_report
 from .models import (
-    FeeStructure, StudentFee, Payment, FeeCategory, Scholarship
+    FeeStructure, StudentFee, Payment, FeeCategory, Scholarship, LedgerEntry
 )
 from .serializers import (
     FeeStructureSerializer, StudentFeeSerializer, PaymentSerializer,
-    FeeCategorySerializer, ScholarshipSerializer
+    FeeCategorySerializer, ScholarshipSerializer, LedgerEntrySerializer
 )
+from core.background import remember_task_school, task_visible_to
+from core.permissions import school_id_param
+from core.scope import UserScope
 
 
 class FeeStructureViewSet(viewsets.ModelViewSet):
@@ -27,13 +37,57 @@ class FeeStructureViewSet(viewsets.ModelViewSet):
         if user.role in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.ACCOUNTANT]:
             return FeeStructure.objects.all()
         elif user.role == user.UserRole.STUDENT:
-            try:
-                student = user.student_profile
-                if student.current_class:
-                    return FeeStructure.objects.filter(class_obj=student.current_class)
-            except:
-                pass
+            return FeeStructure.objects.filter(class_obj_id__in=UserScope.for_user(user).class_ids)
         return FeeStructure.objects.none()
+    
+    def get_billing_school_id(self, request):
+        """School a billing run targets: the user's own, or any named by a super admin"""
+        user = request.user
+        if user.role == user.UserRole.SUPER_ADMIN:
+            return school_id_param(request.data.get('school_id') or request.query_params.get('school_id')) or user.school_id
+        if user.role in [user.UserRole.SCHOOL_ADMIN, user.UserRole.ACCOUNTANT]:
+            return user.school_id
+        return None
+    
+    @action(detail=False, methods=['post'])
+    def bill(self, request):
+        """Bill the school's students for a period (YYYY-MM); dry_run returns the summary without writing"""
+        from .tasks import bill_school_fees
+        school_id = self.get_billing_school_id(request)
+        if not school_id:
+            return Response({'error': 'Only school admins and accountants can run billing'},
+                            status=status.HTTP_403_FORBIDDEN)
+        try:
+            period = parse_period(request.data.get('period') or timezone.localdate())
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if request.data.get('dry_run'):
+            return Response(run_billing(school_id, period, dry_run=True))
+        task = bill_school_fees.delay(school_id, period.strftime('%Y-%m'))
+        remember_task_school(task.id, school_id)
+        return Response({'task_id': task.id}, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'])
+    def bill_status(self, request):
+        """State of a billing run: PROGRESS with the running summary, then SUCCESS with the final one"""
+        from celery.result import AsyncResult
+        school_id = self.get_billing_school_id(request)
+        if not school_id:
+            return Response({'error': 'Only school admins and accountants can run billing'},
+                            status=status.HTTP_403_FORBIDDEN)
+        task_id = request.query_params.get('task_id')
+        if not task_id:
+            return Response({'error': 'task_id parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Checked for every state: pending and failed results don't name their school
+        if not task_visible_to(task_id, school_id):
+            return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
+        result = AsyncResult(task_id)
+        if result.failed():
+            return Response({'task_id': task_id, 'state': result.state, 'error': str(result.info)})
+        info = result.info if isinstance(result.info, dict) else {}
+        return Response({'task_id': task_id, 'state': result.state, **info})
 
 
 class StudentFeeViewSet(viewsets.ModelViewSet):
@@ -68,11 +122,7 @@ class StudentFeeViewSet(viewsets.ModelViewSet):
         if user.role in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.ACCOUNTANT, user.UserRole.SECRETARY]:
             return queryset
         elif user.role == user.UserRole.STUDENT:
-            try:
-                student = user.student_profile
-                return queryset.filter(student=student)
-            except:
-                return queryset.none()
+            return queryset.filter(student_id__in=UserScope.for_user(user).student_ids)
         return queryset.none()
     
     @action(detail=False, methods=['get'])
@@ -88,6 +138,55 @@ class StudentFeeViewSet(viewsets.ModelViewSet):
         queryset = self.get_queryset().filter(status='overdue')
         serializer = StudentFeeSerializer(queryset, many=True)
         return Response(serializer.data)
+    
+    def get_ledger_school_id(self, request):
+        """School whose balances the user may read: their own, or any for super admins"""
+        user = request.user
+        if user.role == user.UserRole.SUPER_ADMIN:
+            return request.query_params.get('school_id') or user.school_id
+        if user.role in [user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.ACCOUNTANT, user.UserRole.SECRETARY]:
+            return user.school_id
+        return None
+    
+    @action(detail=False, methods=['get'])
+    def ledger(self, request):
+        """Ledger entries of one student, oldest first"""
+        student_id = request.query_params.get('student')
+        if not student_id:
+            return Response({'error': 'student is required'}, status=status.HTTP_400_BAD_REQUEST)
+        user = request.user
+        entries = LedgerEntry.objects.filter(student_id=student_id)
+        if user.role == user.UserRole.STUDENT:
+            entries = entries.filter(student_id__in=UserScope.for_user(user).student_ids)
+        elif user.role != user.UserRole.SUPER_ADMIN:
+            school_id = self.get_ledger_school_id(request)
+            if school_id is None:
+                return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+            entries = entries.filter(student__school_id=school_id)
+        return Response(LedgerEntrySerializer(entries.order_by('sequence'), many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def balances(self, request):
+        """Ledger balances of a class's students"""
+        school_id = self.get_ledger_school_id(request)
+        class_id = request.query_params.get('class_id')
+        if school_id is None:
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        if not class_id:
+            return Response({'error': 'class_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(list(class_balances(class_id).filter(school_id=school_id)))
+    
+    @action(detail=False, methods=['get'])
+    def arrears(self, request):
+        """Students of the school with an outstanding ledger balance, largest first"""
+        school_id = self.get_ledger_school_id(request)
+        if school_id is None:
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            min_balance = Decimal(request.query_params.get('min_balance', '0'))
+        except InvalidOperation:
+            return Response({'error': 'min_balance must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(list(school_arrears(school_id, min_balance)))
 
 
 class PaymentViewSet(viewsets.ModelViewSet):
@@ -103,55 +202,69 @@ class PaymentViewSet(viewsets.ModelViewSet):
         if user.role in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.ACCOUNTANT]:
             return Payment.objects.all()
         elif user.role == user.UserRole.STUDENT:
-            try:
-                student = user.student_profile
-                return Payment.objects.filter(student_fee__student=student)
-            except:
-                return Payment.objects.none()
+            return Payment.objects.filter(student_fee__student_id__in=UserScope.for_user(user).student_ids)
         return Payment.objects.none()
     
+    PAYMENT_ROLES = ['super_admin', 'school_admin', 'accountant']
+    
+    def get_payment_school_id(self, request):
+        """School the user takes payments for: their own, or for super admins the school_id they give"""
+        user = request.user
+        if user.role == user.UserRole.SUPER_ADMIN:
+            return request.data.get('school_id') or user.school_id
+        return user.school_id
+    
     @action(detail=False, methods=['post'])
     def process_payment(self, request):
-        """Process a payment"""
+        """Process a payment; resubmitting with the same Idempotency-Key returns the first payment"""
         user = request.user
-        if user.role not in [user.UserRole.ACCOUNTANT, user.UserRole.SCHOOL_ADMIN]:
+        if user.role not in self.PAYMENT_ROLES:
             return Response({'error': 'Only accountants and school admins can process payments'}, 
                           status=status.HTTP_403_FORBIDDEN)
         
         student_fee_id = request.data.get('student_fee_id')
         amount = request.data.get('amount')
         payment_method = request.data.get('payment_method')
-        reference_number = request.data.get('reference_number', '')
+        idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
         
         if not all([student_fee_id, amount, payment_method]):
             return Response({'error': 'Missing required data'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            student_fee = StudentFee.objects.get(id=student_fee_id)
-            
-            # Create payment record
-            payment = Payment.objects.create(
-                student_fee=student_fee,
-                amount=amount,
-                payment_method=payment_method,
-                reference_number=reference_number,
-                processed_by=user
+            payment, created = record_payment(
+                self.get_payment_school_id(request), student_fee_id, amount, payment_method,
+                idempotency_key=idempotency_key,
+                transaction_id=request.data.get('transaction_id', ''),
+                remarks=request.data.get('remarks', ''),
+                user=user,
             )
-            
-            # Update student fee status
-            if amount >= student_fee.amount:
-                student_fee.status = 'paid'
-            else:
-                student_fee.status = 'partial'
-            student_fee.save()
-            
-            serializer = PaymentSerializer(payment)
-            return Response(serializer.data)
-            
         except StudentFee.DoesNotExist:
             return Response({'error': 'Student fee not found'}, 
                           status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = PaymentSerializer(payment)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'])
+    def import_statement(self, request):
+        """Import the payments of a bank statement CSV (transaction_id, fee_id, amount[, remarks])"""
+        user = request.user
+        if user.role not in self.PAYMENT_ROLES:
+            return Response({'error': 'Only accountants and school admins can import payments'},
+                          status=status.HTTP_403_FORBIDDEN)
+        school_id = self.get_payment_school_id(request)
+        file_obj = request.FILES.get('file')
+        if not school_id or not file_obj:
+            return Response({'error': 'school and file are required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            summary = import_bank_statement(school_id, io.TextIOWrapper(file_obj, encoding='utf-8-sig'), user=user)
+        except (UnicodeDecodeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary)
     
     @action(detail=False, methods=['get'])
     def today_collections(self, request):
@@ -201,11 +314,7 @@ class ScholarshipViewSet(viewsets.ModelViewSet):
         if user.role in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.ACCOUNTANT]:
             return Scholarship.objects.all()
         elif user.role == user.UserRole.STUDENT:
-            try:
-                student = user.student_profile
-                return Scholarship.objects.filter(student=student)
-            except:
-                return Scholarship.objects.none()
+            return Scholarship.objects.filter(student_id__in=UserScope.for_user(user).student_ids)
         return Scholarship.objects.none()
 
 
@@ -213,110 +322,113 @@ class FeeReportViewSet(viewsets.ViewSet):
     """Fee reporting viewset"""
     permission_classes = [permissions.IsAuthenticated]
     
+    REPORT_ROLES = ['super_admin', 'school_admin', 'principal', 'accountant']
+    
+    def get_report_school_id(self, request):
+        """The user's school, or for super admins the school_id they ask for"""
+        user = request.user
+        if user.role == user.UserRole.SUPER_ADMIN:
+            return school_id_param(request.query_params.get('school_id') or request.data.get('school_id')) or user.school_id
+        return user.school_id
+    
+    def get_report_period(self, params):
+        """start_date and end_date from the request, the current month by default; raises ValueError"""
+        start_date = params.get('start_date')
+        end_date = params.get('end_date')
+        if start_date and end_date:
+            try:
+                return (timezone.datetime.strptime(start_date, '%Y-%m-%d').date(),
+                        timezone.datetime.strptime(end_date, '%Y-%m-%d').date())
+            except ValueError:
+                raise ValueError('Dates must be given as YYYY-MM-DD')
+        today = timezone.now().date()
+        return today.replace(day=1), today
+    
     @action(detail=False, methods=['get'])
     def summary(self, request):
-        """Get fee summary report"""
+        """Get fee summary report for the school, summed from the daily finance rollup"""
         user = request.user
-        if user.role not in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.ACCOUNTANT]:
+        if user.role not in self.REPORT_ROLES:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        school_id = self.get_report_school_id(request)
+        if not school_id:
+            return Response({'error': 'school_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_date, end_date = self.get_report_period(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get date range from query params
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        
-        if start_date and end_date:
-            start_date = timezone.datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d').date()
-        else:
-            # Default to current month
-            today = timezone.now().date()
-            start_date = today.replace(day=1)
-            end_date = today
-        
-        # Calculate summary statistics
-        total_fees = StudentFee.objects.filter(
-            due_date__range=[start_date, end_date]
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        total_paid = Payment.objects.filter(
-            created_at__date__range=[start_date, end_date],
-            status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        pending_fees = StudentFee.objects.filter(
-            status='pending',
-            due_date__lte=timezone.now().date()
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        overdue_fees = StudentFee.objects.filter(
-            status='overdue'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Payment method breakdown
-        payment_methods = Payment.objects.filter(
-            created_at__date__range=[start_date, end_date],
-            status='completed'
-        ).values('payment_method').annotate(
-            total=Sum('amount'),
-            count=Count('id')
-        )
-        
+        totals = finance_totals(school_id, start_date, end_date)
         return Response({
             'period': {
                 'start_date': start_date,
                 'end_date': end_date
             },
             'summary': {
-                'total_fees': total_fees,
-                'total_paid': total_paid,
-                'pending_fees': pending_fees,
-                'overdue_fees': overdue_fees,
-                'collection_rate': (total_paid / total_fees * 100) if total_fees > 0 else 0
+                'total_fees': totals['billed'],
+                'total_paid': totals['collected'],
+                'pending_fees': totals['pending'],
+                'overdue_fees': totals['overdue'],
+                'collection_rate': totals['collection_rate']
             },
-            'payment_methods': payment_methods
+            'payment_methods': [
+                {'payment_method': method, 'total': value['amount'], 'count': value['count']}
+                for method, value in totals['by_method'].items()
+            ],
+            'months': totals['months']
         })
     
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        """Create a FinancialReport for the school over start_date..end_date from the daily finance rollup"""
+        user = request.user
+        if user.role not in self.REPORT_ROLES:
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        school_id = self.get_report_school_id(request)
+        if not school_id:
+            return Response({'error': 'school_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_date, end_date = self.get_report_period(request.data)
+            report = generate_financial_report(
+                school_id, start_date, end_date, title=request.data.get('title'),
+                report_type=request.data.get('report_type'), user=user,
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'id': report.id,
+            'title': report.title,
+            'report_type': report.report_type,
+            'start_date': report.start_date,
+            'end_date': report.end_date,
+            'total_collected': report.total_collected,
+            'total_pending': report.total_pending,
+            'total_overdue': report.total_overdue,
+            'report_data': report.report_data,
+            'created_at': report.created_at
+        }, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['get'])
     def class_wise(self, request):
-        """Get class-wise fee collection report"""
+        """Get class-wise fee collection report for the school, optionally for fees due between start_date and end_date"""
         user = request.user
-        if user.role not in [user.UserRole.SUPER_ADMIN, user.UserRole.SCHOOL_ADMIN, user.UserRole.PRINCIPAL, user.UserRole.ACCOUNTANT]:
+        if user.role not in self.REPORT_ROLES:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
-        from classes.models import Class
-        
-        classes = Class.objects.all()
-        class_data = []
+        school_id = self.get_report_school_id(request)
+        if not school_id:
+            return Response({'error': 'school_id is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        for class_obj in classes:
-            students = class_obj.students.all()
-            total_students = students.count()
-            
-            if total_students == 0:
-                continue
-            
-            total_fees = StudentFee.objects.filter(
-                student__in=students
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            total_paid = Payment.objects.filter(
-                student_fee__student__in=students,
-                status='completed'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            pending_count = StudentFee.objects.filter(
-                student__in=students,
-                status='pending'
-            ).count()
-            
-            class_data.append({
-                'class_id': class_obj.id,
-                'class_name': f"{class_obj.name} - {class_obj.section}",
-                'total_students': total_students,
-                'total_fees': total_fees,
-                'total_paid': total_paid,
-                'pending_count': pending_count,
-                'collection_rate': (total_paid / total_fees * 100) if total_fees > 0 else 0
-            })
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        try:
+            if start_date and end_date:
+                start_date = timezone.datetime.strptime(start_date, '%Y-%m-%d').date()
+                end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d').date()
+            else:
+                start_date = end_date = None
+        except ValueError:
+            return Response({'error': 'Dates must be given as YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(class_data)
+        return Response(class_wise_report(school_id, start_date, end_date))
@@ -0,0 +1,245 @@
+"""
+Load-test harness for the School Management API and chat WebSockets.
+
+Drives a realistic mix of roles against accounts created by
+``python manage.py seed_load_data``:
+
+- Teachers mark bulk attendance for the classes they head
+- Students load their dashboards and profile
+- School admins page through students and fees
+- Chat clients hold a ``ws/chat/<room_id>/`` connection and measure
+  message round-trip latency
+
+Run the server with Daphne and the in-memory channel layer, then start Locust:
+
+    CHANNEL_LAYER=memory daphne -b 127.0.0.1 -p 8000 school_management.asgi:application
+    locust -f loadtest/locustfile.py --host http://127.0.0.1:8000 \\
+        --headless -u 500 -r 50 -t 5m --csv loadtest/results/run
+
+Locust reports requests/s and latency percentiles per endpoint; ``--csv``
+writes them to ``*_stats.csv`` for comparing runs.
+
+Environment variables:
+    LOADTEST_PREFIX               School code prefix used by seed_load_data (default LD)
+    LOADTEST_SCHOOLS              Number of seeded schools to spread users over (default 200)
+    LOADTEST_PASSWORD             Password of the seeded accounts (default loadtest123)
+    LOADTEST_STUDENTS_PER_SCHOOL  Highest student number to log in as per school (default 1000)
+    LOADTEST_TEACHERS_PER_SCHOOL  Highest teacher number to log in as per school (default 6)
+"""
+
+import json
+import os
+import random
+import time
+import uuid
+from urllib.parse import urlparse
+
+import gevent
+import websocket
+from locust import HttpUser, between, events, task
+
+
+PREFIX = os.environ.get('LOADTEST_PREFIX', 'LD')
+SCHOOLS = int(os.environ.get('LOADTEST_SCHOOLS', 200))
+PASSWORD = os.environ.get('LOADTEST_PASSWORD', 'loadtest123')
+STUDENTS_PER_SCHOOL = int(os.environ.get('LOADTEST_STUDENTS_PER_SCHOOL', 1000))
+TEACHERS_PER_SCHOOL = int(os.environ.get('LOADTEST_TEACHERS_PER_SCHOOL', 6))
+ATTENDANCE_STATUSES = ['present'] * 18 + ['absent', 'late']
+
+
+def seeded_username(tag, max_number):
+    """Pick a random account created by seed_load_data"""
+    school = random.randint(1, SCHOOLS)
+    number = random.randint(1, max_number)
+    return f'{PREFIX.lower()}-{school:04d}-{tag}{number:05d}'
+
+
+def results(response):
+    """Return the items of a paginated or plain list response"""
+    data = response.json()
+    if isinstance(data, dict):
+        return data.get('results', [])
+    return data
+
+
+class SchoolUser(HttpUser):
+    """Base user that logs in through LoginView and sends the JWT on every request"""
+    abstract = True
+    account_tag = None
+    max_account_number = 1
+
+    def on_start(self):
+        self.username = seeded_username(self.account_tag, self.max_account_number)
+        self.token = None
+        with self.client.post(
+            '/api/v1/auth/login/',
+            json={'username': self.username, 'password': PASSWORD},
+            name='auth: login',
+            catch_response=True,
+        ) as response:
+            if response.status_code != 200:
+                response.failure(f'{self.username}: {response.status_code}')
+                self.stop()
+                return
+            self.token = response.json()['access_token']
+        self.client.headers['Authorization'] = f'Bearer {self.token}'
+
+
+class TeacherUser(SchoolUser):
+    """Head teachers taking the morning roll call"""
+    weight = 2
+    wait_time = between(10, 30)
+    account_tag = 't'
+    max_account_number = TEACHERS_PER_SCHOOL
+
+    def on_start(self):
+        super().on_start()
+        self.rosters = {}
+        response = self.client.get('/api/v1/auth/teachers/', name='teachers: list own')
+        if response.status_code != 200:
+            return
+        for teacher in results(response):
+            for class_id in teacher.get('head_teacher_classes', []):
+                students = self.client.get(
+                    f'/api/v1/students/by_class/?class_id={class_id}',
+                    name='students: by_class',
+                )
+                if students.status_code == 200:
+                    self.rosters[class_id] = [student['id'] for student in results(students)]
+
+    @task
+    def bulk_mark_attendance(self):
+        if not self.rosters:
+            return
+        class_id, student_ids = random.choice(list(self.rosters.items()))
+        self.client.post('/api/v1/classes/attendance/bulk_mark/', json={
+            'class_id': class_id,
+            'date': time.strftime('%Y-%m-%d'),
+            'attendance_data': [
+                {'student_id': student_id, 'status': random.choice(ATTENDANCE_STATUSES)}
+                for student_id in student_ids
+            ],
+        }, name='attendance: bulk_mark')
+
+
+class StudentUser(SchoolUser):
+    """Students checking their dashboard between classes"""
+    weight = 10
+    wait_time = between(5, 20)
+    account_tag = 's'
+    max_account_number = STUDENTS_PER_SCHOOL
+
+    @task(3)
+    def dashboard(self):
+        self.client.get('/api/v1/auth/student/dashboard/', name='dashboard: student')
+
+    @task(1)
+    def my_profile(self):
+        self.client.get('/api/v1/students/my_profile/', name='students: my_profile')
+
+
+class AdminUser(SchoolUser):
+    """School admins browsing student and fee lists"""
+    weight = 1
+    wait_time = between(3, 10)
+    account_tag = 'a'
+    max_account_number = 1
+    page_size = 20
+
+    def on_start(self):
+        super().on_start()
+        self.page_counts = {}
+
+    def get_page(self, path, name):
+        """Fetch a random page of a list, learning the page count from earlier responses"""
+        page = random.randint(1, self.page_counts.get(path, 1))
+        separator = '&' if '?' in path else '?'
+        response = self.client.get(f'{path}{separator}page={page}', name=name)
+        if response.status_code == 200:
+            count = response.json().get('count', 0)
+            self.page_counts[path] = max(1, -(-count // self.page_size))
+
+    @task(3)
+    def list_students(self):
+        self.get_page('/api/v1/students/', 'students: list')
+
+    @task(2)
+    def list_fees(self):
+        self.get_page('/api/v1/fees/student-fees/?status=pending', 'fees: list pending')
+
+    @task(1)
+    def fee_summary(self):
+        self.client.get('/api/v1/fees/reports/summary/', name='fees: summary')
+
+    @task(1)
+    def dashboard(self):
+        self.client.get('/api/v1/auth/dashboard/', name='dashboard: school admin')
+
+
+class ChatUser(SchoolUser):
+    """Students holding an open class chat socket and posting occasionally"""
+    weight = 4
+    wait_time = between(10, 40)
+    account_tag = 's'
+    max_account_number = STUDENTS_PER_SCHOOL
+
+    def on_start(self):
+        super().on_start()
+        self.ws = None
+        self.pending = {}
+        response = self.client.get('/api/v1/chat/rooms/', name='chat: rooms')
+        rooms = results(response) if response.status_code == 200 else []
+        if not rooms:
+            return
+        self.room_id = random.choice(rooms)['id']
+        host = urlparse(self.host)
+        scheme = 'wss' if host.scheme == 'https' else 'ws'
+        url = f'{scheme}://{host.netloc}/ws/chat/{self.room_id}/?token={self.token}'
+        started = time.perf_counter()
+        try:
+            self.ws = websocket.create_connection(url, timeout=10)
+        except Exception as exc:
+            self.fire('ws: connect', started, exc)
+            return
+        self.fire('ws: connect', started)
+        self.receiver = gevent.spawn(self.receive_loop)
+
+    def on_stop(self):
+        if self.ws:
+            self.ws.close()
+            self.receiver.kill()
+
+    def fire(self, name, started, exception=None, length=0):
+        events.request.fire(
+            request_type='WS',
+            name=name,
+            response_time=(time.perf_counter() - started) * 1000,
+            response_length=length,
+            exception=exception,
+            context={},
+        )
+
+    def receive_loop(self):
+        while True:
+            try:
+                raw = self.ws.recv()
+            except Exception:
+                return
+            try:
+                message = json.loads(raw).get('message', '')
+            except ValueError:
+                continue
+            started = self.pending.pop(message, None)
+            if started is not None:
+                self.fire('ws: chat round trip', started, length=len(raw))
+
+    @task
+    def send_message(self):
+        if not self.ws:
+            return
+        message = f'load {uuid.uuid4().hex}'
+        self.pending[message] = time.perf_counter()
+        try:
+            self.ws.send(json.dumps({'message': message}))
+        except Exception as exc:
+            self.fire('ws: chat round trip', self.pending.pop(message), exc)
@@ -139,4 +139,27 @@ class EmailService:
             
         except Exception as e:
             logger.error(f"Failed to send expired notification: {str(e)}")
-            return False 
\ No newline at end of file
+            return False 
+
+class SmsService:
+    """Service for sending SMS notifications"""
+    
+    @staticmethod
+    def send_batch(messages):
+        """
+        Send SMS messages in one batch
+        
+        Args:
+            messages (list): (phone number, text) pairs
+        
+        Returns:
+            list: whether each message was accepted, in order
+        """
+        if not SystemSettings.sms_enabled():
+            logger.info(f"SMS batch of {len(messages)} skipped (SMS notifications are OFF)")
+            return [False] * len(messages)
+        # No SMS gateway is integrated yet: messages are only logged, so none
+        # is reported as sent and callers hand back quota and retry later
+        for phone, text in messages:
+            logger.info(f"SMS to {phone} not sent (no gateway): {text}")
+        return [False] * len(messages)
@@ -12,13 +12,16 @@ import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django.core.asgi import get_asgi_application
-import chat
-import school_management.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'school_management.settings')
 
+# Initialise Django before importing consumers, which import models
+django_asgi_app = get_asgi_application()
+
+import school_management.routing  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             school_management.routing.websocket_urlpatterns
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 import environ
 from pathlib import Path
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -135,14 +136,58 @@ DATABASE_ROUTERS = (
 # TENANT_DOMAIN_MODEL = "core.Domain"  # app.Model
 
 # Channels/Redis
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            'hosts': [(env('REDIS_HOST', default='127.0.0.1'), 6379)],
+# Set CHANNEL_LAYER=memory to run a single Daphne process without Redis (e.g. load testing)
+if env('CHANNEL_LAYER', default='redis') == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [(env('REDIS_HOST', default='127.0.0.1'), 6379)],
+            },
+        },
+    }
+
+# Cache
+# Defaults to per-process local memory; set CACHE_REDIS_URL to share the cache between workers
+if env('CACHE_REDIS_URL', default=''):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env('CACHE_REDIS_URL'),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# Minimum seconds between session expiry refreshes / last-seen writes per session or user
+SESSION_STATE_REFRESH_INTERVAL = env.int('SESSION_STATE_REFRESH_INTERVAL', default=60)
+
+# Seconds a school's login subscription check is cached (cleared when a subscription changes)
+SUBSCRIPTION_GATE_CACHE_TIMEOUT = env.int('SUBSCRIPTION_GATE_CACHE_TIMEOUT', default=300)
+
+# Seconds a user's resolved visibility scope (core.scope) is cached
+USER_SCOPE_CACHE_TIMEOUT = env.int('USER_SCOPE_CACHE_TIMEOUT', default=600)
+
+# Seconds a process trusts its timetable conflict index (classes.timetable) before rebuilding it
+TIMETABLE_INDEX_MAX_AGE = env.int('TIMETABLE_INDEX_MAX_AGE', default=60)
+
+# Seconds a school's fee report (fees.reports) is cached (cleared when its fees or payments change)
+FEE_REPORT_CACHE_TIMEOUT = env.int('FEE_REPORT_CACHE_TIMEOUT', default=600)
+
+# User activity log: rows are buffered in-process and written in batches
+USER_ACTIVITY_BUFFERED = env.bool('USER_ACTIVITY_BUFFERED', default=True)
+USER_ACTIVITY_BATCH_SIZE = env.int('USER_ACTIVITY_BATCH_SIZE', default=500)
+USER_ACTIVITY_FLUSH_INTERVAL = env.float('USER_ACTIVITY_FLUSH_INTERVAL', default=1.0)  # seconds
 
 # Celery
 CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
@@ -157,6 +202,41 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': 60 * 60 * 24,  # every 24 hours
         'options': {'expires': 60 * 60 * 2},  # expires in 2 hours
     },
+    'purge-user-activity-daily': {
+        'task': 'users.tasks.purge_user_activity',
+        'schedule': 60 * 60 * 24,  # every 24 hours
+        'options': {'expires': 60 * 60 * 2},
+    },
+    'reconcile-school-stats-hourly': {
+        'task': 'schools.tasks.reconcile_school_stats',
+        'schedule': 60 * 60,  # every hour
+        'options': {'expires': 60 * 30},
+    },
+    'analyze-attendance-patterns-nightly': {
+        'task': 'classes.tasks.analyze_attendance_patterns',
+        'schedule': crontab(hour=2, minute=0),
+        'options': {'expires': 60 * 60 * 4},
+    },
+    'reconcile-finance-rollups-nightly': {
+        'task': 'fees.tasks.reconcile_finance_rollups',
+        'schedule': crontab(hour=3, minute=0),
+        'options': {'expires': 60 * 60 * 4},
+    },
+    'mark-overdue-fees-hourly': {
+        'task': 'fees.tasks.mark_overdue_fees',
+        'schedule': crontab(minute=15),
+        'options': {'expires': 60 * 30},
+    },
+    'send-fee-reminders-daily': {
+        'task': 'fees.tasks.send_daily_fee_reminders',
+        'schedule': crontab(hour=8, minute=0),
+        'options': {'expires': 60 * 60 * 4},
+    },
+    'bill-fees-monthly': {
+        'task': 'fees.tasks.run_monthly_billing',
+        'schedule': crontab(day_of_month=1, hour=1, minute=0),
+        'options': {'expires': 60 * 60 * 12},
+    },
 }
 
 # CORS
@@ -166,7 +246,7 @@ CORS_ALLOW_CREDENTIALS = True
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.StatefulJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'core.permissions.SubscriptionAccessPermission',
@@ -181,6 +261,8 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
+    # Rotated refresh tokens are revoked through core.session_state (cache-backed),
+    # not the token_blacklist app
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
@@ -207,6 +289,19 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Password hashing
+# FAST_STUDENT_PASSWORD_HASHER hashes auto-generated student passwords with fewer PBKDF2
+# iterations; existing hashes are converted either way on the user's next login.
+FAST_STUDENT_PASSWORD_HASHER = env.bool('FAST_STUDENT_PASSWORD_HASHER', default=False)
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'users.hashers.StudentPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import School, SubscriptionPlan, Subscription, SchoolCommunicationUsage
+from .models import School, SubscriptionPlan, Subscription, SchoolCommunicationUsage, SchoolStats
 
 # Register your models here.
 admin.site.register(School)
 admin.site.register(SubscriptionPlan)
 admin.site.register(Subscription)
 admin.site.register(SchoolCommunicationUsage)
+admin.site.register(SchoolStats)
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-19 01:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schools', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchoolStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_students', models.IntegerField(default=0)),
+                ('total_teachers', models.IntegerField(default=0)),
+                ('total_classes', models.IntegerField(default=0)),
+                ('attendance_total', models.IntegerField(default=0)),
+                ('attendance_present', models.IntegerField(default=0)),
+                ('fees_billed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('fees_collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('students_with_pending_fees', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+                ('school', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='schools.school')),
+            ],
+            options={
+                'verbose_name_plural': 'School stats',
+            },
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.db.models.signals import post_save, post_delete
@@ -257,9 +259,37 @@ class Subscription(models.Model):
             return self.Status.EXPIRED
         return self.status
 
+    @staticmethod
+    def login_gate_cache_key(school_id):
+        return f'subscription_login_gate:{school_id}'
+
+    @classmethod
+    def login_gate(cls, school_id):
+        """
+        Return CANCELLED or EXPIRED if users of the school must be refused at
+        login, otherwise None. Cached per school for SUBSCRIPTION_GATE_CACHE_TIMEOUT
+        seconds and cleared whenever one of its subscriptions changes.
+        """
+        key = cls.login_gate_cache_key(school_id)
+        gate = cache.get(key)
+        if gate is None:
+            subscription = cls.objects.filter(school_id=school_id, status=cls.Status.ACTIVE).first()
+            if not subscription:
+                # No active subscription, check for most recent expired or cancelled subscription
+                subscription = cls.objects.filter(
+                    school_id=school_id,
+                    status__in=[cls.Status.EXPIRED, cls.Status.CANCELLED],
+                ).order_by('-end_date').first()
+            status = subscription.computed_status if subscription else None
+            # PENDING and ACTIVE allow login (read-only is enforced by middleware)
+            gate = status if status in (cls.Status.CANCELLED, cls.Status.EXPIRED) else ''
+            cache.set(key, gate, settings.SUBSCRIPTION_GATE_CACHE_TIMEOUT)
+        return gate or None
+
 # Signal handlers for Subscription
 @receiver(post_save, sender=Subscription)
 def subscription_post_save(sender, instance, created, **kwargs):
+    cache.delete(Subscription.login_gate_cache_key(instance.school_id))
     school = instance.school
     # Get all school admin users for this school
     admin_emails = list(User.objects.filter(school=school, role=User.UserRole.SCHOOL_ADMIN).values_list('email', flat=True))
@@ -288,6 +318,7 @@ def subscription_post_save(sender, instance, created, **kwargs):
 
 @receiver(post_delete, sender=Subscription)
 def subscription_post_delete(sender, instance, **kwargs):
+    cache.delete(Subscription.login_gate_cache_key(instance.school_id))
     school = instance.school
     admin_emails = list(User.objects.filter(school=school, role=User.UserRole.SCHOOL_ADMIN).values_list('email', flat=True))
     recipient_emails = set(email for email in admin_emails + [school.email, school.principal_email] if email)
@@ -322,3 +353,52 @@ class SchoolCommunicationUsage(models.Model):
 
     def __str__(self):
         return f"{self.school.name} {self.year}-{self.month:02d} (E:{self.emails_sent}, S:{self.sms_sent})"
+
+
+class SchoolStats(models.Model):
+    """Per-school counters kept current by schools.stats; read instead of recounting"""
+    school = models.OneToOneField(School, on_delete=models.CASCADE, related_name='stats')
+    total_students = models.IntegerField(default=0)
+    total_teachers = models.IntegerField(default=0)
+    total_classes = models.IntegerField(default=0)
+    attendance_total = models.IntegerField(default=0)
+    attendance_present = models.IntegerField(default=0)  # present or late
+    fees_billed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    fees_collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    students_with_pending_fees = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'School stats'
+
+    def __str__(self):
+        return f"{self.school.name} stats"
+
+    @classmethod
+    def for_school(cls, school_id):
+        """Return the school's row, building it on first use"""
+        if school_id is None:
+            return cls()
+        stats = cls.objects.filter(school_id=school_id).first()
+        if stats is None:
+            from .stats import rebuild_school_stats
+            rebuild_school_stats([school_id])
+            stats = cls.objects.get(school_id=school_id)
+        return stats
+
+    @property
+    def attendance_rate(self):
+        if not self.attendance_total:
+            return 0
+        return round(self.attendance_present * 100 / self.attendance_total, 1)
+
+    @property
+    def fees_pending(self):
+        return max(self.fees_billed - self.fees_collected, 0)
+
+    @property
+    def collection_rate(self):
+        if not self.fees_billed:
+            return 0
+        return round(float(self.fees_collected * 100 / self.fees_billed), 1)
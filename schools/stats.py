@@ -0,0 +1,237 @@
+"""
+Incremental maintenance of the SchoolStats rollup.
+
+Every tracked row contributes a small set of deltas to its school's counters
+(a student adds one to total_students, a completed payment adds its amount to
+fees_collected, ...). On save the row's old contribution is subtracted and the
+new one added; on delete the contribution is subtracted. Deltas are applied
+with a single ``F()`` UPDATE after the transaction commits, so rolled back
+writes never reach the rollup. Bulk write paths that bypass signals pass
+their deltas to apply_deltas themselves; anything else (queryset.update, raw
+SQL) is caught up by rebuild_school_stats, which the reconcile_school_stats
+task runs periodically.
+"""
+
+import threading
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+STAT_FIELDS = [
+    'total_students', 'total_teachers', 'total_classes', 'attendance_total', 'attendance_present',
+    'fees_billed', 'fees_collected', 'students_with_pending_fees',
+]
+PRESENT_STATUSES = ['present', 'late']
+UNPAID_STATUSES = ['pending', 'partial', 'overdue']
+
+# Per thread, hence per database connection: a sequence number for each queued delta
+# and, per school, the last number queued before its row was rebuilt
+_queued = threading.local()
+
+
+def _school_id_of(model, pk, path):
+    return model.objects.filter(pk=pk).values_list(path, flat=True).first()
+
+
+def _amount(value):
+    return Decimal(str(value or 0))
+
+
+def _student_contribution(student):
+    return student.school_id, {'total_students': 1}
+
+
+def _user_contribution(user):
+    return user.school_id, {'total_teachers': 1 if user.role == 'teacher' else 0}
+
+
+def _class_contribution(class_obj):
+    return class_obj.school_id, {'total_classes': 1}
+
+
+def _attendance_contribution(attendance):
+    from classes.models import Class
+    return _school_id_of(Class, attendance.class_obj_id, 'school_id'), {
+        'attendance_total': 1,
+        'attendance_present': 1 if attendance.status in PRESENT_STATUSES else 0,
+    }
+
+
+def _student_fee_contribution(fee):
+    from students.models import Student
+    # A waived fee is no longer owed, so it leaves billed (and the pending figure derived from it)
+    billed = Decimal(0) if fee.status == 'waived' else _amount(fee.amount)
+    return _school_id_of(Student, fee.student_id, 'school_id'), {'fees_billed': billed}
+
+
+def _payment_contribution(payment):
+    from fees.models import StudentFee
+    return _school_id_of(StudentFee, payment.student_fee_id, 'student__school_id'), {
+        'fees_collected': _amount(payment.amount) if payment.status == 'completed' else Decimal(0),
+    }
+
+
+# model label -> (fields the contribution depends on, contribution function)
+TRACKED = {
+    'students.Student': (['school'], _student_contribution),
+    'users.User': (['school', 'role'], _user_contribution),
+    'classes.Class': (['school'], _class_contribution),
+    'classes.Attendance': (['class_obj', 'status'], _attendance_contribution),
+    'fees.StudentFee': (['student', 'amount', 'status'], _student_fee_contribution),
+    'fees.Payment': (['student_fee', 'amount', 'status'], _payment_contribution),
+}
+
+
+def _touches_tracked_fields(fields, update_fields):
+    if update_fields is None:
+        return True
+    names = set(update_fields)
+    return any(field in names or f'{field}_id' in names for field in fields)
+
+
+def remember_old_contribution(instance, update_fields=None):
+    """pre_save: record what an existing row contributed before this save"""
+    fields, contribution = TRACKED[instance._meta.label]
+    if instance._state.adding or not _touches_tracked_fields(fields, update_fields):
+        instance._school_stats_old = None
+        return
+    old = type(instance)._default_manager.filter(pk=instance.pk).first()
+    instance._school_stats_old = contribution(old) if old else None
+
+
+def record_save(instance, created, update_fields=None):
+    """post_save: apply the difference between the new and old contribution"""
+    fields, contribution = TRACKED[instance._meta.label]
+    old = instance.__dict__.pop('_school_stats_old', None)
+    if not created and old is None:
+        # Untracked fields changed, or the old row was not looked up
+        return
+    new = contribution(instance)
+    if old is not None:
+        apply_deltas(old[0], old[1], -1)
+    apply_deltas(new[0], new[1], 1)
+    if instance._meta.label == 'fees.StudentFee':
+        refresh_pending_students(new[0], old[0] if old else None)
+
+
+def record_delete(instance):
+    """post_delete: remove the row's contribution"""
+    school_id, deltas = TRACKED[instance._meta.label][1](instance)
+    apply_deltas(school_id, deltas, -1)
+    if instance._meta.label == 'fees.StudentFee':
+        refresh_pending_students(school_id)
+
+
+def apply_deltas(school_id, deltas, sign=1):
+    """Add (or with sign=-1 subtract) counter deltas to a school's row once the transaction commits"""
+    deltas = {field: value * sign for field, value in deltas.items() if value}
+    if school_id is None or not deltas:
+        return
+    _queued.seq = sequence = getattr(_queued, 'seq', 0) + 1
+    transaction.on_commit(lambda: _apply_now(school_id, deltas, sequence))
+
+
+def _apply_now(school_id, deltas, sequence):
+    from .models import SchoolStats
+    if sequence <= _rebuilt_through().get(school_id, 0):
+        # Queued before a rebuild of the school on this connection, which already counted it
+        return
+    updated = SchoolStats.objects.filter(school_id=school_id).update(
+        updated_at=timezone.now(),
+        **{field: F(field) + value for field, value in deltas.items()},
+    )
+    if not updated:
+        # No row yet: build it from scratch, which already includes this change and the rest of its transaction
+        rebuild_school_stats([school_id])
+
+
+def _rebuilt_through():
+    if not hasattr(_queued, 'rebuilt'):
+        _queued.rebuilt = {}
+    return _queued.rebuilt
+
+
+def _mark_rebuilt(school_ids):
+    """
+    Record that the schools were just rebuilt, so deltas this thread queued
+    before now are skipped when their on_commit callbacks run: the rebuild
+    read every committed row and this connection's own uncommitted ones, so
+    it already includes them. Deltas from other threads are not affected.
+    """
+    rebuilt, sequence = _rebuilt_through(), getattr(_queued, 'seq', 0)
+    for school_id in school_ids:
+        rebuilt[school_id] = sequence
+
+
+def refresh_pending_students(*school_ids):
+    """Recount students_with_pending_fees once the transaction commits; a distinct count has no delta"""
+    for school_id in {school_id for school_id in school_ids if school_id is not None}:
+        transaction.on_commit(lambda school_id=school_id: _recount_pending_students(school_id))
+
+
+def _recount_pending_students(school_id):
+    from fees.models import StudentFee
+    from .models import SchoolStats
+    count = StudentFee.objects.filter(
+        student__school_id=school_id, status__in=UNPAID_STATUSES,
+    ).values('student_id').distinct().count()
+    SchoolStats.objects.filter(school_id=school_id).update(students_with_pending_fees=count, updated_at=timezone.now())
+
+
+def rebuild_school_stats(school_ids=None):
+    """Recompute the rollup rows of the given schools (all schools by default) from source tables"""
+    from classes.models import Attendance, Class
+    from fees.models import Payment, StudentFee
+    from students.models import Student
+    from users.models import User
+    from .models import School, SchoolStats
+
+    schools = School.objects.all() if school_ids is None else School.objects.filter(id__in=school_ids)
+    ids = list(schools.values_list('id', flat=True))
+    if not ids:
+        return 0
+
+    def grouped(queryset, key, **aggregates):
+        if school_ids is not None:
+            queryset = queryset.filter(**{f'{key}__in': ids})
+        return {row.pop(key): row for row in queryset.values(key).annotate(**aggregates).order_by()}
+
+    students = grouped(Student.objects, 'school_id', count=Count('id'))
+    teachers = grouped(User.objects.filter(role='teacher'), 'school_id', count=Count('id'))
+    classes = grouped(Class.objects, 'school_id', count=Count('id'))
+    attendance = grouped(
+        Attendance.objects, 'class_obj__school_id',
+        total=Count('id'), present=Count('id', filter=Q(status__in=PRESENT_STATUSES)),
+    )
+    fees = grouped(
+        StudentFee.objects, 'student__school_id',
+        billed=Sum('amount', filter=~Q(status='waived')), pending_students=Count('student', distinct=True, filter=Q(status__in=UNPAID_STATUSES)),
+    )
+    payments = grouped(Payment.objects.filter(status='completed'), 'student_fee__student__school_id', collected=Sum('amount'))
+
+    now = timezone.now()
+    empty = {}
+    rows = [
+        SchoolStats(
+            school_id=school_id,
+            total_students=students.get(school_id, empty).get('count', 0),
+            total_teachers=teachers.get(school_id, empty).get('count', 0),
+            total_classes=classes.get(school_id, empty).get('count', 0),
+            attendance_total=attendance.get(school_id, empty).get('total', 0),
+            attendance_present=attendance.get(school_id, empty).get('present', 0),
+            fees_billed=fees.get(school_id, empty).get('billed') or 0,
+            fees_collected=payments.get(school_id, empty).get('collected') or 0,
+            students_with_pending_fees=fees.get(school_id, empty).get('pending_students', 0),
+            updated_at=now,
+            reconciled_at=now,
+        )
+        for school_id in ids
+    ]
+    SchoolStats.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['school'],
+        update_fields=STAT_FIELDS + ['updated_at', 'reconciled_at'],
+    )
+    _mark_rebuilt(ids)
+    return len(rows)
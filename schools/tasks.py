@@ -0,0 +1,10 @@
+from celery import shared_task
+
+from .stats import rebuild_school_stats
+
+
+@shared_task
+def reconcile_school_stats():
+    """Rebuild every SchoolStats row from source tables to correct any drift"""
+    count = rebuild_school_stats()
+    return f'Reconciled stats for {count} schools.'
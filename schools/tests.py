@@ -1,3 +1,91 @@
+from datetime import date
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from classes.models import Attendance, Class
+from fees.models import Payment, StudentFee
+from students.models import Student
+from users.models import User
+from .models import School, SchoolStats
+from .stats import STAT_FIELDS, rebuild_school_stats
+
+
+class SchoolStatsTests(TestCase):
+    """Incrementally maintained SchoolStats agree with a rebuild from source tables"""
+
+    def setUp(self):
+        self.school = School.objects.create(
+            name='Stats School', code='STS', address='1 Main St', phone='555-0100', email='office@stats.test',
+            principal_name='Pat Principal', principal_email='principal@stats.test', principal_phone='555-0101',
+        )
+        rebuild_school_stats([self.school.id])
+
+    def current(self):
+        stats = SchoolStats.objects.get(school=self.school)
+        return {field: getattr(stats, field) for field in STAT_FIELDS}
+
+    def test_signals_keep_counters_in_step_with_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('stats-teacher', role=User.UserRole.TEACHER, school=self.school)
+            class_obj = Class.objects.create(school=self.school, name='Grade 1', academic_year='2024-2025')
+            student = Student.objects.create(
+                user=User.objects.create_user('stats-student', role=User.UserRole.STUDENT, school=self.school),
+                school=self.school, current_class=class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            attendance = Attendance.objects.create(student=student, class_obj=class_obj, date=date(2024, 9, 1))
+            Attendance.objects.create(student=student, class_obj=class_obj, date=date(2024, 9, 2), status='absent')
+            fee = StudentFee.objects.create(
+                student=student, due_date=date(2024, 9, 1), amount=Decimal('100.00'), status=StudentFee.Status.PARTIAL,
+            )
+            payment = Payment.objects.create(student_fee=fee, amount=Decimal('40.00'), receipt_number='STS-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            attendance.status = 'absent'
+            attendance.save()
+            payment.status = Payment.Status.COMPLETED
+            payment.save()
+
+        stats = SchoolStats.objects.get(school=self.school)
+        self.assertEqual(
+            (stats.total_students, stats.total_teachers, stats.total_classes), (1, 1, 1),
+        )
+        self.assertEqual((stats.attendance_total, stats.attendance_present), (2, 0))
+        self.assertEqual((stats.fees_billed, stats.fees_collected, stats.fees_pending), (100, 40, 60))
+        self.assertEqual(stats.students_with_pending_fees, 1)
+
+        incremental = self.current()
+        rebuild_school_stats([self.school.id])
+        self.assertEqual(incremental, self.current())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.delete()
+            attendance.delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.attendance_total, stats.fees_collected), (1, 0))
+
+        # A waived fee leaves billed, and so the pending figure
+        with self.captureOnCommitCallbacks(execute=True):
+            fee.status = StudentFee.Status.WAIVED
+            fee.save()
+        stats.refresh_from_db()
+        self.assertEqual((stats.fees_billed, stats.fees_pending), (0, 0))
+        incremental = self.current()
+        rebuild_school_stats([self.school.id])
+        self.assertEqual(incremental, self.current())
+
+    def test_first_row_is_not_double_counted(self):
+        SchoolStats.objects.filter(school=self.school).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ('first-teacher', 'second-teacher'):
+                User.objects.create_user(name, role=User.UserRole.TEACHER, school=self.school)
+            Class.objects.create(school=self.school, name='Grade 1', academic_year='2024-2025')
+        self.assertEqual((self.current()['total_teachers'], self.current()['total_classes']), (2, 1))
+
+        # A row built mid-transaction already sees the transaction's own writes
+        with self.captureOnCommitCallbacks(execute=True):
+            Class.objects.create(school=self.school, name='Grade 2', academic_year='2024-2025')
+            SchoolStats.objects.filter(school=self.school).delete()
+            SchoolStats.for_school(self.school.id)
+            Class.objects.create(school=self.school, name='Grade 3', academic_year='2024-2025')
+        self.assertEqual(self.current()['total_classes'], 3)
@@ -46,23 +46,20 @@ class SchoolViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Get subscription statistics
+        # Subscription statistics in one conditional aggregate
+        today = timezone.now().date()
+        active = Q(status='active')
+        subscriptions = Subscription.objects.aggregate(
+            active=Count('id', filter=active),
+            expiring_soon=Count('id', filter=active & Q(end_date__gt=today, end_date__lte=today + timezone.timedelta(days=30))),
+            expired=Count('id', filter=active & Q(end_date__lt=today)),
+            revenue=Sum('amount', filter=active),
+        )
         total_schools = School.objects.count()
-        active_subscriptions = Subscription.objects.filter(status='active').count()
-        expiring_soon = Subscription.objects.filter(
-            status='active',
-            end_date__lte=timezone.now().date() + timezone.timedelta(days=30),
-            end_date__gt=timezone.now().date()
-        ).count()
-        expired_subscriptions = Subscription.objects.filter(
-            status='active',
-            end_date__lt=timezone.now().date()
-        ).count()
-        
-        # Calculate revenue
-        total_revenue = Subscription.objects.filter(
-            status='active'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        active_subscriptions = subscriptions['active']
+        expiring_soon = subscriptions['expiring_soon']
+        expired_subscriptions = subscriptions['expired']
+        total_revenue = subscriptions['revenue'] or 0
         
         stats = {
             'total_schools': total_schools,
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Case, CharField, Exists, OuterRef, Q, Value, When
+from django.utils import timezone
 from users.models import User
 from schools.models import School
 from classes.models import Class
@@ -6,6 +8,28 @@ import secrets
 import string
 
 
+class StudentQuerySet(models.QuerySet):
+    def with_payment_status(self, today=None):
+        """
+        Annotate payment_status: 'paid' with a current scholarship or no unpaid
+        fees, else 'pending'. Both checks are EXISTS subqueries on the row.
+        """
+        from fees.models import Scholarship, StudentFee
+        from schools.stats import UNPAID_STATUSES
+        today = today or timezone.localdate()
+        scholarship = Scholarship.objects.filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=today),
+            student=OuterRef('pk'), is_active=True, start_date__lte=today,
+        )
+        unpaid = StudentFee.objects.filter(student=OuterRef('pk'), status__in=UNPAID_STATUSES)
+        return self.annotate(payment_status=Case(
+            When(Exists(scholarship), then=Value('paid')),
+            When(Exists(unpaid), then=Value('pending')),
+            default=Value('paid'),
+            output_field=CharField(),
+        ))
+
+
 class Student(models.Model):
     """Student model"""
     GENDER_CHOICES = [
@@ -48,6 +72,8 @@ class Student(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = StudentQuerySet.as_manager()
+    
     class Meta:
         ordering = ['user__first_name', 'user__last_name']
     
@@ -121,15 +147,16 @@ class Student(models.Model):
             password = self.generate_password()
             
             # Create user
-            user = User.objects.create_user(
+            user = User(
                 username=username,
                 email=self.user.email if hasattr(self, 'user') and self.user else f"{username}@school.com",
-                password=password,
                 first_name=self.user.first_name if hasattr(self, 'user') and self.user else '',
                 last_name=self.user.last_name if hasattr(self, 'user') and self.user else '',
                 role='student',
                 school=self.school
             )
+            user.set_password(password)
+            user.save()
             
             self.user = user
             self.save()
@@ -1,7 +1,24 @@
 from rest_framework import serializers
 from .models import Student
 from users.serializers import UserSerializer
-from classes.serializers import ClassSerializer
+from classes.serializers import ClassSerializer, with_class_counts
+
+
+def with_serializer_relations(queryset):
+    """Annotate and load everything StudentSerializer and StudentListSerializer read, at a fixed query count"""
+    return queryset.with_payment_status().select_related('user__school').prefetch_related(
+        with_class_counts('current_class'),
+    )
+
+
+def payment_status_of(student):
+    """The payment_status annotation, looked up for students loaded without it"""
+    status = getattr(student, 'payment_status', None)
+    if status is None:
+        status = Student.objects.with_payment_status().filter(pk=student.pk).values_list(
+            'payment_status', flat=True,
+        ).first()
+    return status
 
 
 class StudentCreateSerializer(serializers.ModelSerializer):
@@ -76,24 +93,7 @@ class StudentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
     def get_payment_status(self, obj):
-        from fees.models import StudentFee, Scholarship
-        from django.utils import timezone
-        today = timezone.now().date()
-        # Check if student is a scholar and has an active scholarship
-        active_scholarship = obj.scholarships.filter(is_active=True, start_date__lte=today).order_by('-start_date').first()
-        if active_scholarship:
-            # If scholarship has end_date, check if still valid
-            if active_scholarship.end_date and active_scholarship.end_date < today:
-                pass  # Expired
-            else:
-                return 'paid'
-        # Otherwise, check student fees
-        fees = StudentFee.objects.filter(student=obj)
-        if not fees.exists():
-            return 'paid'  # No fees = paid
-        if fees.filter(status__in=['pending', 'partial', 'overdue']).exists():
-            return 'pending'
-        return 'paid'
+        return payment_status_of(obj)
 
 
 class StudentListSerializer(serializers.ModelSerializer):
@@ -114,18 +114,4 @@ class StudentListSerializer(serializers.ModelSerializer):
         ] 
     
     def get_payment_status(self, obj):
-        from fees.models import StudentFee, Scholarship
-        from django.utils import timezone
-        today = timezone.now().date()
-        active_scholarship = obj.scholarships.filter(is_active=True, start_date__lte=today).order_by('-start_date').first()
-        if active_scholarship:
-            if active_scholarship.end_date and active_scholarship.end_date < today:
-                pass
-            else:
-                return 'paid'
-        fees = StudentFee.objects.filter(student=obj)
-        if not fees.exists():
-            return 'paid'
-        if fees.filter(status__in=['pending', 'partial', 'overdue']).exists():
-            return 'pending'
-        return 'paid' 
\ No newline at end of file
+        return payment_status_of(obj)
@@ -1,3 +1,60 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
 from django.test import TestCase
+from django.utils import timezone
+
+from classes.models import Class
+from fees.models import Scholarship, StudentFee
+from schools.models import School
+from users.models import User
+from .models import Student
+from .serializers import StudentListSerializer, with_serializer_relations
+
+
+class StudentPaymentStatusTests(TestCase):
+    """payment_status is annotated, so a page of students costs a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Status School', code='PST', address='1 Main St', phone='555-0100', email='office@pst.test',
+            principal_name='Pat Principal', principal_email='principal@pst.test', principal_phone='555-0101',
+        )
+        cls.class_obj = Class.objects.create(school=cls.school, name='Grade 1', academic_year='2024-2025')
+
+    def make_students(self, count, prefix):
+        return [
+            Student.objects.create(
+                user=User.objects.create_user(f'{prefix}-{i}', first_name=f'{prefix}{i:02}', role=User.UserRole.STUDENT,
+                                              school=self.school),
+                school=self.school, current_class=self.class_obj, date_of_birth=date(2010, 1, 1),
+                gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+            )
+            for i in range(count)
+        ]
+
+    def serialize(self):
+        return StudentListSerializer(with_serializer_relations(Student.objects.order_by('user__first_name')), many=True).data
+
+    def test_statuses_and_constant_queries(self):
+        today = timezone.localdate()
+        no_fees, unpaid, paid, scholar, expired = self.make_students(5, 'a')
+        for student, fee_status in [(unpaid, 'overdue'), (paid, 'paid'), (scholar, 'pending'), (expired, 'partial')]:
+            StudentFee.objects.create(student=student, due_date=today, amount=Decimal('50.00'), status=fee_status)
+        Scholarship.objects.create(student=scholar, name='Merit', percentage=100, start_date=today)
+        Scholarship.objects.create(
+            student=expired, name='Old', percentage=100,
+            start_date=today - timedelta(days=60), end_date=today - timedelta(days=1),
+        )
+
+        with self.assertNumQueries(2):
+            data = self.serialize()
+        self.assertEqual([row['payment_status'] for row in data], ['paid', 'pending', 'paid', 'paid', 'pending'])
+
+        self.make_students(15, 'b')
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.serialize()), 20)
 
-# Create your tests here.
+        # Instances loaded without the annotation still get a status
+        self.assertEqual(StudentListSerializer(Student.objects.get(pk=unpaid.pk)).data['payment_status'], 'pending')
@@ -4,9 +4,10 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db.models import Q
 from .models import Student
-from .serializers import StudentSerializer, StudentListSerializer, StudentCreateSerializer
+from .serializers import StudentSerializer, StudentListSerializer, StudentCreateSerializer, with_serializer_relations
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from classes.models import Class
+from core.scope import UserScope
 from rest_framework import filters
 from django.contrib.auth.password_validation import validate_password
 import re
@@ -29,22 +30,16 @@ class StudentViewSet(viewsets.ModelViewSet):
             queryset = Student.objects.all()
         elif user.role in ['school_admin', 'secretary']:
             queryset = Student.objects.filter(school=user.school)
-        elif user.role == 'teacher':
-            queryset = Student.objects.filter(
-                current_class__teachers=user,
-                school=user.school
-            )
-        elif user.role == 'student':
-            queryset = Student.objects.filter(user=user)
-        elif user.role == 'parent':
-            queryset = Student.objects.none()
+        elif user.role in ['teacher', 'student', 'parent']:
+            # Students in the teacher's classes, the student themself, or the parent's children
+            queryset = Student.objects.filter(id__in=UserScope.for_user(user).student_ids)
         else:
             queryset = Student.objects.none()
         # Add academic_year alias filter
         academic_year = self.request.query_params.get('academic_year')
         if academic_year:
             queryset = queryset.filter(current_class__academic_year=academic_year)
-        return queryset
+        return with_serializer_relations(queryset)
     
     def get_serializer_class(self):
         """Return appropriate serializer based on action"""
@@ -164,16 +159,17 @@ class StudentViewSet(viewsets.ModelViewSet):
         username = temp_student.generate_username()
         password = temp_student.generate_password()
 
-        # Create the user
-        student_user = User.objects.create_user(
+        # Create the user (set_password picks the student hasher when enabled)
+        student_user = User(
             username=username,
-            email=email,
-            password=password,
+            email=User.objects.normalize_email(email),
             first_name=first_name,
             last_name=last_name,
             role='student',
             school=user.school
         )
+        student_user.set_password(password)
+        student_user.save()
 
         # Now create the student, linking to the user
         student = Student.objects.create(
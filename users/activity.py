@@ -0,0 +1,99 @@
+"""
+Buffered writer for UserActivity rows.
+
+Hot paths such as login call log_activity(), which only appends the row to an
+in-process buffer. A daemon thread writes the buffer with one bulk_create every
+USER_ACTIVITY_FLUSH_INTERVAL seconds, or as soon as USER_ACTIVITY_BATCH_SIZE
+rows are waiting, so a burst of logins costs one INSERT per batch instead of
+one per request. Set USER_ACTIVITY_BUFFERED=False to write rows synchronously.
+"""
+
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import UserActivity
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityWriter:
+    """Collects UserActivity instances and flushes them from a background thread"""
+
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def add(self, activity):
+        with self._lock:
+            self._ensure_thread()
+            self._buffer.append(activity)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of rows written"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            UserActivity.objects.bulk_create(rows, batch_size=self.batch_size)
+        except Exception:
+            logger.exception('Dropped %d user activity rows', len(rows))
+            return 0
+        return len(rows)
+
+    def _ensure_thread(self):
+        # Restart the thread in forked workers, which inherit the buffer but not the thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._buffer = []
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='user-activity-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # The thread owns its own connection; don't hold it open between flushes
+                connection.close()
+
+
+writer = ActivityWriter(
+    batch_size=settings.USER_ACTIVITY_BATCH_SIZE,
+    flush_interval=settings.USER_ACTIVITY_FLUSH_INTERVAL,
+)
+atexit.register(writer.flush)
+
+
+def log_activity(user, action, request=None, details=None):
+    """Record a UserActivity row for user, buffered unless USER_ACTIVITY_BUFFERED is off"""
+    activity = UserActivity(
+        user=user,
+        action=action,
+        details=details or {},
+        ip_address=request.META.get('REMOTE_ADDR') if request else None,
+        user_agent=request.META.get('HTTP_USER_AGENT', '') if request else '',
+        created_at=timezone.now(),
+    )
+    if settings.USER_ACTIVITY_BUFFERED:
+        writer.add(activity)
+    else:
+        activity.save()
+    return activity
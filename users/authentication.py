@@ -0,0 +1,21 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from core import session_state
+
+
+class StatefulJWTAuthentication(JWTAuthentication):
+    """JWT authentication that rejects revoked tokens and records last-seen times"""
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            session_state.touch_last_seen(result[0].pk)
+        return result
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if session_state.is_token_revoked(token):
+            raise InvalidToken(_('Token has been revoked'))
+        return token
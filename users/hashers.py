@@ -0,0 +1,15 @@
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class StudentPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with a reduced work factor for auto-generated student accounts.
+
+    Student passwords are random and issued by the school, so they do not need
+    the full default iteration count. This keeps the morning login rush from
+    being bound by password hashing. Enabled with FAST_STUDENT_PASSWORD_HASHER;
+    accounts are moved between this hasher and the default one on their next
+    successful login (see User.check_password).
+    """
+    algorithm = 'pbkdf2_sha256_student'
+    iterations = 60000
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-19 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_useractivity_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'created_at'], name='users_usera_user_id_63b4df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['created_at'], name='users_usera_created_828ca1_idx'),
+        ),
+    ]
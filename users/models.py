@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.hashers import check_password, make_password
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -63,6 +66,31 @@ class User(AbstractUser):
         }
         return role_dashboards.get(self.role, '/dashboard/')
 
+    @property
+    def password_hasher(self):
+        """Name of the hasher new passwords for this account should use"""
+        if self.role == self.UserRole.STUDENT and settings.FAST_STUDENT_PASSWORD_HASHER:
+            return 'pbkdf2_sha256_student'
+        return 'default'
+
+    def set_password(self, raw_password):
+        self.password = make_password(raw_password, hasher=self.password_hasher)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """
+        Check the password against this account's preferred hasher so that
+        student hashes are migrated to or from the fast hasher on login
+        whenever FAST_STUDENT_PASSWORD_HASHER is toggled.
+        """
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes.
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return check_password(raw_password, self.password, setter, preferred=self.password_hasher)
+
     def save(self, *args, **kwargs):
         # Ensure only superusers have the SUPER_ADMIN role, and vice versa
         if self.is_superuser:
@@ -152,11 +180,16 @@ class UserActivity(models.Model):
     details = models.JSONField(default=dict)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set explicitly by the buffered writer so rows keep the time of the event, not of the flush
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         verbose_name_plural = 'User Activities'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.action} - {self.created_at}"
@@ -1,7 +1,13 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from core import session_state
+from core.dashboard import get_tile
 from .models import User, Teacher, Principal, Accountant, UserPermission, UserActivity, Parent
-from schools.models import School, Subscription
+from schools.models import School, SchoolStats, Subscription
 from core.models import SystemSettings
 from django.utils import timezone
 from users.models import User
@@ -299,26 +305,12 @@ class LoginSerializer(serializers.Serializer):
             if not user.is_active:
                 raise serializers.ValidationError('User account is disabled.')
             # Subscription lockout logic
-            if hasattr(user, 'role') and user.role != user.UserRole.SUPER_ADMIN and hasattr(user, 'school') and user.school:
-                today = timezone.now().date()
-                subscription = user.school.current_subscription
-                if subscription:
-                    status = getattr(subscription, 'computed_status', subscription.status)
-                    if status == Subscription.Status.CANCELLED:
-                        raise serializers.ValidationError('Your subscription has been cancelled. Please contact your administrator to renew.')
-                    elif status == Subscription.Status.EXPIRED:
-                        raise serializers.ValidationError('Your subscription expired more than 7 days ago. Please contact your administrator to renew.')
-                    # PENDING: allow login (read-only enforced by middleware)
-                    # ACTIVE: allow login
-                else:
-                    # No active subscription, check for most recent expired or cancelled subscription
-                    expired_sub = user.school.subscriptions.filter(status__in=[Subscription.Status.EXPIRED, Subscription.Status.CANCELLED]).order_by('-end_date').first()
-                    if expired_sub:
-                        status = getattr(expired_sub, 'computed_status', expired_sub.status)
-                        if status == Subscription.Status.CANCELLED:
-                            raise serializers.ValidationError('Your subscription has been cancelled. Please contact your administrator to renew.')
-                        elif status == Subscription.Status.EXPIRED:
-                            raise serializers.ValidationError('Your subscription expired more than 7 days ago. Please contact your administrator to renew.')
+            if hasattr(user, 'role') and user.role != user.UserRole.SUPER_ADMIN and user.school_id:
+                gate = Subscription.login_gate(user.school_id)
+                if gate == Subscription.Status.CANCELLED:
+                    raise serializers.ValidationError('Your subscription has been cancelled. Please contact your administrator to renew.')
+                elif gate == Subscription.Status.EXPIRED:
+                    raise serializers.ValidationError('Your subscription expired more than 7 days ago. Please contact your administrator to renew.')
             attrs['user'] = user
         else:
             raise serializers.ValidationError('Must include username and password.')
@@ -326,6 +318,19 @@ class LoginSerializer(serializers.Serializer):
         return attrs
 
 
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """Refresh serializer that rejects revoked refresh tokens and revokes rotated ones"""
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if session_state.is_token_revoked(refresh):
+            raise InvalidToken('Token has been revoked.')
+        data = super().validate(attrs)
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            session_state.revoke_token(refresh)
+        return data
+
+
 class DashboardSerializer(serializers.Serializer):
     """Dashboard data serializer for different user roles"""
     user = UserSerializer(source='*')
@@ -341,13 +346,14 @@ class DashboardSerializer(serializers.Serializer):
         if obj.role == User.UserRole.TEACHER:
             try:
                 teacher = obj.teacher_profile
+                stats = get_tile('teacher_stats', obj)
                 return {
                     'teacher_id': teacher.id,
                     'employee_id': teacher.employee_id,
                     'department': teacher.department,
-                    'subjects_count': teacher.subjects.count(),
-                    'classes_teaching': teacher.subjects.count(),
-                    'students_count': sum([cs.class_obj.students.count() for cs in teacher.subjects.all()])
+                    'subjects_count': stats['subjects_count'],
+                    'classes_teaching': stats['classes_count'],
+                    'students_count': stats['students_count']
                 }
             except Teacher.DoesNotExist:
                 return {}
@@ -415,76 +421,19 @@ class DashboardSerializer(serializers.Serializer):
     def get_quick_stats(self, obj):
         """Get quick stats based on user role"""
         if obj.role == User.UserRole.TEACHER:
+            stats = get_tile('teacher_stats', obj)
             return {
-                'students_count': self.get_teacher_students_count(obj),
-                'classes_count': self.get_teacher_classes_count(obj),
-                'pending_assignments': self.get_pending_assignments_count(obj)
+                'students_count': stats['students_count'],
+                'classes_count': stats['classes_count'],
+                'pending_assignments': stats['pending_assignments']
             }
         elif obj.role == User.UserRole.STUDENT:
-            return {
-                'attendance_percentage': self.get_student_attendance_percentage(obj),
-                'pending_fees': self.get_student_pending_fees(obj),
-                'upcoming_exams': self.get_upcoming_exams_count(obj)
-            }
-        elif obj.role == User.UserRole.ACCOUNTANT:
-            return {
-                'pending_payments': self.get_pending_payments_count(),
-                'today_collections': self.get_today_collections()
-            }
+            return get_tile('student_stats', obj)
+        elif obj.role == User.UserRole.ACCOUNTANT and obj.school_id:
+            return get_tile('accountant_stats', obj)
         
         return {}
     
-    def get_teacher_students_count(self, user):
-        """Get count of students taught by teacher"""
-        try:
-            teacher = user.teacher_profile
-            return sum([cs.class_obj.students.count() for cs in teacher.subjects.all()])
-        except Teacher.DoesNotExist:
-            return 0
-    
-    def get_teacher_classes_count(self, user):
-        """Get count of classes taught by teacher"""
-        try:
-            teacher = user.teacher_profile
-            return teacher.subjects.count()
-        except Teacher.DoesNotExist:
-            return 0
-    
-    def get_pending_assignments_count(self, user):
-        """Get count of pending assignments for teacher"""
-        # Mock data - in real app, this would query assignment submissions
-        return 5
-    
-    def get_student_attendance_percentage(self, user):
-        """Get student attendance percentage"""
-        # Mock data - in real app, this would calculate from attendance records
-        return 92.5
-    
-    def get_student_pending_fees(self, user):
-        """Get student pending fees count"""
-        # Mock data - in real app, this would query fee records
-        return 2
-    
-    def get_upcoming_exams_count(self, user):
-        """Get count of upcoming exams for student"""
-        # Mock data - in real app, this would query exam schedules
-        return 3
-    
-    def get_unread_notifications_count(self, user):
-        """Get count of unread notifications"""
-        from notifications.models import Notification
-        return Notification.objects.filter(recipient=user, is_read=False).count()
-    
-    def get_pending_payments_count(self):
-        """Get count of pending payments for accountant"""
-        # Mock data - in real app, this would query payment records
-        return 15
-    
-    def get_today_collections(self):
-        """Get today's collections for accountant"""
-        # Mock data - in real app, this would query payment records
-        return 25000
-    
     def get_subscription_alert(self, obj):
         # Only for school admins
         if obj.role == User.UserRole.SCHOOL_ADMIN and obj.school:
@@ -514,22 +463,12 @@ class DashboardSerializer(serializers.Serializer):
     def get_school_stats(self, obj):
         """Return school-specific stats for school admins"""
         if obj.role == User.UserRole.SCHOOL_ADMIN and obj.school:
-            from students.models import Student
-            from classes.models import Class
-            school = obj.school
-            # Total students in this school
-            total_students = Student.objects.filter(school=school).count()
-            # Classes: get all classes that have at least one student in this school
-            class_ids = Student.objects.filter(school=school, current_class__isnull=False).values_list('current_class', flat=True).distinct()
-            total_classes = class_ids.count()
-            # Total teachers in this school
-            total_teachers = User.objects.filter(role=User.UserRole.TEACHER, school=school).count()
-            # You can add more stats as needed (e.g., recent enrollments)
+            stats = SchoolStats.for_school(obj.school_id)
             return {
-                'school_name': school.name,
-                'total_students': total_students,
-                'total_classes': total_classes,
-                'total_teachers': total_teachers,
+                'school_name': obj.school.name,
+                'total_students': stats.total_students,
+                'total_classes': stats.total_classes,
+                'total_teachers': stats.total_teachers,
             }
         return None
 
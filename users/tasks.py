@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from core.models import SystemSettings
+from .models import UserActivity
+
+
+@shared_task
+def purge_user_activity(batch_size=10000):
+    """Delete UserActivity rows older than the system data retention period"""
+    days = SystemSettings.get_data_retention_days()
+    cutoff = timezone.now() - timedelta(days=days)
+    old_rows = UserActivity.objects.filter(created_at__lt=cutoff).order_by('created_at')
+    deleted = 0
+    # Delete in batches along the created_at index so each transaction stays small
+    while True:
+        ids = list(old_rows.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += UserActivity.objects.filter(id__in=ids).delete()[0]
+    return f'Deleted {deleted} user activity rows older than {days} days.'
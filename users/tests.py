@@ -1,3 +1,269 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from classes.models import Attendance, Class, ClassSubject, Subject
+from classes.relations import classes_of_teacher
+from core.dashboard import get_tile
+from core.models import SystemSettings
+from core.scope import UserScope
+from schools.models import School, Subscription, SubscriptionPlan
+from students.models import Student
+from .activity import ActivityWriter, log_activity
+from .models import User, UserActivity, Teacher
+from .tasks import purge_user_activity
+from .views import TeacherViewSet, UserViewSet
+
+
+class TeacherStudentScopeQueryTests(TestCase):
+    """Teacher/student visibility resolves in a constant number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Scope School', code='SCP', address='1 Main St', phone='555-0100', email='office@scope.test',
+            principal_name='Pat Principal', principal_email='principal@scope.test', principal_phone='555-0101',
+        )
+        cls.teacher_user = User.objects.create_user('scope-teacher', role=User.UserRole.TEACHER, school=cls.school)
+        cls.teacher = Teacher.objects.create(
+            user=cls.teacher_user, employee_id='SCP-T1', department='Science', qualification='MSc',
+        )
+        other_teacher = Teacher.objects.create(
+            user=User.objects.create_user('scope-other', role=User.UserRole.TEACHER, school=cls.school),
+            employee_id='SCP-T2', department='Arts', qualification='BA',
+        )
+        cls.students = []
+        for index in range(3):
+            class_obj = Class.objects.create(school=cls.school, name=f'Grade {index + 1}', academic_year='2024-2025')
+            for code in ('MTH', 'ART'):
+                subject, _ = Subject.objects.get_or_create(code=f'SCP-{code}', defaults={'name': code})
+                ClassSubject.objects.create(
+                    class_obj=class_obj, subject=subject,
+                    teacher=cls.teacher if code == 'MTH' and index < 2 else other_teacher,
+                )
+            for number in range(4):
+                user = User.objects.create_user(
+                    f'scope-s{index}{number}', role=User.UserRole.STUDENT, school=cls.school,
+                )
+                cls.students.append(Student.objects.create(
+                    user=user, school=cls.school, current_class=class_obj, date_of_birth=date(2010, 1, 1),
+                    gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+                ))
+
+    def get_queryset(self, view_class, user):
+        view = view_class()
+        view.request = SimpleNamespace(user=user, query_params={})
+        return view.get_queryset()
+
+    def test_teacher_sees_students_of_taught_classes_in_one_query(self):
+        with self.assertNumQueries(1):
+            usernames = sorted(u.username for u in self.get_queryset(UserViewSet, self.teacher_user))
+        self.assertEqual(usernames, sorted(s.user.username for s in self.students[:8]))
+
+    def test_student_sees_class_teachers_in_one_query(self):
+        student_user = self.students[0].user
+        with self.assertNumQueries(1):
+            usernames = sorted(u.username for u in self.get_queryset(UserViewSet, student_user))
+        self.assertEqual(usernames, ['scope-other', 'scope-teacher'])
+
+    def test_teacher_students_and_classes_actions(self):
+        view = TeacherViewSet()
+        view.get_object = lambda: self.teacher
+        request = SimpleNamespace(user=self.teacher_user)
+        response = view.classes(request)
+        self.assertEqual(sorted(c['name'] for c in response.data), ['Grade 1', 'Grade 2'])
+        students = view.students(request).data
+        self.assertEqual(len(students), 8)
+
+    def test_head_teacher_classes_count_everywhere(self):
+        headed = self.students[8].current_class
+        self.teacher.head_teacher_classes.add(headed)
+        self.assertEqual(
+            sorted(UserScope.for_user(self.teacher_user).class_ids),
+            sorted(classes_of_teacher(self.teacher_user.id).values_list('id', flat=True)),
+        )
+        self.assertEqual(self.get_queryset(UserViewSet, self.teacher_user).count(), 12)
+        view = TeacherViewSet()
+        view.get_object = lambda: self.teacher
+        request = SimpleNamespace(user=self.teacher_user)
+        self.assertEqual(sorted(c['name'] for c in view.classes(request).data), ['Grade 1', 'Grade 2', 'Grade 3'])
+        self.assertEqual(len(view.students(request).data), 12)
+        usernames = sorted(u.username for u in self.get_queryset(UserViewSet, self.students[8].user))
+        self.assertEqual(usernames, ['scope-other', 'scope-teacher'])
+
+
+class DashboardTileTests(TestCase):
+    """Dashboard tiles are computed from real data, cached, and refreshed on writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Tile School', code='TIL', address='1 Main St', phone='555-0100', email='office@tile.test',
+            principal_name='Pat Principal', principal_email='principal@tile.test', principal_phone='555-0101',
+        )
+        cls.class_obj = Class.objects.create(school=cls.school, name='Grade 1', academic_year='2024-2025')
+        cls.student = Student.objects.create(
+            user=User.objects.create_user('tile-student', role=User.UserRole.STUDENT, school=cls.school),
+            school=cls.school, current_class=cls.class_obj, date_of_birth=date(2010, 1, 1),
+            gender='F', address='-', emergency_contact='555', emergency_contact_name='Guardian', year='1',
+        )
+        for day, status in [(1, 'present'), (2, 'absent'), (3, 'late'), (4, 'present')]:
+            Attendance.objects.create(
+                student=cls.student, class_obj=cls.class_obj, date=date(2024, 9, day), status=status,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_student_stats_are_cached_until_attendance_changes(self):
+        user = self.student.user
+        self.assertEqual(get_tile('student_stats', user)['attendance_percentage'], 75.0)
+        with self.assertNumQueries(0):
+            get_tile('student_stats', user)
+
+        Attendance.objects.create(student=self.student, class_obj=self.class_obj, date=date(2024, 9, 5), status='absent')
+        self.assertEqual(get_tile('student_stats', user)['attendance_percentage'], 60.0)
+
+    def test_system_totals_use_real_counts(self):
+        admin = User.objects.create_user('tile-admin', role=User.UserRole.SUPER_ADMIN)
+        totals = get_tile('system_totals', admin)
+        self.assertEqual(totals['totalSchools'], 1)
+        self.assertEqual(totals['totalStudents'], 1)
+        self.assertEqual(totals['totalUsers'], 2)
+        self.assertEqual(totals['growthRate'], 100.0)
+
+
+@override_settings(USER_ACTIVITY_BUFFERED=False)
+class TokenRevocationTests(TestCase):
+    """Logged-out and rotated JWTs are refused until they expire"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('jwt-admin', password='secret-pass', role=User.UserRole.SUPER_ADMIN)
+
+    def setUp(self):
+        cache.clear()
+        response = self.client.post('/api/v1/auth/login/', {'username': 'jwt-admin', 'password': 'secret-pass'})
+        self.access, self.refresh = response.data['access_token'], response.data['refresh_token']
+
+    def get_profile(self, access):
+        return self.client.get('/api/v1/auth/users/profile/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def refresh_token(self, refresh):
+        return self.client.post('/api/v1/auth/token/refresh/', {'refresh': refresh})
+
+    def test_valid_token_authenticates(self):
+        response = self.get_profile(self.access)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'jwt-admin')
+        self.assertEqual(self.refresh_token(self.refresh).status_code, 200)
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        response = self.client.post(
+            '/api/v1/auth/logout/', {'refresh': self.refresh}, HTTP_AUTHORIZATION=f'Bearer {self.access}',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_profile(self.access).status_code, 401)
+        self.assertEqual(self.refresh_token(self.refresh).status_code, 401)
+
+    def test_rotated_refresh_token_cannot_be_reused(self):
+        # simplejwt modules hold on to api_settings, so override_settings(SIMPLE_JWT=...) wouldn't reach them
+        with mock.patch.object(api_settings, 'ROTATE_REFRESH_TOKENS', True):
+            response = self.refresh_token(self.refresh)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.refresh_token(self.refresh).status_code, 401)
+            self.assertEqual(self.refresh_token(response.data['refresh']).status_code, 200)
+        self.assertEqual(self.get_profile(response.data['access']).status_code, 200)
+
+
+class LoginPathTests(TestCase):
+    """Login writes activity in batches, caches the subscription gate and rehashes student passwords"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(
+            name='Login School', code='LGN', address='1 Main St', phone='555-0100', email='office@lgn.test',
+            principal_name='Pat Principal', principal_email='principal@lgn.test', principal_phone='555-0101',
+        )
+        cls.subscription = Subscription.objects.create(
+            school=cls.school, plan=SubscriptionPlan.objects.create(name='basic'), status=Subscription.Status.ACTIVE,
+            start_date=date(2024, 1, 1), end_date=date(2099, 1, 1), amount=0,
+        )
+        cls.user = User.objects.create_user('login-student', password='secret-pass', role=User.UserRole.STUDENT,
+                                            school=cls.school)
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self):
+        return self.client.post('/api/v1/auth/login/', {'username': 'login-student', 'password': 'secret-pass'})
+
+    def test_buffered_activity_is_flushed_as_one_batch(self):
+        buffer = ActivityWriter(batch_size=100, flush_interval=60)
+        with override_settings(USER_ACTIVITY_BUFFERED=True), mock.patch('users.activity.writer', buffer), \
+                mock.patch.object(buffer, '_ensure_thread'):
+            for _ in range(3):
+                self.assertEqual(self.login().status_code, 200)
+            log_activity(self.user, 'Viewed timetable')
+        self.assertFalse(UserActivity.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(UserActivity.objects.filter(user=self.user, action='User logged in').count(), 3)
+        self.assertEqual(buffer.flush(), 0)
+
+    @override_settings(USER_ACTIVITY_BUFFERED=False)
+    def test_login_gate_is_cleared_when_the_subscription_changes(self):
+        self.assertEqual(self.login().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertIsNone(Subscription.login_gate(self.school.id))
+
+        self.subscription.status = Subscription.Status.CANCELLED
+        self.subscription.save()
+        self.assertIsNone(cache.get(Subscription.login_gate_cache_key(self.school.id)))
+        response = self.login()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cancelled', str(response.data))
+
+        self.subscription.delete()
+        self.assertIsNone(Subscription.login_gate(self.school.id))
+
+    @override_settings(USER_ACTIVITY_BUFFERED=False)
+    def test_student_password_moves_to_the_fast_hasher_on_login(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        with override_settings(FAST_STUDENT_PASSWORD_HASHER=True):
+            self.assertEqual(self.login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('pbkdf2_sha256_student$'))
+            self.assertTrue(self.user.check_password('secret-pass'))
+            self.assertFalse(self.user.check_password('wrong-pass'))
+            self.assertEqual(self.login().status_code, 200)
+
+        # Turning the setting off moves the account back on its next login
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+
+class UserActivityRetentionTests(TestCase):
+    """purge_user_activity deletes rows past the retention period in batches"""
+
+    def test_old_rows_are_purged(self):
+        user = User.objects.create_user('retention-user')
+        settings_row = SystemSettings.get_solo()
+        settings_row.data_retention = 30
+        settings_row.save()
+        now = timezone.now()
+        UserActivity.objects.bulk_create([
+            UserActivity(user=user, action=f'Action {days}', created_at=now - timedelta(days=days))
+            for days in (1, 29, 31, 60, 400)
+        ])
+        self.assertEqual(purge_user_activity(batch_size=2), 'Deleted 3 user activity rows older than 30 days.')
+        self.assertEqual(
+            sorted(UserActivity.objects.values_list('action', flat=True)), ['Action 1', 'Action 29'],
+        )
+        self.assertEqual(purge_user_activity(), 'Deleted 0 user activity rows older than 30 days.')
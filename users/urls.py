@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    LoginView, DashboardView, UserViewSet, TeacherViewSet,
+    LoginView, LogoutView, TokenRefreshView, DashboardView, UserViewSet, TeacherViewSet,
     PrincipalViewSet, AccountantViewSet, ParentViewSet, SecretaryViewSet
 )
 
@@ -16,6 +16,8 @@ router.register(r'secretaries', SecretaryViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
     
     # Role-specific dashboard endpoints
@@ -4,14 +4,22 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView as BaseTokenRefreshView
 from django.contrib.auth import authenticate
 from django.db.models import Q, Count, Sum
 from django.utils import timezone
 from .models import User, Teacher, Parent, Principal, Accountant, UserPermission, UserActivity
+from .activity import log_activity
 from .serializers import (
-    UserSerializer, TeacherSerializer, ParentSerializer, PrincipalSerializer, AccountantSerializer, LoginSerializer, DashboardSerializer
+    UserSerializer, TeacherSerializer, ParentSerializer, PrincipalSerializer, AccountantSerializer, LoginSerializer, DashboardSerializer,
+    TokenRefreshSerializer
 )
+from core import session_state
+from core.dashboard import get_tile
+from classes.relations import classes_of_teacher, teachers_of_student
+from schools.models import SchoolStats
 from django.core.mail import send_mail
 from rest_framework.exceptions import ValidationError
 
@@ -26,13 +34,8 @@ class LoginView(APIView):
             user = serializer.validated_data['user']
             refresh = RefreshToken.for_user(user)
             
-            # Log user activity
-            UserActivity.objects.create(
-                user=user,
-                action='User logged in',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT', '')
-            )
+            # Log user activity (buffered, written in batches)
+            log_activity(user, 'User logged in', request)
             
             return Response({
                 'access_token': str(refresh.access_token),
@@ -43,6 +46,27 @@ class LoginView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class LogoutView(APIView):
+    """Revoke the current access token and, if given, the refresh token"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        session_state.revoke_token(request.auth)
+        refresh = request.data.get('refresh') or request.data.get('refresh_token')
+        if refresh:
+            try:
+                session_state.revoke_token(RefreshToken(refresh))
+            except TokenError:
+                pass  # Already expired or invalid, nothing to revoke
+        log_activity(request.user, 'User logged out', request)
+        return Response({'detail': 'Successfully logged out.'})
+
+
+class TokenRefreshView(BaseTokenRefreshView):
+    """Token refresh that honours revoked refresh tokens"""
+    serializer_class = TokenRefreshSerializer
+
+
 class DashboardView(APIView):
     """Role-based dashboard view"""
     permission_classes = [permissions.IsAuthenticated]
@@ -53,47 +77,10 @@ class DashboardView(APIView):
         
         if user.role == User.UserRole.SUPER_ADMIN:
             # Super Admin gets system-wide statistics
-            from schools.models import School, Subscription
-            from classes.models import Class
-            
-            # Get system-wide stats
-            total_schools = School.objects.count()
-            total_users = User.objects.count()
-            total_students = User.objects.filter(role=User.UserRole.STUDENT).count()
-            total_teachers = User.objects.filter(role=User.UserRole.TEACHER).count()
-            total_classes = Class.objects.count()
-            active_users = User.objects.filter(is_active=True).count()
-            
-            # Get real subscription data
-            active_subscriptions = Subscription.objects.filter(status='active').count()
-            total_revenue = Subscription.objects.filter(status='active').aggregate(
-                total=Sum('amount')
-            )['total'] or 0
-            
-            # Calculate growth rate (mock for now - could be based on historical data)
-            growth_rate = 15.5
-            
-            # Get recent activities
-            recent_activities = UserActivity.objects.select_related('user').order_by('-created_at')[:10]
-            activities_data = [{
-                'id': activity.id,
-                'action': activity.action,
-                'user': activity.user.get_full_name() or activity.user.username,
-                'time': f"{activity.created_at.strftime('%H:%M')} ago",
-                'type': 'info',
-            } for activity in recent_activities]
-            
             dashboard_data = {
-                'totalSchools': total_schools,
-                'totalUsers': total_users,
-                'totalStudents': total_students,
-                'totalTeachers': total_teachers,
-                'totalClasses': total_classes,
-                'activeSubscriptions': active_subscriptions,
-                'revenue': float(total_revenue),
-                'growthRate': growth_rate,
+                **get_tile('system_totals', user),
                 'systemHealth': 'excellent',
-                'recentActivities': activities_data,
+                'recentActivities': get_tile('recent_activities', user),
             }
             
             return Response(dashboard_data)
@@ -129,30 +116,19 @@ class UserViewSet(viewsets.ModelViewSet):
                 role__in=[User.UserRole.TEACHER, User.UserRole.STUDENT, User.UserRole.PARENT]
             )
         
-        # Teachers can see their students
+        # Teachers can see the students of the classes they teach or head
         elif user.role == User.UserRole.TEACHER:
-            try:
-                teacher = user.teacher_profile
-                student_ids = []
-                for subject in teacher.subjects.all():
-                    student_ids.extend(subject.class_obj.students.values_list('user_id', flat=True))
-                return User.objects.filter(id__in=student_ids, role=User.UserRole.STUDENT)
-            except Teacher.DoesNotExist:
-                return User.objects.none()
+            return User.objects.filter(
+                role=User.UserRole.STUDENT,
+                student_profile__current_class_id__in=classes_of_teacher(user.id),
+            )
         
-        # Students can see their teachers
+        # Students can see the teachers of their class
         elif user.role == User.UserRole.STUDENT:
-            try:
-                from students.models import Student
-                student = user.student_profile
-                if student.current_class:
-                    teacher_ids = []
-                    for subject in student.current_class.subjects.all():
-                        if subject.teacher:
-                            teacher_ids.append(subject.teacher.user_id)
-                    return User.objects.filter(id__in=teacher_ids, role=User.UserRole.TEACHER)
-            except Student.DoesNotExist:
-                pass
+            return User.objects.filter(
+                role=User.UserRole.TEACHER,
+                id__in=teachers_of_student(user.id),
+            )
         
         return User.objects.none()
     
@@ -298,27 +274,26 @@ class TeacherViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def students(self, request, pk=None):
-        """Get students taught by this teacher"""
+        """Get students of the classes this teacher teaches or heads"""
         teacher = self.get_object()
         from students.models import Student
         
-        students = Student.objects.filter(
-            current_class__subjects__teacher=teacher
-        ).distinct()
+        from students.serializers import StudentListSerializer, with_serializer_relations
+        students = with_serializer_relations(
+            Student.objects.filter(current_class_id__in=classes_of_teacher(teacher.user_id)),
+        )
         
-        from students.serializers import StudentListSerializer
         serializer = StudentListSerializer(students, many=True)
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def classes(self, request, pk=None):
-        """Get classes taught by this teacher"""
+        """Get classes this teacher teaches or heads"""
         teacher = self.get_object()
         from classes.serializers import ClassSerializer
         
-        classes = teacher.subjects.values_list('class_obj', flat=True).distinct()
         from classes.models import Class
-        class_objects = Class.objects.filter(id__in=classes)
+        class_objects = Class.objects.with_counts().filter(id__in=classes_of_teacher(teacher.user_id))
         
         serializer = ClassSerializer(class_objects, many=True)
         return Response(serializer.data)
@@ -382,21 +357,14 @@ class PrincipalViewSet(viewsets.ModelViewSet):
         
         try:
             principal = user.principal_profile
-            school = user.school
-            
-            # Get school statistics
-            total_students = User.objects.filter(school=school, role=User.UserRole.STUDENT).count()
-            total_teachers = User.objects.filter(school=school, role=User.UserRole.TEACHER).count()
-            total_classes = school.classes.count()
-            attendance_rate = self.get_attendance_rate(school)
-            fee_collection_rate = self.get_fee_collection_rate(school)
+            school_stats = SchoolStats.for_school(user.school_id)
             
             stats = {
-                'totalStudents': total_students,
-                'totalTeachers': total_teachers,
-                'totalClasses': total_classes,
-                'attendanceRate': attendance_rate,
-                'feeCollectionRate': fee_collection_rate,
+                'totalStudents': school_stats.total_students,
+                'totalTeachers': school_stats.total_teachers,
+                'totalClasses': school_stats.total_classes,
+                'attendanceRate': school_stats.attendance_rate,
+                'feeCollectionRate': school_stats.collection_rate,
             }
             
             return Response(stats)
@@ -405,16 +373,6 @@ class PrincipalViewSet(viewsets.ModelViewSet):
                 {'error': 'Principal profile not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
-    
-    def get_attendance_rate(self, school):
-        """Calculate attendance rate for the school"""
-        # Mock calculation - in real app, this would use attendance data
-        return 85.5
-    
-    def get_fee_collection_rate(self, school):
-        """Calculate fee collection rate for the school"""
-        # Mock calculation - in real app, this would use fee data
-        return 92.3
 
 
 class AccountantViewSet(viewsets.ModelViewSet):
@@ -447,20 +405,14 @@ class AccountantViewSet(viewsets.ModelViewSet):
         
         try:
             accountant = user.accountant_profile
-            school = user.school
-            
-            # Mock financial data - in real app, this would come from fee models
-            total_fees_collected = 125000
-            pending_fees = 15000
-            total_students = User.objects.filter(school=school, role=User.UserRole.STUDENT).count()
-            students_with_pending_fees = 25
+            school_stats = SchoolStats.for_school(user.school_id)
             
             summary = {
-                'totalFeesCollected': total_fees_collected,
-                'pendingFees': pending_fees,
-                'totalStudents': total_students,
-                'studentsWithPendingFees': students_with_pending_fees,
-                'collectionRate': ((total_fees_collected - pending_fees) / total_fees_collected) * 100 if total_fees_collected > 0 else 0
+                'totalFeesCollected': float(school_stats.fees_collected),
+                'pendingFees': float(school_stats.fees_pending),
+                'totalStudents': school_stats.total_students,
+                'studentsWithPendingFees': school_stats.students_with_pending_fees,
+                'collectionRate': school_stats.collection_rate
             }
             
             return Response(summary)